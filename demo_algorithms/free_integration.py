@@ -53,6 +53,8 @@ class FreeIntegration(object):
         else:
             raise ValueError('Initial states should be a 1D or 2D numpy array, \
                               but the dimension is %s.'% ini_pos_vel_att.ndim)
+        # runs are independent if they have the same inis, and can be run by workers
+        self.parallel_safe = self.set_of_inis == 1
         self.r0 = ini_pos_vel_att[0:3]
         self.v0 = ini_pos_vel_att[3:6]
         self.att0 = ini_pos_vel_att[6:9]
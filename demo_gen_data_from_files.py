@@ -19,7 +19,7 @@ D2R = math.pi/180
 motion_def_path = os.path.abspath('.//demo_motion_def_files//')
 fs = 100.0          # IMU sample frequency
 fs_gps = 10.0       # GPS sample frequency
-fs_mag = fs         # magnetometer sample frequency, not used for now
+fs_mag = fs         # magnetometer sample frequency
 
 def gen_data_first(data_dir):
     '''
@@ -492,6 +492,33 @@ def euler2dcm(angles, rot_seq='zyx'):
     else:
         return False
 
+def euler2dcm_batch(angles, rot_seq='zyx'):
+    """
+    Convert a series of Euler angles to direction cosine matrices.
+    This is the vectorized version of euler2dcm. Only the ZYX rotation sequence is supported.
+    Args:
+        angles: nx3 Euler angles, rad.
+        rot_seq: rotation sequence corresponding to the angles, only 'zyx' is supported.
+    Returns:
+        dcm: nx3x3 coordinate transformation matrices from n to b
+    """
+    if rot_seq.lower() != 'zyx':
+        raise ValueError('Unsupported rotation sequence: %s.'% rot_seq)
+    n = angles.shape[0]
+    dcm = np.zeros((n, 3, 3))
+    cangle = np.cos(angles)
+    sangle = np.sin(angles)
+    dcm[:, 0, 0] = cangle[:, 1]*cangle[:, 0]
+    dcm[:, 0, 1] = cangle[:, 1]*sangle[:, 0]
+    dcm[:, 0, 2] = -sangle[:, 1]
+    dcm[:, 1, 0] = sangle[:, 2]*sangle[:, 1]*cangle[:, 0] - cangle[:, 2]*sangle[:, 0]
+    dcm[:, 1, 1] = sangle[:, 2]*sangle[:, 1]*sangle[:, 0] + cangle[:, 2]*cangle[:, 0]
+    dcm[:, 1, 2] = cangle[:, 1]*sangle[:, 2]
+    dcm[:, 2, 0] = sangle[:, 1]*cangle[:, 2]*cangle[:, 0] + sangle[:, 0]*sangle[:, 2]
+    dcm[:, 2, 1] = sangle[:, 1]*cangle[:, 2]*sangle[:, 0] - cangle[:, 0]*sangle[:, 2]
+    dcm[:, 2, 2] = cangle[:, 1]*cangle[:, 2]
+    return dcm
+
 def dcm2euler(dcm, rot_seq='zyx'):
     """
     Convert direction cosine matrix to Euler angles.
@@ -768,6 +795,21 @@ def cross3(a, b):
                   a[0]*b[1] - a[1]*b[0]])
     return c
 
+def cross3_batch(a, b):
+    '''
+    cross product of a series of arrays of size 3.
+    Args:
+        a: numpy array of size (n,3).
+        b: numpy array of size (n,3).
+    Returns:
+        c: c = cross(a,b), of size (n,3).
+    '''
+    c = np.empty(a.shape)
+    c[:, 0] = a[:, 1]*b[:, 2] - a[:, 2]*b[:, 1]
+    c[:, 1] = a[:, 2]*b[:, 0] - a[:, 0]*b[:, 2]
+    c[:, 2] = a[:, 0]*b[:, 1] - a[:, 1]*b[:, 0]
+    return c
+
 def euler_angle_range_three_axis(angles):
     '''
     Limit Euler angle range.
@@ -795,6 +837,46 @@ def euler_angle_range_three_axis(angles):
     a3 = angle_range_pi(a3)
     return np.array([a1, a2, a3])
 
+def euler_angle_range_three_axis_batch(angles):
+    '''
+    Limit Euler angle range of a series of Euler angles.
+    This is the vectorized version of euler_angle_range_three_axis.
+    Args:
+        angles: numpy array of (n,3)
+    Returns:
+        numpy array of (n,3), angle ranges are [-pi, pi], [-pi/2, pi/2] and [-pi, pi]
+    '''
+    half_pi = 0.5 * math.pi
+    # convert the second angle in range [-pi, pi]
+    a1 = angles[:, 0].copy()
+    a2 = angle_range_pi_batch(angles[:, 1])
+    a3 = angles[:, 2].copy()
+    # the second angle is not within [-pi/2, pi/2]?
+    idx = a2 > half_pi
+    a2[idx] = math.pi - a2[idx]
+    a1[idx] = a1[idx] + math.pi
+    a3[idx] = a3[idx] + math.pi
+    idx = a2 < -half_pi
+    a2[idx] = -math.pi - a2[idx]
+    a1[idx] = a1[idx] + math.pi
+    a3[idx] = a3[idx] + math.pi
+    return np.column_stack((angle_range_pi_batch(a1), a2, angle_range_pi_batch(a3)))
+
+def angle_range_pi_batch(x):
+    '''
+    Limit angle range within [-pi, pi]. This is the vectorized version of angle_range_pi.
+    Args：
+        x: numpy array, rad
+    Return:
+        equivalent angle of x, [-pi, pi], rad
+    '''
+    # [0, 2pi]
+    x = np.mod(x, TWO_PI)
+    # [-pi, pi]
+    idx = x > math.pi
+    x[idx] = x[idx] - TWO_PI
+    return x
+
 def angle_range_pi(x):
     '''
     Limit angle range within [-pi, pi]
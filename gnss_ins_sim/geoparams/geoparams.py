@@ -52,6 +52,35 @@ def geo_param(pos):
     g = g1 * (1.0 - (2.0/Re) * (1.0 + FLATTENING + m - 2.0*FLATTENING*sl_sqr)*h + 3.0*h*h/Re/Re)
     return rm, rn, g, sl, cl, W_IE
 
+def geo_param_batch(pos):
+    """
+    Calculate local radius and gravity given a series of [Lat, Lon, Alt].
+    This is the vectorized version of geo_param.
+    Args:
+        pos: [Lat, Lon, Alt], rad, m, numpy array of size (n,3)
+    Returns:
+        rm: meridian radius, m, numpy array of size (n,)
+        rn: normal radius, m, numpy array of size (n,)
+        g: gravity, m/s/s, numpy array of size (n,)
+        sl: sin(Lat), numpy array of size (n,)
+        cl: cos(lat), numpy array of size (n,)
+        w_ie: Earth's rotation rate w.r.t the inertial frame, rad/s
+    """
+    # some constants
+    normal_gravity = 9.7803253359
+    k = 0.00193185265241
+    m = 0.00344978650684
+    # calc
+    sl = np.sin(pos[:, 0])
+    cl = np.cos(pos[:, 0])
+    sl_sqr = sl * sl
+    h = pos[:, 2]
+    rm = (Re*(1 - E_SQR)) / (np.sqrt(1.0 - E_SQR*sl_sqr) * (1.0 - E_SQR*sl_sqr))
+    rn = Re / (np.sqrt(1.0 - E_SQR*sl_sqr))
+    g1 = normal_gravity * (1 + k*sl_sqr) / np.sqrt(1.0 - E_SQR*sl_sqr)
+    g = g1 * (1.0 - (2.0/Re) * (1.0 + FLATTENING + m - 2.0*FLATTENING*sl_sqr)*h + 3.0*h*h/Re/Re)
+    return rm, rn, g, sl, cl, W_IE
+
 def earth_radius(lat):
     """
     Calculate Earth meridian radius and normal radius.
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# Filename: gnss_error.py
+
+"""
+Time-correlated GNSS receiver errors of many simulation runs.
+Position and velocity errors are the sum of white noise, first-order Gauss-Markov errors and
+multipath-like jumps, generated for all runs at once. GNSS outages are given as time windows
+and applied as a visibility mask. All functions are pure: error parameters are never
+modified, so the same error dict can be used for any number of runs.
+Created on 2026-10-16
+@author: dongxiaoguang
+"""
+
+import math
+import numpy as np
+from . import pathgen
+from ..geoparams import geoparams
+
+# global
+VERSION = '1.0'
+
+def gnss_gen_batch(ref_gps, gps_err, runs, dt, gps_type=0, block_size=pathgen.BATCH_SIZE,
+                   rng=None, components=None):
+    """
+    Generate GNSS data of many simulation runs.
+    Args:
+        ref_gps: nx6 true GPS data, see pathgen.gps_gen.
+        gps_err: GPS receiver parameters. It is not modified.
+            'stdp': RMS of white position error, [m, m, m].
+            'stdv': RMS of white velocity error, [m/s, m/s, m/s].
+            Optional:
+            'stdp_gm': RMS of Gauss-Markov position error, [m, m, m].
+            'corr_p': correlation time of Gauss-Markov position error, [s, s, s]. Inf for
+                a random constant error. Default is inf.
+            'stdv_gm': RMS of Gauss-Markov velocity error, [m/s, m/s, m/s].
+            'corr_v': correlation time of Gauss-Markov velocity error, [s, s, s].
+            'mp_rate': mean number of multipath jumps per second.
+            'mp_dur': mean duration of a multipath jump, s.
+            'mp_std': RMS of the position error of a multipath jump, [m, m, m].
+            'outages': see outage_mask. Outages do not change the measurements.
+        runs: number of simulation runs.
+        dt: GPS sample period, s.
+        gps_type: GPS data type, see pathgen.gps_gen.
+        block_size: max samples of each temporary array, see pathgen.acc_gen_batch.
+        rng: a list of numpy.random.Generator, one for each run, see pathgen.acc_gen_batch.
+            White noise of each run is drawn first, the same as pathgen.gps_gen_batch, so
+            that data are the same as pathgen.gps_gen_batch if there is no other error.
+        components: an empty dict to keep the errors separately, see
+            pathgen.acc_gen_batch. It is filled with (runs, n, 6) errors 'noise' (white),
+            'gm_pos', 'gm_vel' and 'multipath', if they are in gps_err.
+    Returns:
+        gps_mea: (runs, n, 6) ref_gps with error.
+    """
+    n = ref_gps.shape[0]
+    # position errors are generated in meters and converted to rad if GPS is in LLA
+    pos_scale = np.ones(3)
+    if gps_type == 0 and n > 0:
+        earth_param = geoparams.geo_param(ref_gps[0, 0:3])
+        pos_scale[0] = 1.0 / earth_param[0]
+        pos_scale[1] = 1.0 / earth_param[1] / earth_param[4]
+    std = np.hstack((np.array(gps_err['stdp'], dtype=float) * pos_scale,
+                     np.array(gps_err['stdv'], dtype=float)))
+    gps_mea = np.empty((runs, n, 6))
+    if components is not None:
+        names = ['noise']
+        if 'stdp_gm' in gps_err:
+            names.append('gm_pos')
+        if 'stdv_gm' in gps_err:
+            names.append('gm_vel')
+        if gps_err.get('mp_rate', 0) > 0:
+            names.append('multipath')
+        for i in names:
+            components[i] = np.zeros((runs, n, 6))
+    k = pathgen.runs_per_block(n, block_size)
+    for r0 in range(0, runs, k):
+        blk = gps_mea[r0:r0+k]
+        blk_rng = None if rng is None else rng[r0:r0+k]
+        parts = pathgen.component_views(components, r0, k)
+        noise = pathgen.randn_runs(blk_rng, blk.shape[0], 2, n, 3)
+        blk[:] = ref_gps[:, 0:6]
+        add_error(blk, 0, std[0:3] * noise[:, 0], parts, 'noise')
+        add_error(blk, 3, std[3:6] * noise[:, 1], parts, 'noise')
+        if 'stdp_gm' in gps_err:
+            add_error(blk, 0, pos_scale * gm_error(gps_err['stdp_gm'],
+                                                   gps_err.get('corr_p', math.inf),
+                                                   blk.shape[0], n, dt, blk_rng),
+                      parts, 'gm_pos')
+        if 'stdv_gm' in gps_err:
+            add_error(blk, 3, gm_error(gps_err['stdv_gm'], gps_err.get('corr_v', math.inf),
+                                       blk.shape[0], n, dt, blk_rng),
+                      parts, 'gm_vel')
+        if gps_err.get('mp_rate', 0) > 0:
+            add_error(blk, 0, pos_scale * multipath_error(gps_err['mp_rate'],
+                                                          gps_err['mp_dur'],
+                                                          gps_err['mp_std'],
+                                                          blk.shape[0], n, dt, blk_rng),
+                      parts, 'multipath')
+    return gps_mea
+
+def add_error(blk, col, x, parts, name):
+    """
+    Add the (k, n, 3) error x to the columns col to col+2 of blk, and keep it in parts[name]
+    if parts is not None.
+    """
+    blk[:, :, col:col+3] += x
+    if parts is not None:
+        parts[name][:, :, col:col+3] = x
+
+def gm_error(std, corr_time, runs, n, dt, rng=None):
+    """
+    Stationary first-order Gauss-Markov errors of many simulation runs.
+    Args:
+        std: 3x1 RMS of the error.
+        corr_time: 3x1 correlation time, s. Inf for a random constant, and 0 for white noise.
+        runs: number of simulation runs.
+        n: samples of each run.
+        dt: sample period, s.
+        rng: a list of numpy.random.Generator, one for each run, or None to use the global
+            random state of numpy.random.
+    Returns:
+        (runs, n, 3) errors.
+    """
+    std = np.array(std, dtype=float) * np.ones(3)
+    corr_time = np.array(corr_time, dtype=float) * np.ones(3)
+    # initial errors and driving noise of each run
+    noise = pathgen.randn_runs(rng, runs, n, 3)
+    err = std * noise
+    gm = corr_time > 0
+    if gm.any() and n > 1:
+        a = np.exp(-dt / corr_time[gm])
+        # the first sample is the stationary initial error, a single sample is only that
+        u = (std[gm] * np.sqrt(1.0 - a**2)) * noise[:, 1:, gm]
+        u = u.transpose((1, 0, 2)).reshape((n-1, -1))
+        x0 = err[:, 0, gm].reshape(-1)
+        x = pathgen.gauss_markov(np.tile(a, runs), u, x0)
+        err[:, :, gm] = x.reshape((n, runs, -1)).transpose((1, 0, 2))
+    return err
+
+def multipath_error(rate, duration, std, runs, n, dt, rng=None):
+    """
+    Multipath-like jumps of many simulation runs. A jump starts with probability
+    1-exp(-rate*dt) at each sample and holds a normal random offset until it ends with
+    probability 1-exp(-dt/duration) at each sample, or until the next jump starts.
+    Args:
+        rate: mean number of jumps per second.
+        duration: mean duration of a jump, s.
+        std: 3x1 RMS of the offset of a jump.
+        runs: number of simulation runs.
+        n: samples of each run.
+        dt: sample period, s.
+        rng: a list of numpy.random.Generator, one for each run, or None to use the global
+            random state of numpy.random.
+    Returns:
+        (runs, n, 3) errors.
+    """
+    p_start = 1.0 - math.exp(-rate * dt)
+    p_end = 1.0 - math.exp(-dt / duration)
+    # events and offsets of each run
+    u = pathgen.rand_runs(rng, runs, 2, n)
+    offset = np.array(std, dtype=float) * pathgen.randn_runs(rng, runs, n, 3)
+    start = u[:, 0] < p_start
+    end = (u[:, 1] < p_end) & ~start
+    offset[~start] = 0.0
+    # index of the latest event of each sample, -1 if there is none
+    last = np.where(start | end, np.arange(n), -1)
+    last = np.maximum.accumulate(last, axis=1)
+    err = np.take_along_axis(offset, np.maximum(last, 0)[:, :, np.newaxis], axis=1)
+    err[last < 0] = 0.0
+    return err
+
+def outage_mask(t, outages):
+    """
+    Visibility mask of GNSS outages.
+    Args:
+        t: GPS time, s.
+        outages: an array of size (k, 2). Each row is [start, end] of an outage, s.
+    Returns:
+        a bool array of the same size as t, False during outages.
+    """
+    t = np.asarray(t)
+    visible = np.ones(t.shape, dtype=bool)
+    for [start, end] in np.reshape(np.array(outages, dtype=float), (-1, 2)):
+        visible &= ~((t >= start) & (t < end))
+    return visible
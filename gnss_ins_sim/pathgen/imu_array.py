@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# Filename: imu_array.py
+
+"""
+Sensor data of IMU arrays, i.e., many IMU units mounted on one rigid body.
+True data of all units are derived from the reference accel and gyro data at the body
+origin, which are generated once by path_gen. Errors of all units and all simulation runs
+are then generated as one batch by the batched generators in pathgen.
+Created on 2026-10-16
+@author: dongxiaoguang
+"""
+
+import numpy as np
+from . import pathgen
+from ..attitude import attitude
+
+# global
+VERSION = '1.0'
+
+def array_ref(fs, ref_a, ref_w, lever_arms, rotations=None):
+    """
+    True accel and gyro data of the units of an IMU array. The specific force at a point r
+    away from the body origin is
+        f_r = f + dw/dt x r + w x (w x r),
+    where the angular acceleration dw/dt is the derivative of the reference gyro data.
+    Args:
+        fs: sample frequency, Hz.
+        ref_a: nx3 true acc data at the body origin in the body frame, m/s2.
+        ref_w: nx3 true gyro data in the body frame, rad/s.
+        lever_arms: (m, 3) positions of the m units in the body frame, m.
+        rotations: mounting rotations of the units. (m, 3, 3) DCMs from the body frame to
+            each unit frame, or (m, 3) Euler angles (ZYX, rad) that rotate the body frame to
+            each unit frame. None (default) if all units are aligned with the body frame.
+    Returns:
+        acc: (m, n, 3) true acc data of each unit in its own frame, m/s2.
+        gyro: (m, n, 3) true gyro data of each unit in its own frame, rad/s.
+    """
+    ref_a = np.asarray(ref_a, dtype=float)
+    ref_w = np.asarray(ref_w, dtype=float)
+    r = np.array(lever_arms, dtype=float).reshape((-1, 1, 3))
+    # angular acceleration by central differences, one-sided at both ends
+    if ref_w.shape[0] > 1:
+        w_dot = np.gradient(ref_w, 1.0/fs, axis=0)
+    else:
+        w_dot = np.zeros(ref_w.shape)
+    # Euler and centripetal terms of all units
+    acc = ref_a + np.cross(w_dot, r) + np.cross(ref_w, np.cross(ref_w, r))
+    gyro = np.broadcast_to(ref_w, acc.shape)
+    if rotations is not None:
+        c = mounting_dcm(rotations, r.shape[0])
+        acc = np.einsum('kij,knj->kni', c, acc)
+        gyro = np.einsum('kij,knj->kni', c, gyro)
+    else:
+        gyro = np.array(gyro)
+    return acc, gyro
+
+def array_gen(fs, ref_a, ref_w, acc_err, gyro_err, lever_arms, rotations=None, runs=1,
+              vib_def=None, acc_rng=None, gyro_rng=None, acc_dist=None, gyro_dist=None,
+              block_size=pathgen.BATCH_SIZE):
+    """
+    Generate accel and gyro data of an IMU array for many simulation runs.
+    Args:
+        fs: sample frequency, Hz.
+        ref_a: nx3 true acc data at the body origin in the body frame, m/s2.
+        ref_w: nx3 true gyro data in the body frame, rad/s.
+        acc_err: accelerometer error parameters of all units, see pathgen.acc_gen.
+        gyro_err: gyroscope error parameters of all units, see pathgen.gyro_gen.
+        lever_arms: (m, 3) positions of the m units in the body frame, see array_ref.
+        rotations: mounting rotations of the units, see array_ref.
+        runs: number of simulation runs.
+        vib_def: Vibration model, see pathgen.acc_gen. Vibration of each unit is independent.
+        acc_rng: a list of runs*m numpy.random.Generator. The (i*m+j)-th one is for the
+            accel of the j-th unit in the i-th run, e.g.,
+            rng_streams.stream(seed, i, 'accel', j). None (default) to use the global random
+            state of numpy.random.
+        gyro_rng: a list of runs*m numpy.random.Generator for gyro, see acc_rng.
+        acc_dist: distributions of accel error parameters that vary from unit to unit and
+            from run to run, see pathgen.draw_error_params.
+        gyro_dist: distributions of gyro error parameters.
+        block_size: max samples of each temporary array, see pathgen.acc_gen_batch.
+    Returns:
+        acc: (runs, m, n, 3) measured acc data.
+        gyro: (runs, m, n, 3) measured gyro data.
+    """
+    ref_acc, ref_gyro = array_ref(fs, ref_a, ref_w, lever_arms, rotations)
+    m = ref_acc.shape[0]
+    n = ref_acc.shape[1]
+    # units of all runs are the runs of the batched generators
+    acc = pathgen.acc_gen_batch(fs, ref_acc, acc_err, runs*m, vib_def, block_size,
+                                acc_rng, err_dist=acc_dist)
+    gyro = pathgen.gyro_gen_batch(fs, ref_gyro, gyro_err, runs*m, block_size, gyro_rng,
+                                  err_dist=gyro_dist)
+    return acc.reshape((runs, m, n, 3)), gyro.reshape((runs, m, n, 3))
+
+def mounting_dcm(rotations, m):
+    """
+    DCMs from the body frame to the frames of m units.
+    Args:
+        rotations: (m, 3, 3) DCMs or (m, 3) Euler angles (ZYX, rad), see array_ref.
+        m: number of units.
+    Returns:
+        (m, 3, 3) DCMs.
+    """
+    rotations = np.array(rotations, dtype=float)
+    if rotations.shape == (m, 3, 3):
+        return rotations
+    if rotations.shape == (m, 3):
+        return np.array([attitude.euler2dcm(i) for i in rotations])
+    raise ValueError('rotations should be of size (%s, 3, 3) or (%s, 3), but it is %s.'%\
+                     (m, m, rotations.shape))
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+# Fielname = kernel.py
+
+"""
+Stepping kernel of path_gen for closed-loop motion segments (motion type 2~5).
+All math is done on scalars and preallocated buffers with the ZYX rotation sequence
+hard coded, so that the kernel can be compiled by Numba. Numba is optional. If it is
+not installed, AVAILABLE is False and path_gen uses its pure-Python loop.
+Created on 2026-10-16
+@author: dongxiaoguang
+"""
+
+# import
+import math
+try:
+    import numba
+except ImportError:
+    numba = None
+import numpy as np
+
+# global
+VERSION = '1.0'
+AVAILABLE = numba is not None
+TWO_PI = 2.0*math.pi
+# WGS-84, same as geoparams
+RE = 6378137
+FLATTENING = 0.00335281066475
+E_SQR = 0.00669437999014
+W_IE = 7292115e-11
+# layout of the state array
+STATE_SIZE = 31
+# layout of the control parameter array
+#   [alpha, max_acc, max_dw, max_w, kp, kd, att_converge_threshold, vel_converge_threshold]
+CTRL_SIZE = 8
+
+def jit(func):
+    '''
+    Compile func by Numba if Numba is available.
+    '''
+    if numba is None:
+        return func
+    return numba.njit(cache=True)(func)
+
+@jit
+def geo_param(lat, h):
+    '''
+    Scalar version of geoparams.geo_param.
+    Returns:
+        rm, rn, g, sl, cl
+    '''
+    normal_gravity = 9.7803253359
+    k = 0.00193185265241
+    m = 0.00344978650684
+    sl = math.sin(lat)
+    cl = math.cos(lat)
+    sl_sqr = sl * sl
+    rm = (RE*(1 - E_SQR)) / (math.sqrt(1.0 - E_SQR*sl_sqr) * (1.0 - E_SQR*sl_sqr))
+    rn = RE / (math.sqrt(1.0 - E_SQR*sl_sqr))
+    g1 = normal_gravity * (1 + k*sl_sqr) / math.sqrt(1.0 - E_SQR*sl_sqr)
+    g = g1 * (1.0 - (2.0/RE) * (1.0 + FLATTENING + m - 2.0*FLATTENING*sl_sqr)*h + 3.0*h*h/RE/RE)
+    return rm, rn, g, sl, cl
+
+@jit
+def dcm_b2n(att, c_nb):
+    '''
+    Transformation matrix from b to n of Euler angles (ZYX). The result is written in c_nb.
+    This is the transpose of attitude.euler2dcm(att, 'zyx').
+    '''
+    c0 = math.cos(att[0])
+    c1 = math.cos(att[1])
+    c2 = math.cos(att[2])
+    s0 = math.sin(att[0])
+    s1 = math.sin(att[1])
+    s2 = math.sin(att[2])
+    c_nb[0, 0] = c1*c0
+    c_nb[1, 0] = c1*s0
+    c_nb[2, 0] = -s1
+    c_nb[0, 1] = s2*s1*c0 - c2*s0
+    c_nb[1, 1] = s2*s1*s0 + c2*c0
+    c_nb[2, 1] = c1*s2
+    c_nb[0, 2] = s1*c2*c0 + s0*s2
+    c_nb[1, 2] = s1*c2*s0 - c0*s2
+    c_nb[2, 2] = c1*c2
+
+@jit
+def angle_range_pi(x):
+    '''
+    Scalar version of attitude.angle_range_pi.
+    '''
+    x = x % TWO_PI
+    if x > math.pi:
+        x = x - TWO_PI
+    return x
+
+@jit
+def true_sensor_output(pos, vel_b, att, c_nb, vel_dot_b, att_dot, ref_frame, g,
+                       acc, gyro, pos_dot_n):
+    '''
+    Scalar version of pathgen.calc_true_sensor_output. Results are written in acc, gyro
+    and pos_dot_n.
+    '''
+    vel_n0 = c_nb[0, 0]*vel_b[0] + c_nb[0, 1]*vel_b[1] + c_nb[0, 2]*vel_b[2]
+    vel_n1 = c_nb[1, 0]*vel_b[0] + c_nb[1, 1]*vel_b[1] + c_nb[1, 2]*vel_b[2]
+    vel_n2 = c_nb[2, 0]*vel_b[0] + c_nb[2, 1]*vel_b[1] + c_nb[2, 2]*vel_b[2]
+    w_en_n0 = 0.0
+    w_en_n1 = 0.0
+    w_en_n2 = 0.0
+    w_ie_n0 = 0.0
+    w_ie_n2 = 0.0
+    if ref_frame == 0:
+        rm, rn, g, sl, cl = geo_param(pos[0], pos[2])
+        rm_effective = rm + pos[2]
+        rn_effective = rn + pos[2]
+        w_en_n0 = vel_n1 / rn_effective
+        w_en_n1 = -vel_n0 / rm_effective
+        w_en_n2 = -vel_n1 * sl /cl / rn_effective
+        w_ie_n0 = W_IE * cl
+        w_ie_n2 = -W_IE * sl
+        pos_dot_n[0] = vel_n0 / rm_effective
+        pos_dot_n[1] = vel_n1 / rn_effective / cl
+        pos_dot_n[2] = -vel_n2
+    else:
+        pos_dot_n[0] = vel_n0
+        pos_dot_n[1] = vel_n1
+        pos_dot_n[2] = vel_n2
+    # rotation rate of b w.r.t n in n from Euler angle derivative
+    sh = math.sin(att[0])
+    ch = math.cos(att[0])
+    w0 = -sh*att_dot[1] + c_nb[0, 0]*att_dot[2] + w_en_n0 + w_ie_n0
+    w1 = ch*att_dot[1] + c_nb[1, 0]*att_dot[2] + w_en_n1
+    w2 = att_dot[0] + c_nb[2, 0]*att_dot[2] + w_en_n2 + w_ie_n2
+    # gyro output, c_nb.T * w
+    for j in range(3):
+        gyro[j] = c_nb[0, j]*w0 + c_nb[1, j]*w1 + c_nb[2, j]*w2
+    # acc output
+    w_ie_b0 = c_nb[0, 0]*w_ie_n0 + c_nb[2, 0]*w_ie_n2 + gyro[0]
+    w_ie_b1 = c_nb[0, 1]*w_ie_n0 + c_nb[2, 1]*w_ie_n2 + gyro[1]
+    w_ie_b2 = c_nb[0, 2]*w_ie_n0 + c_nb[2, 2]*w_ie_n2 + gyro[2]
+    acc[0] = vel_dot_b[0] + (w_ie_b1*vel_b[2] - w_ie_b2*vel_b[1]) - c_nb[2, 0]*g
+    acc[1] = vel_dot_b[1] + (w_ie_b2*vel_b[0] - w_ie_b0*vel_b[2]) - c_nb[2, 1]*g
+    acc[2] = vel_dot_b[2] + (w_ie_b0*vel_b[1] - w_ie_b1*vel_b[0]) - c_nb[2, 2]*g
+
+@jit
+def closed_loop_segment(state, att_com, vel_com_b, seg_count, sim_count, dt, sim_osr,
+                        low_period, mag_period, low_type, gps_visibility, ref_frame, g, magnet,
+                        geo_mag_n, ctrl, imu_data, nav_data, mag_data, low_data, idx_high,
+                        idx_low, idx_mag):
+    '''
+    Run the command of a closed-loop motion segment step by step, the same as path_gen does.
+    Args:
+        state: STATE_SIZE array, updated in place. Its layout is
+            [0:3] pos_n, [3:6] pos_delta_n, [6:9] vel_b, [9:12] att, [12:15] att_dot,
+            [15:18] vel_dot_b, [18:21] acc_sum, [21:24] gyro_sum, [24:27] att_com_filt,
+            [27:30] vel_com_b_filt, [30] odo_dist.
+        att_com: 3x1 attitude command, rad.
+        vel_com_b: 3x1 velocity command in the body frame, m/s.
+        seg_count: max simulation cycles of this segment.
+        sim_count: simulation cycles before this segment.
+        dt: simulation period, sec.
+        sim_osr: simulation over sample ratio w.r.t IMU output freq, also the IMU output
+            period in simulation cycles.
+        low_period: GPS or odometer output period in simulation cycles.
+        mag_period: magnetometer output period in simulation cycles.
+        low_type: 1 for GPS, 2 for odometer, otherwise no GPS or odometer output.
+        gps_visibility: GPS visibility of this segment.
+        ref_frame: See doc of function path_gen.
+        g: gravity, only used when ref_frame==1, m/s/s.
+        magnet: True to generate magnetometer output.
+        geo_mag_n: 3x1 geomagnetic field in the navigation frame, uT.
+        ctrl: CTRL_SIZE control parameters, see CTRL_SIZE.
+        imu_data, nav_data, mag_data, low_data: output buffers of path_gen. low_data is
+            gps_data or odo_data.
+        idx_high: data index for imu, nav.
+        idx_low: data index for gps, odo.
+        idx_mag: data index for mag.
+    Returns:
+        sim_count, idx_high, idx_low, idx_mag after this segment, and if the command is
+        completed.
+        The kernel also returns when the output buffers are full.
+    '''
+    alpha = ctrl[0]
+    max_acc = ctrl[1]
+    max_dw = ctrl[2]
+    max_w = ctrl[3]
+    kp = ctrl[4]
+    kd = ctrl[5]
+    att_converge_threshold = ctrl[6]
+    vel_converge_threshold = ctrl[7]
+    pos_n = state[0:3]
+    pos_delta_n = state[3:6]
+    vel_b = state[6:9]
+    att = state[9:12]
+    att_dot = state[12:15]
+    vel_dot_b = state[15:18]
+    acc_sum = state[18:21]
+    gyro_sum = state[21:24]
+    att_com_filt = state[24:27]
+    vel_com_b_filt = state[27:30]
+    odo_dist = state[30]
+    pos = np.zeros(3)
+    acc = np.zeros(3)
+    gyro = np.zeros(3)
+    pos_dot_n = np.zeros(3)
+    c_nb = np.zeros((3, 3))
+    dcm_b2n(att, c_nb)
+    sim_count_max = sim_count + seg_count
+    # next cycles to output data
+    next_imu = sim_count + (-sim_count) % sim_osr
+    next_mag = sim_count + (-sim_count) % mag_period
+    next_low = -1
+    if low_type == 1 or low_type == 2:
+        next_low = sim_count + (-sim_count) % low_period
+    com_complete = False
+    while sim_count < sim_count_max and not com_complete:
+        # handle the input motion commands
+        att_err = 0.0
+        vel_err = 0.0
+        for j in range(3):
+            att_com_filt[j] = alpha*att_com_filt[j] + (1-alpha)*att_com[j]
+            vel_com_b_filt[j] = alpha*vel_com_b_filt[j] + (1-alpha)*vel_com_b[j]
+            # acc
+            vel_dot_b[j] = (vel_com_b_filt[j] - vel_b[j]) / dt
+            vel_dot_b[j] = min(max(vel_dot_b[j], -max_acc), max_acc)
+            # w
+            att_dot_dot = kp*(att_com[j] - att[j]) + kd*(0 - att_dot[j])
+            att_dot_dot = min(max(att_dot_dot, -max_dw), max_dw)
+            att_dot[j] = att_dot[j] + att_dot_dot*dt
+            att_dot[j] = min(max(att_dot[j], -max_w), max_w)
+            att_err += (att[j]-att_com[j]) * (att[j]-att_com[j])
+            vel_err += (vel_b[j]-vel_com_b[j]) * (vel_b[j]-vel_com_b[j])
+        # Complete the command of this segment?
+        if (math.sqrt(att_err) < att_converge_threshold and
+                math.sqrt(vel_err) < vel_converge_threshold):
+            com_complete = True
+        # compute IMU outputs according to pos/vel/att changes
+        for j in range(3):
+            pos[j] = pos_n[j] + pos_delta_n[j]
+        true_sensor_output(pos, vel_b, att, c_nb, vel_dot_b, att_dot, ref_frame, g,
+                           acc, gyro, pos_dot_n)
+        for j in range(3):
+            acc_sum[j] = acc_sum[j] + acc[j]
+            gyro_sum[j] = gyro_sum[j] + gyro[j]
+        # IMU measurement and navigation results
+        if sim_count == next_imu:
+            next_imu += sim_osr
+            imu_data[idx_high, 0] = sim_count
+            nav_data[idx_high, 0] = sim_count
+            for j in range(3):
+                imu_data[idx_high, 1+j] = acc_sum[j] / sim_osr
+                imu_data[idx_high, 4+j] = gyro_sum[j] / sim_osr
+                nav_data[idx_high, 1+j] = pos[j]
+                nav_data[idx_high, 4+j] = vel_b[j]
+                acc_sum[j] = 0.0
+                gyro_sum[j] = 0.0
+            # Euler angles, yaw [-pi, pi], pitch [-pi/2, pi/2], roll [-pi, pi]
+            a1 = att[0]
+            a2 = angle_range_pi(att[1])
+            a3 = att[2]
+            if a2 > 0.5*math.pi:
+                a2 = math.pi - a2
+                a1 = a1 + math.pi
+                a3 = a3 + math.pi
+            elif a2 < -0.5*math.pi:
+                a2 = -math.pi - a2
+                a1 = a1 + math.pi
+                a3 = a3 + math.pi
+            nav_data[idx_high, 7] = angle_range_pi(a1)
+            nav_data[idx_high, 8] = a2
+            nav_data[idx_high, 9] = angle_range_pi(a3)
+            idx_high += 1
+        # magnetometer measurement
+        if magnet and sim_count == next_mag:
+            next_mag += mag_period
+            mag_data[idx_mag, 0] = sim_count
+            for j in range(3):
+                mag_data[idx_mag, 1+j] = c_nb[0, j]*geo_mag_n[0] +\
+                                         c_nb[1, j]*geo_mag_n[1] +\
+                                         c_nb[2, j]*geo_mag_n[2]
+            idx_mag += 1
+        # GPS or odometer measurement
+        if (low_type == 1 or low_type == 2) and sim_count == next_low:
+            next_low += low_period
+            low_data[idx_low, 0] = sim_count
+            if low_type == 1:
+                for j in range(3):
+                    low_data[idx_low, 1+j] = pos[j]
+                    low_data[idx_low, 4+j] = c_nb[j, 0]*vel_b[0] + c_nb[j, 1]*vel_b[1] +\
+                                             c_nb[j, 2]*vel_b[2]
+                low_data[idx_low, 7] = gps_visibility
+            else:
+                low_data[idx_low, 1] = odo_dist
+                for j in range(3):
+                    low_data[idx_low, 2+j] = vel_b[j]
+            idx_low += 1
+        # accumulate pos/vel/att change
+        odo_dist = odo_dist + math.sqrt(vel_b[0]*vel_b[0] + vel_b[1]*vel_b[1] +
+                                        vel_b[2]*vel_b[2])*dt
+        for j in range(3):
+            pos_delta_n[j] = pos_delta_n[j] + pos_dot_n[j]*dt
+            vel_b[j] = vel_b[j] + vel_dot_b[j]*dt
+            att[j] = att[j] + att_dot[j]*dt
+        dcm_b2n(att, c_nb)
+        sim_count += 1
+        # output buffers are full
+        if idx_high >= imu_data.shape[0]:
+            break
+    state[30] = odo_dist
+    return sim_count, idx_high, idx_low, idx_mag, com_complete
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# Fielname = motion_plan.py
+
+"""
+Motion definition compiler.
+A motion definition is parsed and validated once and compiled into a generation plan: a
+compact command table with segment durations in simulation cycles, the output period of
+each data stream and the max number of outputs of each stream. The plan does not depend on
+the initial states or the sensor errors, so it can be reused by all runs of a simulation.
+Created on 2026-10-16
+@author: dongxiaoguang
+"""
+
+# import
+import math
+import numpy as np
+
+# global
+VERSION = '1.0'
+D2R = math.pi/180
+NUM_COLS = 9            # columns of a motion definition
+NUM_TYPES = 5           # motion types are 1~NUM_TYPES
+
+def read_motion_def(file_name):
+    '''
+    Read initial states and motion commands from a motion definition .csv file. The file has
+    a header row, a row of initial states, a header row and at least one row of commands.
+    See doc of ins_sim.Sim.
+    Args:
+        file_name: name of the .csv file.
+    Returns:
+        a list containing:
+            ini_pos_vel_att: initial position [Lat Lon Alt] (rad, rad, m), velocity in the
+                body frame (m/s) and Euler angles (ZYX rotation sequence, rad).
+            motion_def: nx9 motion commands, units: rad, rad/s, m, m/s, sec.
+    '''
+    # the whole file is parsed at once, the second header row becomes a row of nan
+    try:
+        data = np.genfromtxt(file_name, delimiter=',', skip_header=1, usecols=range(NUM_COLS))
+    except (ValueError, IndexError):
+        data = None
+    if data is None or data.ndim != 2 or data.shape[0] < 3:
+        raise ValueError('motion definition file must have nine columns \
+                          and at least four rows (two header rows + at least two data rows).')
+    ini_pos_vel_att = data[0].copy()
+    ini_pos_vel_att[0:2] = ini_pos_vel_att[0:2] * D2R
+    ini_pos_vel_att[6:9] = ini_pos_vel_att[6:9] * D2R
+    motion_def = data[2:].copy()
+    # convert deg to rad
+    motion_def[:, 1:4] = motion_def[:, 1:4] * D2R
+    # replace nan with 0.0, doing this to be compatible with older version motion def files.
+    motion_def[np.isnan(motion_def)] = 0.0
+    return [ini_pos_vel_att, motion_def]
+
+def compile_motion_def(motion_def, output_def):
+    '''
+    Compile motion commands into a generation plan.
+    Args:
+        motion_def: nx9 motion commands, see doc of pathgen.path_gen. It is not modified.
+        output_def: output definitions, see doc of pathgen.path_gen. It is not modified.
+    Returns:
+        plan: a dict.
+            'motion_def': mx9 commands of all segments that last at least one simulation
+                cycle. Column 7 is the max simulation cycles of each segment.
+            'seg_index': (m,) row index of each command in the input motion_def.
+            'output_def': a copy of output_def.
+            'sim_count_max': max simulation cycles of the whole trajectory.
+            'imu_period', 'low_type', 'low_period', 'mag_period': see output_schedule.
+            'imu_rows', 'low_rows', 'mag_rows': max number of outputs of 'imu' and 'nav',
+                'gps' or 'odo', and 'mag'. They are exact if no closed-loop command
+                (motion type 2~5) completes before its max time.
+    '''
+    motion_def = np.array(motion_def, dtype=float)
+    if motion_def.ndim == 1:
+        motion_def = motion_def.reshape((1, motion_def.shape[0]))
+    if motion_def.ndim != 2 or motion_def.shape[1] < NUM_COLS:
+        raise ValueError('motion_def should have %s columns.'% NUM_COLS)
+    output_def = np.array(output_def, dtype=float)
+    for i in range(0, motion_def.shape[0]):
+        com_type = round(motion_def[i, 0])
+        if com_type < 1 or com_type > NUM_TYPES:
+            raise ValueError("Command type of %s-th command should be 1~%s, but it is %s."\
+                             % (i, NUM_TYPES, motion_def[i, 0]))
+        if motion_def[i, 7] < 0:
+            raise ValueError("Time duration of %s-th command has negative time duration: %s."\
+                             % (i, motion_def[i, 7]))
+    ### convert time duration to simulation cycles
+    out_freq = output_def[0, 1]     # IMU output frequency
+    sim_osr = output_def[0, 0]      # simulation over sample ratio w.r.t IMU output freq
+    seg_cycles = np.array([round(i * out_freq * sim_osr) for i in motion_def[:, 7]])
+    sim_count_max = int(np.sum(seg_cycles))
+    # total sim_count_max must be above 0
+    if sim_count_max <= 0:
+        raise ValueError("Total time duration in the motion definition file must be above 0.")
+    # segments of zero cycles do not change the trajectory
+    seg_index = np.nonzero(seg_cycles > 0)[0]
+    com_table = motion_def[seg_index, 0:NUM_COLS].copy()
+    com_table[:, 7] = seg_cycles[seg_index]
+    ### output schedule and sizes
+    imu_period, low_type, low_period, mag_period = output_schedule(output_def)
+    imu_rows = (sim_count_max - 1) // imu_period + 1
+    low_rows = 0
+    if low_type != 0:
+        low_rows = (imu_rows - 1) // (low_period // imu_period) + 1
+    mag_rows = (imu_rows - 1) // (mag_period // imu_period) + 1
+    return {'motion_def': com_table,
+            'seg_index': seg_index,
+            'output_def': output_def,
+            'sim_count_max': sim_count_max,
+            'imu_period': imu_period,
+            'low_type': low_type,
+            'low_period': low_period,
+            'mag_period': mag_period,
+            'imu_rows': imu_rows,
+            'low_rows': low_rows,
+            'mag_rows': mag_rows}
+
+def output_schedule(output_def):
+    '''
+    Output periods of all data streams, in simulation cycles. All periods are multiples of
+    the IMU output period, so GPS, odometer and magnetometer data are sampled at IMU outputs.
+    Args:
+        output_def: See doc of function pathgen.path_gen.
+    Returns:
+        imu_period: output period of 'imu' and 'nav'.
+        low_type: 1 for GPS, 2 for odometer, 0 for neither.
+        low_period: output period of 'gps' or 'odo', 0 if low_type is 0.
+        mag_period: output period of 'mag'. It is imu_period if output_def has no
+            magnetometer row.
+    '''
+    imu_period = int(round(output_def[0, 0]))
+    out_freq = output_def[0, 1]
+    low_type = 0
+    low_period = 0
+    mag_period = imu_period
+    if output_def.shape[0] >= 2 and (output_def[1, 0] == 1 or output_def[1, 0] == 2):
+        low_type = int(output_def[1, 0])
+        low_period = imu_period * output_ratio(out_freq, output_def[1, 1])
+    for i in range(1, output_def.shape[0]):
+        if output_def[i, 0] == 3:
+            mag_period = imu_period * output_ratio(out_freq, output_def[i, 1])
+    return imu_period, low_type, low_period, mag_period
+
+def output_ratio(out_freq, freq):
+    '''
+    Number of IMU outputs in one output period of a data stream.
+    Args:
+        out_freq: IMU output frequency, Hz.
+        freq: output frequency of the data stream, Hz. If it is not above 0, the stream is
+            output with the IMU.
+    Returns:
+        an int not less than 1.
+    '''
+    if not freq > 0:
+        return 1
+    return max(1, int(round(out_freq / freq)))
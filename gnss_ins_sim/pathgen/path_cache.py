@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# Fielname = path_cache.py
+
+"""
+On-disk cache of path_gen outputs.
+Each entry is a directory named by the hash of the path_gen inputs. It contains one .npy
+file for each non-empty output of path_gen ('imu', 'nav', 'mag', 'gps' and 'odo'), so that
+a cache hit is served by memory-mapping the files instead of running path_gen again.
+The total size of the cache is bounded. Least recently used entries are evicted first.
+Created on 2026-10-16
+@author: dongxiaoguang
+"""
+
+# import
+import os
+import shutil
+import hashlib
+import numpy as np
+
+# global
+VERSION = '1.0'
+MAX_SIZE = 2**30                # default max size of the cache, bytes
+DATA_NAMES = ('imu', 'nav', 'mag', 'gps', 'odo')
+# Change this when path_gen outputs change so that old entries are not used.
+PATH_GEN_VERSION = '20261016'
+
+class PathCache(object):
+    '''
+    Content-addressed on-disk cache of path_gen outputs.
+    '''
+    def __init__(self, cache_dir, max_size=MAX_SIZE):
+        '''
+        Args:
+            cache_dir: directory to store cache entries. It will be created if it does not exist.
+            max_size: max total size of all cache entries, bytes.
+        '''
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = int(max_size)
+        if not os.path.exists(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                if not os.path.isdir(self.cache_dir):
+                    raise IOError('Cannot create dir: %s.'% self.cache_dir)
+
+    def key(self, ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, magnet=False,
+            backend='python', integrator='euler', tol=None):
+        '''
+        Hash of path_gen inputs.
+        Args:
+            See doc of pathgen.path_gen. motion_def is the command table, not a plan.
+        Returns:
+            a hex string.
+        '''
+        h = hashlib.sha256()
+        h.update(PATH_GEN_VERSION.encode())
+        for i in (ini_pos_vel_att, motion_def, output_def, mobility):
+            x = np.ascontiguousarray(i, dtype=np.float64)
+            h.update(str(x.shape).encode())
+            h.update(x.tobytes())
+        h.update(('%s,%s,%s,%s,%r'% (int(ref_frame), bool(magnet), backend, integrator,
+                                     tol)).encode())
+        return h.hexdigest()
+
+    def load(self, key):
+        '''
+        Load a cache entry.
+        Args:
+            key: key of the entry, see key().
+        Returns:
+            a dict of the same form as the return value of path_gen, with arrays memory-mapped
+            read only. The RK4 integration report is not cached. None if there is no such entry.
+        '''
+        entry = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry):
+            return None
+        results = {'status': True}
+        try:
+            for i in DATA_NAMES:
+                file_name = os.path.join(entry, i + '.npy')
+                if os.path.isfile(file_name):
+                    results[i] = np.load(file_name, mmap_mode='r')
+                else:
+                    results[i] = []
+            # mark as recently used
+            os.utime(entry, None)
+        except (OSError, ValueError):
+            # incomplete or removed by another process
+            return None
+        return results
+
+    def save(self, key, results):
+        '''
+        Save path_gen outputs as a cache entry, and evict least recently used entries if the
+        cache is too large.
+        Args:
+            key: key of the entry, see key().
+            results: return value of path_gen.
+        '''
+        entry = os.path.join(self.cache_dir, key)
+        if os.path.isdir(entry):
+            return
+        # write to a temporary dir and rename it, so that readers never see partial entries
+        tmp = os.path.join(self.cache_dir, '.tmp-%s-%s'% (key, os.getpid()))
+        try:
+            os.makedirs(tmp)
+            for i in DATA_NAMES:
+                if i in results and len(results[i]) != 0:
+                    np.save(os.path.join(tmp, i + '.npy'), results[i])
+            os.rename(tmp, entry)
+        except OSError:
+            # the same entry is saved by another process, or the disk is full
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        '''
+        Remove least recently used entries until the cache is not larger than max_size.
+        Args:
+            keep: key of an entry that should not be removed.
+        '''
+        entries = []
+        total_size = 0
+        for i in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, i)
+            if i.startswith('.') or not os.path.isdir(entry):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, j)) for j in os.listdir(entry))
+                entries.append((os.path.getmtime(entry), size, i))
+            except OSError:
+                continue
+            total_size += size
+        entries.sort()
+        for (_, size, i) in entries:
+            if total_size <= self.max_size:
+                break
+            if i == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, i), ignore_errors=True)
+            total_size -= size
+
+    def clear(self):
+        '''
+        Remove all cache entries.
+        '''
+        for i in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, i)
+            if os.path.isdir(entry):
+                shutil.rmtree(entry, ignore_errors=True)
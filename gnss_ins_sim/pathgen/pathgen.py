@@ -8,22 +8,51 @@ Created on 2017-09-12
             and angular velocity.
 20171028:   Remove magnetic inclination when reference frame is a virtual inertial
             frame (ref_frame==1).
+20261016:   Generate motion segments of type 1 in vectorized blocks.
+            Add an optional Numba-compiled backend for closed-loop motion segments.
+            Add path_gen_iter to generate data in chunks. Sensor error models can carry
+            their states across chunks.
+            Add path_gen_batch to generate many trajectories in lock-step.
+            Add an optional RK4 integrator of position.
+            Fill steady parts of type 1 segments without computing every cycle.
+            Precompute output cycles of all data streams. Add magnetometer sample rate.
+            Compile motion commands into a reusable plan with tight output sizes.
+            path_gen_iter yields generator states with each chunk and can resume from them.
+            Generate Gauss-Markov bias drift of all axes by a vectorized blocked scan.
+            Add batched sensor generators for many simulation runs.
+            Sensor generators accept a numpy.random.Generator for reproducible streams.
+            Generate PSD vibration of any length by a cached shaping filter.
+            Add sensor errors in place by a pipeline of error stages.
+            Draw error parameters of each run from distributions. Add scale factor error.
+            Batched generators accept true data of many sensors, e.g., IMU arrays.
+            Batched generators can keep the error of each stage separately.
+            Error parameters of each run can be drawn from given points, e.g., antithetic.
 @author: dongxiaoguang
 """
 
 # import
 import math
+import warnings
+import statistics
 import numpy as np
 from ..attitude import attitude
 from ..geoparams import geoparams
 from ..geoparams import geomag
-from ..psd import time_series_from_psd
+from ..psd import psd_vibration
+from . import kernel
+from . import motion_plan
 
 # global
 VERSION = '1.0'
 D2R = math.pi/180
+BLOCK_SIZE = 65536      # max simulation cycles generated in one vectorized block
+MIN_BLOCK_SIZE = 16     # type 1 segments shorter than this are generated step by step
+MAX_SPLIT = 8           # max times an RK4 step is halved to meet the tolerance
+MAX_GAIN = 1024.0       # max growth of the scaled noise in a block of the Gauss-Markov scan
+BATCH_SIZE = 2**22      # max samples of each temporary array in batched sensor generation
 
-def path_gen(ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, magnet=False):
+def path_gen(ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, magnet=False,
+             backend='python', integrator='euler', tol=None):
     """
     Generate IMU and GPS or odometer data file according to initial position\velocity\attitude,
     motion command and simulation mode.
@@ -46,7 +75,14 @@ def path_gen(ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, mag
                 5: relative att, absolute vel.
             motion_def[:,1:6]: motion params = [Att command, vel along body axis command].
             motion_def[:,7] = maximum time for the given segment, sec.
+            motion_def[:,8] = GPS visibility.
+            motion_def can also be a generation plan compiled from motion_def and output_def
+            by motion_plan.compile_motion_def, so that the commands are compiled only once
+            for many calls. motion_def is not modified.
         output_def: [[simulation_over_sample_rate imu_freq];[1 gps_freq] or [2 odo_freq]], Hz.
+            An optional row [3 mag_freq] sets the magnetometer sample rate, which is imu_freq
+            by default. Sample rates of GPS, odometer and magnetometer are rounded so that
+            their periods are multiples of the IMU period. output_def is not modified.
         mobility: [max_acceleration, max_angular_acceleration, max_angular_velocity]
         ref_frame: reference frame used as the navigation frame,
             0: NED (default).
@@ -56,6 +92,20 @@ def path_gen(ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, mag
             True: Geomagnetic field in the body frame will be calculaed.
                 For ref_frame==0, N is geographic north, and there is declination;
                 For ref_frame==1, there is no declination.
+        backend: how closed-loop motion segments (motion type 2~5) are stepped.
+            'python': pure-Python loop (default).
+            'jit': the stepping kernel in kernel.py compiled by Numba. If Numba is not
+                installed, the pure-Python loop is used with a RuntimeWarning.
+            Motion segments of type 1 are generated in vectorized blocks, or by the
+                pure-Python loop if they are shorter than MIN_BLOCK_SIZE cycles.
+        integrator: how position is integrated in each simulation cycle. Velocity and attitude
+            are integrated exactly since their change rates are constant within a cycle.
+            'euler': first-order Euler (default).
+            'rk4': classical fourth-order Runge-Kutta. Position error does not grow with
+                the simulation period as fast as Euler, so a small simulation_over_sample_rate
+                can be used. Only the pure-Python backend supports 'rk4'.
+        tol: position error tolerance of each RK4 step, m. Steps with a larger error estimate
+            are halved (at most MAX_SPLIT times). None (default) to never halve a step.
     Returns:
         path_results. Resutls of path generation.
             'status':  True: Everything is OK.
@@ -70,6 +120,7 @@ def path_gen(ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, mag
                         Index is synced with index in mimu.csv.
             'mag':      True/ideal geomagneti field in the body frame.
                         [index, magx, magy, magz], uT, index synced with mimu.csv index.
+                        Magnetometer data are down sampled to mag_freq.
             'gps':      True GPS measurements.
                         ref_frame==0, [index, absolute_position_lla, velocity_in_navigation_frame],
                         ref_frame==1, [index, absolute_position_xyz, velocity_in_navigation_frame],
@@ -79,15 +130,82 @@ def path_gen(ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, mag
             'odo':      True odometer measurements.
                         [index, travel_distance, velocity_in_body_frame].
                         Odometry are down sampled to odd_freq, index synced with mimu.csv index.
+            'integration': Only when integrator is 'rk4'. Report of the RK4 integration.
+                'steps': number of RK4 steps, including steps from halving,
+                'euler_max_diff': max distance between the RK4 position and the position
+                    integrated by Euler from the same change rates, m.
+                'euler_end_diff': the distance at the end of the trajectory, m.
+    """
+    # all data are generated in one chunk
+    chunks = list(path_gen_iter(ini_pos_vel_att, motion_def, output_def, mobility,
+                                ref_frame, magnet, backend, integrator=integrator, tol=tol))
+    return join_chunks(chunks)
+
+def join_chunks(chunks):
+    """
+    Join chunks yielded by path_gen_iter.
+    Args:
+        chunks: a list of chunks, in the order they are yielded.
+    Returns:
+        a dict of the same form as the return value of path_gen.
     """
-    ### path generation results
     path_results = {'status': True,
                     'imu': [],
                     'nav': [],
                     'mag': [],
                     'gps': [],
                     'odo': []}
+    for i in path_results:
+        if i == 'status' or len(chunks[0][i]) == 0:
+            continue
+        if len(chunks) == 1:
+            path_results[i] = chunks[0][i]
+            # closed-loop commands completed early, release the unused part of the buffer
+            base = path_results[i].base
+            if isinstance(base, np.ndarray) and base.shape[0] > 2*path_results[i].shape[0]:
+                path_results[i] = path_results[i].copy()
+        else:
+            path_results[i] = np.vstack([chunk[i] for chunk in chunks])
+    if 'integration' in chunks[-1]:
+        path_results['integration'] = chunks[-1]['integration']
+    return path_results
 
+def path_gen_iter(ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, magnet=False,
+                  backend='python', chunk_size=None, integrator='euler', tol=None, resume=None):
+    """
+    Generator version of path_gen. Instead of holding the whole trajectory in memory, data are
+    generated and yielded in chunks. The integrator and the command filter states are carried
+    across chunk boundaries, so the concatenation of all chunks equals the output of path_gen.
+    Args:
+        ini_pos_vel_att, motion_def, output_def, mobility, ref_frame, magnet, backend,
+        integrator, tol: See doc of function path_gen.
+        chunk_size: max number of rows of 'imu' and 'nav' in each chunk. 'gps', 'odo' and 'mag'
+            can be down sampled and have fewer rows. If chunk_size is None, all data are yielded
+            in one chunk.
+        resume: 'state' of a chunk yielded by a previous call with the same arguments. Data
+            after that chunk are generated, as if the previous call had not been stopped.
+            None (default) to generate from the start.
+    Yields:
+        a dict of the same form as the return value of path_gen. Data index (column 0) is
+        the index in the whole trajectory. 'integration' is the report up to this chunk.
+        'state' is a dict of the generator states at the end of this chunk, which can be
+        saved and used as resume to continue the generation later.
+    """
+    ### check backend
+    if backend not in ('python', 'jit'):
+        raise ValueError("backend should be 'python' or 'jit', but it is %s."% backend)
+    if backend == 'jit' and not kernel.AVAILABLE:
+        warnings.warn('Numba is not available, the pure-Python backend is used.',
+                      RuntimeWarning)
+        backend = 'python'
+    ### check integrator
+    if integrator not in ('euler', 'rk4'):
+        raise ValueError("integrator should be 'euler' or 'rk4', but it is %s."% integrator)
+    if backend == 'jit' and integrator == 'rk4':
+        warnings.warn('The Numba backend only supports the Euler integrator, ' +\
+                      'the pure-Python backend is used.', RuntimeWarning)
+        backend = 'python'
+    rk4 = integrator == 'rk4'
     ### sim freq and data output freq
     out_freq = output_def[0, 1]     # IMU output frequency
     sim_osr = output_def[0, 0]      # simulation over sample ratio w.r.t IMU output freq
@@ -108,36 +226,23 @@ def path_gen(ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, mag
     att_dot = np.zeros(3)           # Euler angle change rate
     vel_dot_b = np.zeros(3)         # Velocity change rate in the body frame
 
-    ### convert time duration to simulation cycles
-    sim_count_max = 0
-    for i in range(0, motion_def.shape[0]):
-        if motion_def[i, 7] < 0:
-            raise ValueError("Time duration of %s-th command has negative time duration: %s."\
-                             % (i, motion_def[i, 7]))
-        seg_count = motion_def[i, 7] * out_freq         # max count for this segment
-        sim_count_max += math.ceil(seg_count)           # data count of all segments
-        motion_def[i, 7] = round(seg_count * sim_osr)   # simulation count
-    # total sim_count_max must be above 0
-    if sim_count_max <= 0:
-        raise ValueError("Total time duration in the motion definition file must be above 0.")
+    ### compile motion commands, segment durations are converted to simulation cycles
+    plan = get_plan(motion_def, output_def)
+    motion_def = plan['motion_def']
     ### create output arrays
-    sim_count_max = int(sim_count_max)
-    imu_data = np.zeros((sim_count_max, 7))
-    nav_data = np.zeros((sim_count_max, 10))
-    enable_gps_or_odo = False
-    if output_def.shape[0] >= 2:
-        if output_def[1, 0] == 1:
-            enable_gps_or_odo = True
-            gps_data = np.zeros((sim_count_max, 8))
-            output_def[1, 1] = sim_osr * round(out_freq / output_def[1, 1])
-        elif output_def[1, 0] == 2:
-            enable_gps_or_odo = True
-            odo_data = np.zeros((sim_count_max, 5))
-            output_def[1, 1] = sim_osr * round(out_freq / output_def[1, 1])
-        else:
-            output_def[1, 0] = -1
-    if magnet:
-        mag_data = np.zeros((sim_count_max, 4))
+    chunk_rows = plan['imu_rows']
+    if chunk_size is not None:
+        chunk_rows = min(int(chunk_size), chunk_rows)
+        if chunk_rows < 1:
+            raise ValueError('chunk_size should be above 0, but it is %s.'% chunk_size)
+    # output periods of all data, in simulation cycles
+    imu_period = plan['imu_period']
+    low_type = plan['low_type']
+    low_period = plan['low_period']
+    mag_period = plan['mag_period']
+    enable_gps_or_odo = low_type != 0
+    buf_def = (chunk_rows, low_type, magnet, imu_period, low_period, mag_period)
+    imu_data, nav_data, mag_data, gps_data, odo_data = alloc_output(*buf_def)
 
     ### start computations
     sim_count = 0               # number of total simulation data
@@ -151,6 +256,10 @@ def path_gen(ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, mag
     c_nb = attitude.euler2dcm(att, 'zyx').T     # b to n
     vel_n = c_nb.dot(vel_b)
     pos_delta_n = np.zeros(3)                   # pos change
+    report = None                               # RK4 integration report
+    if rk4:
+        report = {'steps': 0, 'euler_max_diff': 0.0, 'euler_end_diff': 0.0}
+        pos_delta_euler = np.zeros(3)           # pos change integrated by Euler
     earth_param = geoparams.geo_param(pos_n)    # geo parameters
     g = earth_param[2]                          # local gravity at ini pos
     if magnet:                                  # geomagnetic parameters at the initial position
@@ -164,27 +273,215 @@ def path_gen(ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, mag
     ## start trajectory generation
     if ref_frame == 1:      # if using virtual inertial frame, convert LLA to ECEF xyz
         pos_n = geoparams.lla2ecef(pos_n)
-    idx_high_freq = 0       # data index for imu, nav, mag
+    idx_high_freq = 0       # data index for imu, nav
     idx_low_freq = 0        # data index for gps, odo
-    for i in range(0, motion_def.shape[0]):
+    idx_mag_freq = 0        # data index for mag
+    seg_start = 0           # the first segment to generate
+    if resume is not None:
+        seg_start = resume['seg']
+        sim_count = resume['sim_count']
+        pos_delta_n = np.array(resume['pos_delta_n'])
+        vel_b = np.array(resume['vel_b'])
+        att = np.array(resume['att'])
+        c_nb = attitude.euler2dcm(att, 'zyx').T     # b to n
+        vel_n = c_nb.dot(vel_b)
+        att_dot = np.array(resume['att_dot'])
+        vel_dot_b = np.array(resume['vel_dot_b'])
+        acc_sum = np.array(resume['acc_sum'])
+        gyro_sum = np.array(resume['gyro_sum'])
+        odo_dist = resume['odo_dist']
+        if rk4:
+            report = dict(resume['report'])
+            pos_delta_euler = np.array(resume['pos_delta_euler'])
+
+    def gen_state():
+        '''
+        Generator states at the end of the current chunk.
+        '''
+        state = {'seg': i,
+                 'sim_count': int(sim_count),
+                 'seg_end': seg_end,
+                 'com_complete': int(com_complete),
+                 'com': [np.array(motion_com[0], dtype=float),
+                         np.array(motion_com[1], dtype=float)],
+                 'att_com_filt': np.array(att_com_filt),
+                 'vel_com_b_filt': np.array(vel_com_b_filt),
+                 'pos_delta_n': np.array(pos_delta_n),
+                 'vel_b': np.array(vel_b),
+                 'att': np.array(att),
+                 'att_dot': np.array(att_dot),
+                 'vel_dot_b': np.array(vel_dot_b),
+                 'acc_sum': np.array(acc_sum),
+                 'gyro_sum': np.array(gyro_sum),
+                 'odo_dist': float(odo_dist)}
+        if rk4:
+            state['report'] = dict(report)
+            state['pos_delta_euler'] = np.array(pos_delta_euler)
+        return state
+
+    for i in range(seg_start, motion_def.shape[0]):
         com_type = round(motion_def[i, 0])      # command type of this segment
-        gps_visibility = motion_def[i, 8]       # gps visibility       
-        # get command of this segment
-        '''if i == 2:
-            print("haha")'''
-        motion_com = parse_motion_def(motion_def[i], att, vel_b)
+        gps_visibility = motion_def[i, 8]       # gps visibility
+        if resume is not None and i == seg_start:
+            # continue this segment from the resumed states
+            seg_end = resume['seg_end']
+            com_complete = resume['com_complete']
+            motion_com = resume['com']
+            att_com_filt = np.array(resume['att_com_filt'])
+            vel_com_b_filt = np.array(resume['vel_com_b_filt'])
+        else:
+            # get command of this segment
+            motion_com = parse_motion_def(motion_def[i], att, vel_b)
+            seg_end = sim_count + motion_def[i, 7]  # max cycles to execute command of this seg
+            com_complete = 0                        # complete command of this seg, go to next
+            # initialize the filter states to last att and vel
+            att_com_filt = att
+            vel_com_b_filt = vel_b
         if com_type == 1:
             att_dot_com = motion_com[0]
             vel_dot_com = motion_com[1]
         else:
             att_com = motion_com[0]
             vel_com_b = motion_com[1]
-        # initialize the filter states to last att and vel
-        att_com_filt = att
-        vel_com_b_filt = vel_b
+        # Type 1 commands are open-loop: the filtered Euler angle change rate and body frame
+        # acceleration do not depend on the trajectory. The whole segment is generated in
+        # vectorized blocks instead of step by step, unless it is too short to pay off the
+        # overhead of a block.
+        if com_type == 1 and seg_end - sim_count >= MIN_BLOCK_SIZE:
+            while sim_count < seg_end:
+                # cycles in this block, no more than what fills the rest of this chunk
+                first_output = (-sim_count) % imu_period
+                n_fill = first_output + (chunk_rows-idx_high_freq-1) * imu_period + 1
+                n = int(min(seg_end - sim_count, BLOCK_SIZE, n_fill))
+                blk = const_rate_block(pos_n, pos_delta_n, vel_b, att, att_dot, vel_dot_b,
+                                       odo_dist, att_dot_com, vel_dot_com, alpha, n, dt,
+                                       ref_frame, g, integrator, tol)
+                count = sim_count + np.arange(n)
+                # IMU measurement and navigation results, over sampled IMU data are averaged
+                idx = output_index(sim_count, n, imu_period)
+                m = idx.shape[0]
+                # acc/gyro sums between two outputs, the last sum is carried to the next block
+                starts = np.hstack((0, idx+1))
+                acc_seg_sum = np.add.reduceat(np.vstack((blk['acc'], np.zeros((1, 3)))),
+                                              starts, axis=0)
+                gyro_seg_sum = np.add.reduceat(np.vstack((blk['gyro'], np.zeros((1, 3)))),
+                                               starts, axis=0)
+                acc_seg_sum[0] = acc_sum + acc_seg_sum[0]
+                gyro_seg_sum[0] = gyro_sum + gyro_seg_sum[0]
+                rows = slice(idx_high_freq, idx_high_freq+m)
+                imu_data[rows, 0] = count[idx]
+                imu_data[rows, 1:4] = acc_seg_sum[0:m] / sim_osr
+                imu_data[rows, 4:7] = gyro_seg_sum[0:m] / sim_osr
+                nav_data[rows, 0] = count[idx]
+                nav_data[rows, 1:4] = blk['pos'][idx]
+                nav_data[rows, 4:7] = blk['vel_b'][idx]
+                nav_data[rows, 7:10] = attitude.euler_angle_range_three_axis_batch(
+                    blk['att'][idx])
+                idx_high_freq += m
+                acc_sum = acc_seg_sum[m]
+                gyro_sum = gyro_seg_sum[m]
+                # magnetometer measurement
+                if magnet:
+                    idx = output_index(sim_count, n, mag_period)
+                    m = idx.shape[0]
+                    rows = slice(idx_mag_freq, idx_mag_freq+m)
+                    mag_data[rows, 0] = count[idx]
+                    mag_data[rows, 1:4] = np.einsum('nji,j->ni', blk['c_nb'][idx], geo_mag_n)
+                    idx_mag_freq += m
+                # GPS or odometer measurement
+                if enable_gps_or_odo:
+                    idx = output_index(sim_count, n, low_period)
+                    m = idx.shape[0]
+                    rows = slice(idx_low_freq, idx_low_freq+m)
+                    if low_type == 1:
+                        gps_data[rows, 0] = count[idx]
+                        gps_data[rows, 1:4] = blk['pos'][idx]
+                        gps_data[rows, 4:7] = blk['vel_n'][idx]
+                        gps_data[rows, 7] = gps_visibility
+                    elif low_type == 2:
+                        odo_data[rows, 0] = count[idx]
+                        odo_data[rows, 1] = blk['odo_dist'][idx]
+                        odo_data[rows, 2:5] = blk['vel_b'][idx]
+                    idx_low_freq += m
+                # compare with the position integrated by Euler
+                if rk4:
+                    pos_euler = np.cumsum(np.vstack((pos_delta_euler, blk['pos_dot']*dt)),
+                                          axis=0)
+                    pos_diff = pos_error_meter(pos_n + blk['pos_delta_all'][1:],
+                                               blk['pos_delta_all'][1:] - pos_euler[1:],
+                                               ref_frame)
+                    report['steps'] += int(np.sum(blk['steps']))
+                    report['euler_max_diff'] = max(report['euler_max_diff'], pos_diff.max())
+                    report['euler_end_diff'] = pos_diff[-1]
+                    pos_delta_euler = pos_euler[n]
+                # states at the end of this block
+                pos_delta_n = blk['pos_delta_n']
+                odo_dist = blk['odo_dist'][n]
+                vel_b = blk['vel_b_end']
+                att = blk['att_end']
+                att_dot = blk['att_dot'][n-1]
+                vel_dot_b = blk['vel_dot_b'][n-1]
+                c_nb = attitude.euler2dcm(att, 'zyx').T     # b to n
+                vel_n = c_nb.dot(vel_b)
+                sim_count += n
+                # this chunk is full
+                if idx_high_freq == chunk_rows:
+                    yield output_chunk(imu_data, nav_data, mag_data, gps_data, odo_data,
+                                       idx_high_freq, idx_low_freq, idx_mag_freq, report,
+                                       gen_state())
+                    imu_data, nav_data, mag_data, gps_data, odo_data = alloc_output(*buf_def)
+                    idx_high_freq = 0
+                    idx_low_freq = 0
+                    idx_mag_freq = 0
+            continue
         # generate trajectory according to the command of this segment
-        sim_count_max = sim_count + motion_def[i, 7]    # max cycles to execute command of this seg
-        com_complete = 0                                # complete command of this seg, go to next
+        sim_count_max = seg_end
+        if backend == 'jit' and com_type != 1:
+            ctrl = np.array([alpha, max_acc, max_dw, max_w, kp, kd,
+                             att_converge_threshold, vel_converge_threshold])
+            # the segment is done by the kernel, the loop below will not be executed
+            while (sim_count < sim_count_max) and (com_complete == 0):
+                state = np.hstack((pos_n, pos_delta_n, vel_b, att, att_dot, vel_dot_b, acc_sum,
+                                   gyro_sum, att_com_filt, vel_com_b_filt, odo_dist))
+                # unused outputs are replaced by dummy buffers
+                low_data = np.zeros((1, 8))
+                if low_type == 1:
+                    low_data = gps_data
+                elif low_type == 2:
+                    low_data = odo_data
+                rtn = kernel.closed_loop_segment(
+                    state, np.array(att_com, dtype=float), np.array(vel_com_b, dtype=float),
+                    float(sim_count_max - sim_count), sim_count, dt, imu_period, low_period,
+                    mag_period, low_type, float(gps_visibility), ref_frame, float(g), magnet,
+                    geo_mag_n if magnet else np.zeros(3), ctrl, imu_data, nav_data,
+                    mag_data if magnet else np.zeros((1, 4)), low_data, idx_high_freq,
+                    idx_low_freq, idx_mag_freq)
+                sim_count, idx_high_freq, idx_low_freq, idx_mag_freq, com_complete = rtn
+                pos_delta_n = state[3:6]
+                vel_b = state[6:9]
+                att = state[9:12]
+                att_dot = state[12:15]
+                vel_dot_b = state[15:18]
+                acc_sum = state[18:21]
+                gyro_sum = state[21:24]
+                att_com_filt = state[24:27]
+                vel_com_b_filt = state[27:30]
+                odo_dist = state[30]
+                c_nb = attitude.euler2dcm(att, 'zyx').T     # b to n
+                vel_n = c_nb.dot(vel_b)
+                # the kernel returns when this chunk is full
+                if idx_high_freq == chunk_rows:
+                    yield output_chunk(imu_data, nav_data, mag_data, gps_data, odo_data,
+                                       idx_high_freq, idx_low_freq, idx_mag_freq, report,
+                                       gen_state())
+                    imu_data, nav_data, mag_data, gps_data, odo_data = alloc_output(*buf_def)
+                    idx_high_freq = 0
+                    idx_low_freq = 0
+                    idx_mag_freq = 0
+        # next cycles to output data
+        next_imu = next_output(sim_count, imu_period)
+        next_low = next_output(sim_count, low_period) if enable_gps_or_odo else -1
+        next_mag = next_output(sim_count, mag_period)
         while (sim_count < sim_count_max) and (com_complete == 0):
             # handle the input motion commands
             if com_type == 1:
@@ -233,7 +530,8 @@ def path_gen(ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, mag
             # Write the results. Simulation data are down sampled according to freq specified
             # in output_def.
             # IMU measurement and navigation results
-            if (sim_count % sim_osr) == 0:
+            if sim_count == next_imu:
+                next_imu += imu_period
                 # average over sampled IMU data
                 acc_avg = acc_sum / sim_osr
                 gyro_avg = gyro_sum / sim_osr
@@ -261,20 +559,24 @@ def path_gen(ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, mag
                 # next cycle
                 acc_sum = np.zeros(3)
                 gyro_sum = np.zeros(3)
-                # update magnetometer results and write to file
-                if magnet:
-                    geo_mag_b = c_nb.T.dot(geo_mag_n)
-                    #mag_data[idx_high_freq, :] = np.hstack((idx_high_freq, geo_mag_b))
-                    mag_data[idx_high_freq, 0] = sim_count
-                    mag_data[idx_high_freq, 1] = geo_mag_b[0]
-                    mag_data[idx_high_freq, 2] = geo_mag_b[1]
-                    mag_data[idx_high_freq, 3] = geo_mag_b[2]
                 # index increment
                 idx_high_freq += 1
+            # update magnetometer results and write to file
+            if magnet:
+                if sim_count == next_mag:
+                    next_mag += mag_period
+                    geo_mag_b = c_nb.T.dot(geo_mag_n)
+                    #mag_data[idx_mag_freq, :] = np.hstack((idx_mag_freq, geo_mag_b))
+                    mag_data[idx_mag_freq, 0] = sim_count
+                    mag_data[idx_mag_freq, 1] = geo_mag_b[0]
+                    mag_data[idx_mag_freq, 2] = geo_mag_b[1]
+                    mag_data[idx_mag_freq, 3] = geo_mag_b[2]
+                    idx_mag_freq += 1
             # GPS or odometer measurement
             if enable_gps_or_odo:
-                if (sim_count % output_def[1, 1]) == 0:     # measurement period
-                    if output_def[1, 0] == 1:               # GPS
+                if sim_count == next_low:                   # measurement period
+                    next_low += low_period
+                    if low_type == 1:                       # GPS
                         gps_data[idx_low_freq, 0] = sim_count
                         gps_data[idx_low_freq, 1] = pos_n[0] + pos_delta_n[0]
                         gps_data[idx_low_freq, 2] = pos_n[1] + pos_delta_n[1]
@@ -283,7 +585,7 @@ def path_gen(ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, mag
                         gps_data[idx_low_freq, 5] = vel_n[1]
                         gps_data[idx_low_freq, 6] = vel_n[2]
                         gps_data[idx_low_freq, 7] = gps_visibility
-                    elif output_def[1, 0] == 2:             # odometer
+                    elif low_type == 2:                     # odometer
                         #odo_data[idx_low_freq, :] = np.hstack((idx_low_freq,
                         #                                       odo_dist, odo_vel))
                         odo_data[idx_low_freq, 0] = sim_count
@@ -295,7 +597,21 @@ def path_gen(ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, mag
                     idx_low_freq += 1
 
             # accumulate pos/vel/att change
-            pos_delta_n = pos_delta_n + pos_dot_n*dt    # accumulated pos change
+            if rk4:
+                pos_inc, steps = rk4_pos_step(
+                    (pos_n+pos_delta_n).reshape((1, 3)), vel_b.reshape((1, 3)),
+                    att.reshape((1, 3)), vel_dot_b.reshape((1, 3)), att_dot.reshape((1, 3)),
+                    pos_dot_n.reshape((1, 3)), dt, ref_frame, tol)
+                pos_delta_n = pos_delta_n + pos_inc[0]
+                pos_delta_euler = pos_delta_euler + pos_dot_n*dt
+                pos_diff = pos_error_meter((pos_n+pos_delta_n).reshape((1, 3)),
+                                           (pos_delta_n-pos_delta_euler).reshape((1, 3)),
+                                           ref_frame)[0]
+                report['steps'] += int(steps[0])
+                report['euler_max_diff'] = max(report['euler_max_diff'], pos_diff)
+                report['euler_end_diff'] = pos_diff
+            else:
+                pos_delta_n = pos_delta_n + pos_dot_n*dt    # accumulated pos change
             odo_dist = odo_dist + np.sqrt(np.dot(vel_b, vel_b))*dt
             vel_b = vel_b + vel_dot_b*dt
             att = att + att_dot*dt
@@ -304,21 +620,385 @@ def path_gen(ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, mag
 
             # update simulation counter
             sim_count += 1
+            # this chunk is full
+            if idx_high_freq == chunk_rows:
+                yield output_chunk(imu_data, nav_data, mag_data, gps_data, odo_data,
+                                   idx_high_freq, idx_low_freq, idx_mag_freq, report,
+                                   gen_state())
+                imu_data, nav_data, mag_data, gps_data, odo_data = alloc_output(*buf_def)
+                idx_high_freq = 0
+                idx_low_freq = 0
+                idx_mag_freq = 0
 
         # if command is completed, att_dot and vel_dot should be set to zero
         if com_complete == 1:
             att_dot = np.zeros(3)
             vel_dot_b = np.zeros(3)
-    # return generated data
-    path_results['imu'] = imu_data[0:idx_high_freq, :]
-    path_results['nav'] = nav_data[0:idx_high_freq, :]
+    # the last chunk
+    if idx_high_freq > 0:
+        yield output_chunk(imu_data, nav_data, mag_data, gps_data, odo_data,
+                           idx_high_freq, idx_low_freq, idx_mag_freq, report, gen_state())
+
+def get_plan(motion_def, output_def):
+    """
+    Get the generation plan of motion_def.
+    Args:
+        motion_def: motion commands, or a plan compiled by motion_plan.compile_motion_def
+            with the same output_def.
+        output_def: See doc of function path_gen.
+    Returns:
+        the plan, see motion_plan.compile_motion_def.
+    """
+    if isinstance(motion_def, dict):
+        if not np.array_equal(motion_def['output_def'], output_def):
+            raise ValueError('The motion plan is compiled with a different output_def.')
+        return motion_def
+    return motion_plan.compile_motion_def(motion_def, output_def)
+
+def output_index(sim_count, n, period):
+    """
+    Indices of the output cycles among n simulation cycles starting from sim_count.
+    """
+    return np.arange((-sim_count) % period, n, period)
+
+def next_output(sim_count, period):
+    """
+    The first output cycle not before sim_count.
+    """
+    return sim_count + (-sim_count) % period
+
+def alloc_output(rows, low_type, magnet, imu_period=1, low_period=1, mag_period=1):
+    """
+    Allocate output buffers of path_gen. Buffers of the down sampled data are sized by the
+    max number of their outputs within rows IMU outputs.
+    Args:
+        rows: rows of the IMU and navigation buffers.
+        low_type: 1 for GPS, 2 for odometer, otherwise no GPS or odometer buffer.
+        magnet: True to allocate magnetometer buffer.
+        imu_period, low_period, mag_period: output periods, see motion_plan.output_schedule.
+    Returns:
+        imu_data, nav_data, mag_data, gps_data, odo_data. Unused buffers are None.
+    """
+    imu_data = np.zeros((rows, 7))
+    nav_data = np.zeros((rows, 10))
+    mag_data = None
+    gps_data = None
+    odo_data = None
     if magnet:
-        path_results['mag'] = mag_data[0:idx_high_freq, :]
-    if output_def[1, 0] == 1:
-        path_results['gps'] = gps_data[0:idx_low_freq, :]
-    elif output_def[1, 0] == 2:
-        path_results['odo'] = odo_data[0:idx_low_freq, :]
-    return path_results
+        mag_data = np.zeros(((rows-1) // (mag_period//imu_period) + 1, 4))
+    if low_type == 1:
+        gps_data = np.zeros(((rows-1) // (low_period//imu_period) + 1, 8))
+    elif low_type == 2:
+        odo_data = np.zeros(((rows-1) // (low_period//imu_period) + 1, 5))
+    return imu_data, nav_data, mag_data, gps_data, odo_data
+
+def output_chunk(imu_data, nav_data, mag_data, gps_data, odo_data, idx_high_freq, idx_low_freq,
+                 idx_mag_freq, report=None, state=None):
+    """
+    Pack valid data in the output buffers of path_gen.
+    report is the RK4 integration report, None if RK4 is not used.
+    state is the generator states of path_gen_iter, None if not needed.
+    Returns:
+        a dict of the same form as the return value of path_gen.
+    """
+    chunk = {'status': True,
+             'imu': imu_data[0:idx_high_freq, :],
+             'nav': nav_data[0:idx_high_freq, :],
+             'mag': [],
+             'gps': [],
+             'odo': []}
+    if mag_data is not None:
+        chunk['mag'] = mag_data[0:idx_mag_freq, :]
+    if gps_data is not None:
+        chunk['gps'] = gps_data[0:idx_low_freq, :]
+    elif odo_data is not None:
+        chunk['odo'] = odo_data[0:idx_low_freq, :]
+    if report is not None:
+        chunk['integration'] = dict(report)
+    if state is not None:
+        chunk['state'] = state
+    return chunk
+
+def path_gen_batch(ini_pos_vel_att, motion_def, output_def, mobility, ref_frame=0, magnet=False,
+                   integrator='euler', tol=None):
+    """
+    Generate K trajectories in lock-step. The states of all trajectories are stacked in (K,3)
+    arrays so that the simulation overhead of each step is shared by all trajectories.
+    Trajectories can have different motion definitions and lengths. A trajectory is removed
+    from the batch when all its motion commands are done.
+    Args:
+        ini_pos_vel_att: Kx9 initial states of the K trajectories. See doc of path_gen.
+        motion_def: a list of K motion definitions, or a single motion definition shared by
+            all trajectories. See doc of path_gen. motion_def is not modified.
+        output_def: output definition shared by all trajectories. See doc of path_gen.
+            output_def is not modified.
+        mobility: [max_acceleration, max_angular_acceleration, max_angular_velocity] shared by
+            all trajectories, or Kx3 for each trajectory.
+        ref_frame: See doc of path_gen.
+        magnet: See doc of path_gen.
+        integrator: See doc of path_gen.
+        tol: See doc of path_gen.
+    Returns:
+        a list of K dicts. Each dict is of the same form as the return value of path_gen.
+    """
+    if integrator not in ('euler', 'rk4'):
+        raise ValueError("integrator should be 'euler' or 'rk4', but it is %s."% integrator)
+    rk4 = integrator == 'rk4'
+    ini_pos_vel_att = np.array(ini_pos_vel_att, dtype=float)
+    if ini_pos_vel_att.ndim == 1:
+        ini_pos_vel_att = ini_pos_vel_att.reshape((1, ini_pos_vel_att.shape[0]))
+    nlane = ini_pos_vel_att.shape[0]
+    if isinstance(motion_def, dict) or (isinstance(motion_def, np.ndarray) and\
+                                        motion_def.ndim == 2):
+        motion_def = [motion_def] * nlane
+    if len(motion_def) != nlane:
+        raise ValueError('motion_def should have %s motion definitions, but it has %s.'%\
+                         (nlane, len(motion_def)))
+    mobility = np.array(mobility, dtype=float)
+    if mobility.ndim == 1:
+        mobility = np.tile(mobility, (nlane, 1))
+    output_def = np.array(output_def, dtype=float)
+    ### sim freq and data output freq
+    out_freq = output_def[0, 1]     # IMU output frequency
+    sim_osr = output_def[0, 0]      # simulation over sample ratio w.r.t IMU output freq
+    sim_freq = sim_osr * out_freq   # simulation frequency
+    dt = 1.0 / sim_freq             # simulation period
+    ### Path gen command filter and PD controller, same as path_gen
+    alpha = 0.9
+    max_acc = mobility[:, [0]]
+    max_dw = mobility[:, [1]]
+    max_w = mobility[:, [2]]
+    kp = 5.0
+    kd = 10.0
+    att_converge_threshold = 1e-4
+    vel_converge_threshold = 1e-4
+    ### compile motion commands, segment durations are converted to simulation cycles
+    seg_def = []
+    rows = 0
+    for k in range(nlane):
+        try:
+            plan = get_plan(motion_def[k], output_def)
+        except ValueError as err:
+            raise ValueError('%s-th motion definition: %s'% (k, err))
+        rows = max(rows, plan['imu_rows'])
+        seg_def.append(plan['motion_def'])
+    ### create output arrays
+    imu_period = plan['imu_period']
+    low_type = plan['low_type']
+    low_period = plan['low_period']
+    mag_period = plan['mag_period']
+    imu_data = np.zeros((nlane, rows, 7))
+    nav_data = np.zeros((nlane, rows, 10))
+    if magnet:
+        mag_data = np.zeros((nlane, (rows-1) // (mag_period//imu_period) + 1, 4))
+    if low_type == 1:
+        low_data = np.zeros((nlane, (rows-1) // (low_period//imu_period) + 1, 8))
+    elif low_type == 2:
+        low_data = np.zeros((nlane, (rows-1) // (low_period//imu_period) + 1, 5))
+    n_high = np.zeros(nlane, dtype=int)     # data count of each trajectory
+    n_low = np.zeros(nlane, dtype=int)
+    n_mag = np.zeros(nlane, dtype=int)
+    reports = [None] * nlane                # RK4 integration report of each trajectory
+    ### initialize, states of trajectories still being generated
+    lane = np.arange(nlane)                 # index of each trajectory in the batch
+    pos_n = ini_pos_vel_att[:, 0:3].copy()
+    earth_param = geoparams.geo_param_batch(pos_n)
+    g = earth_param[2]
+    if magnet:
+        geo_mag_n = np.zeros((nlane, 3))
+        gm = geomag.GeoMag("WMM.COF")
+        for k in range(nlane):
+            geo_mag = gm.GeoMag(pos_n[k, 0]/D2R, pos_n[k, 1]/D2R, pos_n[k, 2])
+            geo_mag_n[k] = np.array([geo_mag.bx, geo_mag.by, geo_mag.bz]) / 1000.0
+            if ref_frame == 1:
+                geo_mag_n[k, 0] = math.sqrt(geo_mag_n[k, 0]*geo_mag_n[k, 0] +\
+                                            geo_mag_n[k, 1]*geo_mag_n[k, 1])
+                geo_mag_n[k, 1] = 0.0
+    if ref_frame == 1:
+        pos_n = geoparams.lla2ecef_batch(pos_n).reshape((nlane, 3))
+    st = {'pos_n': pos_n,
+          'pos_delta_n': np.zeros((nlane, 3)),
+          'vel_b': ini_pos_vel_att[:, 3:6].copy(),
+          'att': ini_pos_vel_att[:, 6:9].copy(),
+          'att_dot': np.zeros((nlane, 3)),
+          'vel_dot_b': np.zeros((nlane, 3)),
+          'acc_sum': np.zeros((nlane, 3)),
+          'gyro_sum': np.zeros((nlane, 3)),
+          'odo_dist': np.zeros(nlane),
+          # command of the current segment, rate command for type 1, target for others
+          'att_com': np.zeros((nlane, 3)),
+          'vel_com_b': np.zeros((nlane, 3)),
+          'att_com_filt': np.zeros((nlane, 3)),
+          'vel_com_b_filt': np.zeros((nlane, 3)),
+          'closed_loop': np.zeros(nlane, dtype=bool),
+          'gps_visibility': np.zeros(nlane),
+          'seg': -np.ones(nlane, dtype=int),
+          'seg_end': np.zeros(nlane),
+          'g': g,
+          'max_acc': max_acc,
+          'max_dw': max_dw,
+          'max_w': max_w}
+    if rk4:
+        st['pos_delta_euler'] = np.zeros((nlane, 3))
+        st['steps'] = np.zeros(nlane, dtype=int)
+        st['euler_max_diff'] = np.zeros(nlane)
+        st['euler_end_diff'] = np.zeros(nlane)
+    if magnet:
+        st['geo_mag_n'] = geo_mag_n
+    st['c_nb'] = attitude.euler2dcm_batch(st['att']).transpose((0, 2, 1))
+    st['vel_n'] = np.einsum('nij,nj->ni', st['c_nb'], st['vel_b'])
+    ### start trajectory generation
+    sim_count = 0
+    idx_high_freq = 0
+    idx_low_freq = 0
+    idx_mag_freq = 0
+    next_imu = 0                            # next cycles to output data
+    next_low = 0
+    next_mag = 0
+    done = np.ones(nlane, dtype=bool)       # trajectories that need the next segment
+    complete = np.zeros(nlane, dtype=bool)  # closed-loop commands completed in this step
+    while True:
+        # go to the next segment
+        finished = np.zeros(lane.shape[0], dtype=bool)
+        for j in np.nonzero(done)[0]:
+            k = lane[j]
+            # if command is completed, att_dot and vel_dot should be set to zero
+            if complete[j]:
+                st['att_dot'][j] = 0.0
+                st['vel_dot_b'][j] = 0.0
+            # skip segments of zero duration
+            i = st['seg'][j] + 1
+            while i < seg_def[k].shape[0] and seg_def[k][i, 7] == 0:
+                i += 1
+            st['seg'][j] = i
+            if i == seg_def[k].shape[0]:
+                finished[j] = True
+                n_high[k] = idx_high_freq
+                n_low[k] = idx_low_freq
+                n_mag[k] = idx_mag_freq
+                if rk4:
+                    reports[k] = {'steps': int(st['steps'][j]),
+                                  'euler_max_diff': st['euler_max_diff'][j],
+                                  'euler_end_diff': st['euler_end_diff'][j]}
+                continue
+            motion_com = parse_motion_def(seg_def[k][i], st['att'][j], st['vel_b'][j])
+            st['att_com'][j] = motion_com[0]
+            st['vel_com_b'][j] = motion_com[1]
+            st['closed_loop'][j] = round(seg_def[k][i, 0]) != 1
+            st['gps_visibility'][j] = seg_def[k][i, 8]
+            st['seg_end'][j] = sim_count + seg_def[k][i, 7]
+            # initialize the filter states to last att and vel
+            st['att_com_filt'][j] = st['att'][j]
+            st['vel_com_b_filt'][j] = st['vel_b'][j]
+        # remove finished trajectories from the batch
+        if finished.any():
+            keep = ~finished
+            lane = lane[keep]
+            for i in st:
+                st[i] = st[i][keep]
+        if lane.shape[0] == 0:
+            break
+        closed_loop = st['closed_loop'][:, np.newaxis]
+        # handle the input motion commands
+        att_dot = alpha*st['att_dot'] + (1-alpha)*st['att_com']
+        vel_dot_b = alpha*st['vel_dot_b'] + (1-alpha)*st['vel_com_b']
+        st['att_com_filt'] = np.where(closed_loop,
+                                      alpha*st['att_com_filt'] + (1-alpha)*st['att_com'],
+                                      st['att_com_filt'])
+        st['vel_com_b_filt'] = np.where(closed_loop,
+                                        alpha*st['vel_com_b_filt'] + (1-alpha)*st['vel_com_b'],
+                                        st['vel_com_b_filt'])
+        # PD controller for closed-loop commands
+        vel_dot_cl = (st['vel_com_b_filt'] - st['vel_b']) / dt
+        vel_dot_cl = np.clip(vel_dot_cl, -st['max_acc'], st['max_acc'])
+        att_dot_dot = kp*(st['att_com'] - st['att']) + kd*(0 - st['att_dot'])
+        att_dot_dot = np.clip(att_dot_dot, -st['max_dw'], st['max_dw'])
+        att_dot_cl = np.clip(st['att_dot'] + att_dot_dot*dt, -st['max_w'], st['max_w'])
+        att_err = st['att'] - st['att_com']
+        vel_err = st['vel_b'] - st['vel_com_b']
+        complete = st['closed_loop'] &\
+                   (np.sqrt(np.sum(att_err*att_err, axis=1)) < att_converge_threshold) &\
+                   (np.sqrt(np.sum(vel_err*vel_err, axis=1)) < vel_converge_threshold)
+        st['att_dot'] = np.where(closed_loop, att_dot_cl, att_dot)
+        st['vel_dot_b'] = np.where(closed_loop, vel_dot_cl, vel_dot_b)
+        # compute IMU outputs according to pos/vel/att changes
+        pos = st['pos_n'] + st['pos_delta_n']
+        imu_results = calc_true_sensor_output_batch(pos, st['vel_b'], st['att'], st['c_nb'],
+                                                    st['vel_dot_b'], st['att_dot'],
+                                                    ref_frame, st['g'])
+        st['acc_sum'] = st['acc_sum'] + imu_results[0]
+        st['gyro_sum'] = st['gyro_sum'] + imu_results[1]
+        # write the results
+        if sim_count == next_imu:
+            next_imu += imu_period
+            imu_data[lane, idx_high_freq, 0] = sim_count
+            imu_data[lane, idx_high_freq, 1:4] = st['acc_sum'] / sim_osr
+            imu_data[lane, idx_high_freq, 4:7] = st['gyro_sum'] / sim_osr
+            nav_data[lane, idx_high_freq, 0] = sim_count
+            nav_data[lane, idx_high_freq, 1:4] = pos
+            nav_data[lane, idx_high_freq, 4:7] = st['vel_b']
+            nav_data[lane, idx_high_freq, 7:10] =\
+                attitude.euler_angle_range_three_axis_batch(st['att'])
+            st['acc_sum'] = np.zeros((lane.shape[0], 3))
+            st['gyro_sum'] = np.zeros((lane.shape[0], 3))
+            idx_high_freq += 1
+        if magnet and sim_count == next_mag:
+            next_mag += mag_period
+            mag_data[lane, idx_mag_freq, 0] = sim_count
+            mag_data[lane, idx_mag_freq, 1:4] = np.einsum('nji,nj->ni', st['c_nb'],
+                                                          st['geo_mag_n'])
+            idx_mag_freq += 1
+        if low_type != 0 and sim_count == next_low:
+            next_low += low_period
+            low_data[lane, idx_low_freq, 0] = sim_count
+            if low_type == 1:
+                low_data[lane, idx_low_freq, 1:4] = pos
+                low_data[lane, idx_low_freq, 4:7] = st['vel_n']
+                low_data[lane, idx_low_freq, 7] = st['gps_visibility']
+            else:
+                low_data[lane, idx_low_freq, 1] = st['odo_dist']
+                low_data[lane, idx_low_freq, 2:5] = st['vel_b']
+            idx_low_freq += 1
+        # accumulate pos/vel/att change
+        if rk4:
+            pos_inc, steps = rk4_pos_step(pos, st['vel_b'], st['att'], st['vel_dot_b'],
+                                          st['att_dot'], imu_results[3], dt, ref_frame, tol)
+            st['pos_delta_n'] = st['pos_delta_n'] + pos_inc
+            st['pos_delta_euler'] = st['pos_delta_euler'] + imu_results[3]*dt
+            pos_diff = pos_error_meter(st['pos_n'] + st['pos_delta_n'],
+                                       st['pos_delta_n'] - st['pos_delta_euler'], ref_frame)
+            st['steps'] = st['steps'] + steps
+            st['euler_max_diff'] = np.maximum(st['euler_max_diff'], pos_diff)
+            st['euler_end_diff'] = pos_diff
+        else:
+            st['pos_delta_n'] = st['pos_delta_n'] + imu_results[3]*dt
+        st['odo_dist'] = st['odo_dist'] + np.sqrt(np.sum(st['vel_b']*st['vel_b'], axis=1))*dt
+        st['vel_b'] = st['vel_b'] + st['vel_dot_b']*dt
+        st['att'] = st['att'] + st['att_dot']*dt
+        st['c_nb'] = attitude.euler2dcm_batch(st['att']).transpose((0, 2, 1))
+        st['vel_n'] = np.einsum('nij,nj->ni', st['c_nb'], st['vel_b'])
+        # update simulation counter
+        sim_count += 1
+        done = complete | (sim_count >= st['seg_end'])
+    ### return generated data
+    results = []
+    for k in range(nlane):
+        path_results = {'status': True,
+                        'imu': imu_data[k, 0:n_high[k], :],
+                        'nav': nav_data[k, 0:n_high[k], :],
+                        'mag': [],
+                        'gps': [],
+                        'odo': []}
+        if magnet:
+            path_results['mag'] = mag_data[k, 0:n_mag[k], :]
+        if low_type == 1:
+            path_results['gps'] = low_data[k, 0:n_low[k], :]
+        elif low_type == 2:
+            path_results['odo'] = low_data[k, 0:n_low[k], :]
+        if rk4:
+            path_results['integration'] = reports[k]
+        results.append(path_results)
+    return results
 
 def calc_true_sensor_output(pos_n, vel_b, att, c_nb, vel_dot_b, att_dot, ref_frame, g):
     """
@@ -402,6 +1082,321 @@ def calc_true_sensor_output(pos_n, vel_b, att, c_nb, vel_dot_b, att_dot, ref_fra
     acc = vel_dot_b + attitude.cross3(w_ie_b+gyro, vel_b) - c_nb.T.dot(gravity)
     return acc, gyro, vel_dot_n, pos_dot_n
 
+def calc_true_sensor_output_batch(pos_n, vel_b, att, c_nb, vel_dot_b, att_dot, ref_frame, g):
+    """
+    Calculate true IMU results from a series of attitude change rate and velocity change rate.
+    This is the vectorized version of calc_true_sensor_output.
+    Args:
+        pos_n: nx3 position. For NED, it is the absolute LLA position. Otherwise, it is relative
+            motion.
+        vel_b: nx3 velocity in the body frame, m/s.
+        att: nx3 Euler angles, [yaw pitch roll], rot seq is ZYX, rad.
+        c_nb: nx3x3 transformation matrices from b to n corresponding to att.
+        vel_dot_b: nx3 velocity change rate in the body frame, m/s/s
+        att_dot: nx3 Euler angle change rate, [yaw_d, pitch_d, roll_d], rad/s
+        ref_frame: See doc of function PathGen.
+        g: Gravity, only used when ref_frame==1, m/s/s.
+    Returns:
+        [0]: nx3 true accelerometer output in the body frame, m/s/s
+        [1]: nx3 true gyro output in the body frame, rad/s
+        [2]: nx3 velocity change rate in the navigation frame, m/s/s
+        [3]: nx3 position change rate in the navigation frame, m/s
+    """
+    n = pos_n.shape[0]
+    # velocity in N
+    vel_n = np.einsum('nij,nj->ni', c_nb, vel_b)
+    # rotation rate of n w.r.t e in n and e w.r.t i in n
+    w_en_n = np.zeros((n, 3))
+    w_ie_n = np.zeros((n, 3))
+    gravity = np.zeros((n, 3))
+    if ref_frame == 0:
+        rm, rn, g, sl, cl, w_ie = geoparams.geo_param_batch(pos_n)
+        rm_effective = rm + pos_n[:, 2]
+        rn_effective = rn + pos_n[:, 2]
+        gravity[:, 2] = g
+        w_en_n[:, 0] = vel_n[:, 1] / rn_effective              # wN
+        w_en_n[:, 1] = -vel_n[:, 0] / rm_effective             # wE
+        w_en_n[:, 2] = -vel_n[:, 1] * sl /cl / rn_effective    # wD
+        w_ie_n[:, 0] = w_ie * cl
+        w_ie_n[:, 2] = -w_ie * sl
+    else:
+        gravity[:, 2] = g
+    # rotation rate of b w.r.t n expressed in n, from Euler angle derivative, ZYX rot seq.
+    sh = np.sin(att[:, 0])
+    ch = np.cos(att[:, 0])
+    w_nb_n = np.zeros((n, 3))
+    w_nb_n[:, 0] = -sh*att_dot[:, 1] + c_nb[:, 0, 0]*att_dot[:, 2]
+    w_nb_n[:, 1] = ch*att_dot[:, 1] + c_nb[:, 1, 0]*att_dot[:, 2]
+    w_nb_n[:, 2] = att_dot[:, 0] + c_nb[:, 2, 0]*att_dot[:, 2]
+    # Velocity derivative
+    vel_dot_n = np.einsum('nij,nj->ni', c_nb, vel_dot_b) +\
+                attitude.cross3_batch(w_nb_n, vel_n)
+    # Position derivative
+    if ref_frame == 0:
+        pos_dot_n = np.zeros((n, 3))
+        pos_dot_n[:, 0] = vel_n[:, 0] / rm_effective        # Lat
+        pos_dot_n[:, 1] = vel_n[:, 1] / rn_effective / cl   # Lon
+        pos_dot_n[:, 2] = -vel_n[:, 2]                      # Alt
+    else:
+        pos_dot_n = vel_n.copy()
+    # Gyroscope output
+    gyro = np.einsum('nji,nj->ni', c_nb, w_nb_n + w_en_n + w_ie_n)
+    # Acceleration output
+    w_ie_b = np.einsum('nji,nj->ni', c_nb, w_ie_n)
+    acc = vel_dot_b + attitude.cross3_batch(w_ie_b+gyro, vel_b) -\
+          np.einsum('nji,nj->ni', c_nb, gravity)
+    return acc, gyro, vel_dot_n, pos_dot_n
+
+def const_rate_block(pos_n, pos_delta_n, vel_b, att, att_dot, vel_dot_b, odo_dist,
+                     att_dot_com, vel_dot_com, alpha, n, dt, ref_frame, g,
+                     integrator='euler', tol=None):
+    """
+    Generate n simulation cycles of a motion segment of type 1 in one vectorized block.
+    Euler angle change rate and body frame acceleration commands of type 1 are constant and
+    only low-pass filtered, so the trajectory does not depend on any feedback. The filter
+    transient is computed exactly as path_gen does step by step, attitude and velocity are
+    accumulated by cumulative sums, and position is accumulated by fixed-point iteration
+    of the position change rate (which depends on position only through the Earth radii
+    when ref_frame==0).
+    Once the filtered rates settle at zero, attitude and velocity do not change any more. If
+    the velocity is also zero, or ref_frame==1, true sensor outputs do not change either, and
+    the rest of the block is filled with the first steady cycle instead of being computed.
+    Results equal those of the step-by-step loop within a relative tolerance of about 1e-12
+    (differences only come from rounding of vectorized math).
+    Args:
+        pos_n: 3x1 initial position, see path_gen. The position at each cycle is pos_n+pos_delta.
+        pos_delta_n: 3x1 position change accumulated before this block.
+        vel_b: 3x1 velocity in the body frame at the start of this block, m/s.
+        att: 3x1 Euler angles at the start of this block, rad.
+        att_dot: 3x1 filtered Euler angle change rate of the last cycle, rad/s.
+        vel_dot_b: 3x1 filtered body frame acceleration of the last cycle, m/s/s.
+        odo_dist: travel distance accumulated before this block, m.
+        att_dot_com: 3x1 Euler angle change rate command, rad/s.
+        vel_dot_com: 3x1 body frame acceleration command, m/s/s.
+        alpha: coefficient of the command low pass filter.
+        n: number of simulation cycles in this block.
+        dt: simulation period, sec.
+        ref_frame: See doc of function PathGen.
+        g: Gravity, only used when ref_frame==1, m/s/s.
+        integrator: 'euler' or 'rk4', see path_gen.
+        tol: position error tolerance of each RK4 step, see path_gen.
+    Returns:
+        a dict containing states at each cycle of this block:
+            'pos': nx3 position, 'vel_b': nx3 body frame velocity, 'att': nx3 Euler angles,
+            'c_nb': nx3x3 DCM from b to n, 'vel_n': nx3 velocity in the navigation frame,
+            'att_dot': nx3 Euler angle change rate, 'vel_dot_b': nx3 body frame acceleration,
+            'acc': nx3 true accel output, 'gyro': nx3 true gyro output,
+            'odo_dist': (n+1,) travel distance, the last one is after this block,
+            'pos_dot': nx3 position change rate,
+            'pos_delta_all': (n+1)x3 accumulated position change, the last one is after
+                this block,
+            'steps': (n,) number of RK4 steps in each cycle (0 for Euler),
+        and states after the last cycle of this block:
+            'pos_delta_n': 3x1 accumulated position change,
+            'vel_b_end': 3x1 velocity in the body frame,
+            'att_end': 3x1 Euler angles.
+    """
+    a = alpha
+    b = 1 - alpha
+    att_dot_com = np.array(att_dot_com, dtype=float)
+    vel_dot_com = np.array(vel_dot_com, dtype=float)
+    ### filtered commands. The filter transient is iterated until it reaches a fixed point.
+    att_dot_all = np.zeros((n, 3))
+    vel_dot_all = np.zeros((n, 3))
+    x = np.array(att_dot, dtype=float)
+    y = np.array(vel_dot_b, dtype=float)
+    k = 0
+    settled = False
+    while k < n:
+        x_next = a*x + b*att_dot_com
+        y_next = a*y + b*vel_dot_com
+        att_dot_all[k] = x_next
+        vel_dot_all[k] = y_next
+        k += 1
+        if np.array_equal(x_next, x) and np.array_equal(y_next, y):
+            settled = True
+            break
+        x = x_next
+        y = y_next
+    att_dot_all[k:] = x_next
+    vel_dot_all[k:] = y_next
+    ### attitude and velocity
+    att_all = np.cumsum(np.vstack((att, att_dot_all*dt)), axis=0)
+    vel_b_all = np.cumsum(np.vstack((vel_b, vel_dot_all*dt)), axis=0)
+    ### cycles to compute, the rest are the same as the last computed one
+    n_eval = n
+    if settled and not (x_next.any() or y_next.any()):
+        # attitude and velocity are constant from the (k-1)-th cycle on
+        if ref_frame == 1 or not vel_b_all[k-1].any():
+            n_eval = k
+    c_nb = attitude.euler2dcm_batch(att_all[0:n_eval]).transpose((0, 2, 1))  # b to n
+    vel_n = np.einsum('nij,nj->ni', c_nb, vel_b_all[0:n_eval])
+    ### position
+    steps = np.zeros(n_eval, dtype=int)
+    if ref_frame == 0:
+        # position change rate depends on position through Earth radii.
+        pos_delta_all = np.tile(pos_delta_n, (n_eval+1, 1))
+        for _ in range(20):
+            pos = pos_n + pos_delta_all[0:n_eval]
+            earth_param = geoparams.geo_param_batch(pos)
+            pos_dot_n = np.zeros((n_eval, 3))
+            pos_dot_n[:, 0] = vel_n[:, 0] / (earth_param[0] + pos[:, 2])
+            pos_dot_n[:, 1] = vel_n[:, 1] / (earth_param[1] + pos[:, 2]) / earth_param[4]
+            pos_dot_n[:, 2] = -vel_n[:, 2]
+            if integrator == 'rk4':
+                pos_inc, steps = rk4_pos_step(pos, vel_b_all[0:n_eval], att_all[0:n_eval],
+                                              vel_dot_all[0:n_eval], att_dot_all[0:n_eval],
+                                              pos_dot_n, dt, ref_frame, tol)
+            else:
+                pos_inc = pos_dot_n*dt
+            pos_delta_next = np.cumsum(np.vstack((pos_delta_n, pos_inc)), axis=0)
+            converged = np.array_equal(pos_delta_next, pos_delta_all)
+            pos_delta_all = pos_delta_next
+            if converged:
+                break
+        # velocity of the steady cycles is zero
+        pos_delta_all = fill_rows(pos_delta_all, n+1)
+    else:
+        pos_dot_n = vel_n
+        if integrator == 'rk4':
+            pos_inc, steps = rk4_pos_step(pos_n + np.zeros((n_eval, 3)), vel_b_all[0:n_eval],
+                                          att_all[0:n_eval], vel_dot_all[0:n_eval],
+                                          att_dot_all[0:n_eval], pos_dot_n, dt, ref_frame, tol)
+        else:
+            pos_inc = vel_n*dt
+        pos_delta_all = np.cumsum(np.vstack((pos_delta_n, fill_rows(pos_inc, n))), axis=0)
+    pos = pos_n + pos_delta_all[0:n]
+    ### true sensor output
+    imu_results = calc_true_sensor_output_batch(pos[0:n_eval], vel_b_all[0:n_eval],
+                                                att_all[0:n_eval], c_nb, vel_dot_all[0:n_eval],
+                                                att_dot_all[0:n_eval], ref_frame, g)
+    ### travel distance
+    v = vel_b_all[0:n]
+    odo_dist = np.cumsum(np.hstack((odo_dist, np.sqrt(v[:, 0]*v[:, 0] + v[:, 1]*v[:, 1] +
+                                                 v[:, 2]*v[:, 2])*dt)))
+    return {'pos': pos,
+            'vel_b': vel_b_all[0:n],
+            'att': att_all[0:n],
+            'c_nb': fill_rows(c_nb, n),
+            'vel_n': fill_rows(vel_n, n),
+            'att_dot': att_dot_all,
+            'vel_dot_b': vel_dot_all,
+            'acc': fill_rows(imu_results[0], n),
+            'gyro': fill_rows(imu_results[1], n),
+            'odo_dist': odo_dist,
+            'pos_dot': fill_rows(pos_dot_n, n),
+            'pos_delta_all': pos_delta_all,
+            'steps': fill_rows(steps, n),
+            'pos_delta_n': pos_delta_all[n],
+            'vel_b_end': vel_b_all[n],
+            'att_end': att_all[n]}
+
+def fill_rows(x, n):
+    """
+    Extend x to n rows by repeating its last row.
+    Args:
+        x: numpy array of size (m, ...), m <= n.
+        n: number of rows.
+    Returns:
+        numpy array of size (n, ...). x itself if m == n.
+    """
+    m = x.shape[0]
+    if m == n:
+        return x
+    y = np.empty((n,) + x.shape[1:], dtype=x.dtype)
+    y[0:m] = x
+    y[m:] = x[m-1]
+    return y
+
+def pos_rate_batch(pos_n, vel_b, att, ref_frame):
+    """
+    Position change rate, the same as that in calc_true_sensor_output.
+    Args:
+        pos_n: nx3 position, see calc_true_sensor_output.
+        vel_b: nx3 velocity in the body frame, m/s.
+        att: nx3 Euler angles, [yaw pitch roll], rot seq is ZYX, rad.
+        ref_frame: See doc of function PathGen.
+    Returns:
+        nx3 position change rate in the navigation frame.
+    """
+    c_nb = attitude.euler2dcm_batch(att).transpose((0, 2, 1))  # b to n
+    vel_n = np.einsum('nij,nj->ni', c_nb, vel_b)
+    if ref_frame != 0:
+        return vel_n
+    earth_param = geoparams.geo_param_batch(pos_n)
+    pos_dot_n = np.zeros(vel_n.shape)
+    pos_dot_n[:, 0] = vel_n[:, 0] / (earth_param[0] + pos_n[:, 2])
+    pos_dot_n[:, 1] = vel_n[:, 1] / (earth_param[1] + pos_n[:, 2]) / earth_param[4]
+    pos_dot_n[:, 2] = -vel_n[:, 2]
+    return pos_dot_n
+
+def pos_error_meter(pos_n, pos_err, ref_frame):
+    """
+    Convert position errors to distances in meters.
+    Args:
+        pos_n: nx3 position where the errors are, see calc_true_sensor_output.
+        pos_err: nx3 position errors, [rad rad m] if ref_frame==0, else [m m m].
+        ref_frame: See doc of function PathGen.
+    Returns:
+        (n,) distances, m.
+    """
+    err = pos_err
+    if ref_frame == 0:
+        earth_param = geoparams.geo_param_batch(pos_n)
+        err = np.zeros(pos_err.shape)
+        err[:, 0] = pos_err[:, 0] * (earth_param[0] + pos_n[:, 2])
+        err[:, 1] = pos_err[:, 1] * (earth_param[1] + pos_n[:, 2]) * earth_param[4]
+        err[:, 2] = pos_err[:, 2]
+    return np.sqrt(np.sum(err*err, axis=1))
+
+def rk4_pos_step(pos_n, vel_b, att, vel_dot_b, att_dot, pos_dot_n, h, ref_frame, tol=None,
+                 depth=0):
+    """
+    Position change of n simulation cycles integrated by RK4. Within a cycle, body frame
+    velocity and Euler angles change linearly at the rates vel_dot_b and att_dot.
+    If tol is not None, the error of each step is estimated by the difference between RK4
+    and the embedded midpoint rule. Steps with a larger error than tol are halved.
+    Args:
+        pos_n: nx3 position at the start of each cycle, see calc_true_sensor_output.
+        vel_b: nx3 velocity in the body frame at the start of each cycle, m/s.
+        att: nx3 Euler angles at the start of each cycle, rad.
+        vel_dot_b: nx3 body frame acceleration in each cycle, m/s/s.
+        att_dot: nx3 Euler angle change rate in each cycle, rad/s.
+        pos_dot_n: nx3 position change rate at the start of each cycle.
+        h: step, sec.
+        ref_frame: See doc of function PathGen.
+        tol: position error tolerance of each step, m.
+        depth: times the step has been halved.
+    Returns:
+        pos_inc: nx3 position change in each cycle.
+        steps: (n,) number of RK4 steps in each cycle.
+    """
+    half = 0.5 * h
+    vel_mid = vel_b + vel_dot_b*half
+    att_mid = att + att_dot*half
+    k2 = pos_rate_batch(pos_n + pos_dot_n*half, vel_mid, att_mid, ref_frame)
+    k3 = pos_rate_batch(pos_n + k2*half, vel_mid, att_mid, ref_frame)
+    k4 = pos_rate_batch(pos_n + k3*h, vel_b + vel_dot_b*h, att + att_dot*h, ref_frame)
+    pos_inc = (pos_dot_n + 2.0*k2 + 2.0*k3 + k4) * (h/6.0)
+    steps = np.ones(pos_n.shape[0], dtype=int)
+    if tol is None or depth >= MAX_SPLIT:
+        return pos_inc, steps
+    # halve steps whose error estimate is above tol
+    err = pos_error_meter(pos_n, pos_inc - k2*h, ref_frame)
+    idx = np.where(err > tol)[0]
+    if idx.shape[0] > 0:
+        inc_1, steps_1 = rk4_pos_step(pos_n[idx], vel_b[idx], att[idx], vel_dot_b[idx],
+                                      att_dot[idx], pos_dot_n[idx], half, ref_frame, tol,
+                                      depth+1)
+        pos_mid = pos_n[idx] + inc_1
+        pos_dot_mid = pos_rate_batch(pos_mid, vel_mid[idx], att_mid[idx], ref_frame)
+        inc_2, steps_2 = rk4_pos_step(pos_mid, vel_mid[idx], att_mid[idx], vel_dot_b[idx],
+                                      att_dot[idx], pos_dot_mid, half, ref_frame, tol,
+                                      depth+1)
+        pos_inc[idx] = inc_1 + inc_2
+        steps[idx] = steps_1 + steps_2
+    return pos_inc, steps
+
 def parse_motion_def(motion_def_seg, att, vel):
     """
     Parse the command of a segment in motion_def.
@@ -430,7 +1425,8 @@ def parse_motion_def(motion_def_seg, att, vel):
         vel_com = [motion_def_seg[4], motion_def_seg[5], motion_def_seg[6]]
     return att_com, vel_com
 
-def acc_gen(fs, ref_a, acc_err, vib_def=None):
+def acc_gen(fs, ref_a, acc_err, vib_def=None, state=None, drift_method='vectorized', rng=None,
+            stages=None):
     """
     Add error to true acc data according to acclerometer model parameters
     Args:
@@ -440,6 +1436,7 @@ def acc_gen(fs, ref_a, acc_err, vib_def=None):
             'b': 3x1 acc constant bias, m/s2.
             'b_drift': 3x1 acc bias drift, m/s2.
             'vrw': 3x1 velocity random walk, m/s2/root-Hz.
+            'k': optional 3x1 scale factor error, measured = (1+k) * true.
         vib_def: Vibration model and parameters. Vibration type can be random, sinunoida or
             specified by single-sided PSD.
             Generated vibrating acc is expressed in the body frame.
@@ -454,45 +1451,27 @@ def acc_gen(fs, ref_a, acc_err, vib_def=None):
                 'x': x axis, in unit of m2/s4/Hz.
                 'y': y axis, in unit of m2/s4/Hz.
                 'z': z axis, in unit of m2/s4/Hz.
+        state: a dict to generate data chunk by chunk. It is updated in place so that the next
+            call continues from the end of this chunk. Use an empty dict for the first chunk.
+            None to generate all data in one call.
+        drift_method: how the bias drift is generated, see bias_drift.
+        rng: a numpy.random.Generator to draw random numbers from. None (default) to use the
+            global random state of numpy.random.
+        stages: a list of error stages applied in order, see run_stages. None (default) to
+            use ACC_STAGES.
     Returns:
         a_mea: nx3 measured acc data
     """
-    dt = 1.0/fs
-    # total data count
-    n = ref_a.shape[0]
-    ## simulate sensor error
-    # static bias
-    acc_bias = acc_err['b']
-    # bias drift
-    acc_bias_drift = bias_drift(acc_err['b_corr'], acc_err['b_drift'], n, fs)
-    # vibrating acceleration
-    acc_vib = np.zeros((n, 3))
-    if vib_def is not None:
-        if vib_def['type'].lower() == 'psd':
-            acc_vib[:, 0] = time_series_from_psd.time_series_from_psd(vib_def['x'],
-                                                                      vib_def['freq'], fs, n)[1]
-            acc_vib[:, 1] = time_series_from_psd.time_series_from_psd(vib_def['y'],
-                                                                      vib_def['freq'], fs, n)[1]
-            acc_vib[:, 2] = time_series_from_psd.time_series_from_psd(vib_def['z'],
-                                                                      vib_def['freq'], fs, n)[1]
-        elif vib_def['type'] == 'random':
-            acc_vib[:, 0] = vib_def['x'] * np.random.randn(n)
-            acc_vib[:, 1] = vib_def['y'] * np.random.randn(n)
-            acc_vib[:, 2] = vib_def['z'] * np.random.randn(n)
-        elif vib_def['type'] == 'sinusoidal':
-            acc_vib[:, 0] = vib_def['x'] * np.sin(2.0*math.pi*vib_def['freq']*dt*np.arange(n))
-            acc_vib[:, 1] = vib_def['y'] * np.sin(2.0*math.pi*vib_def['freq']*dt*np.arange(n))
-            acc_vib[:, 2] = vib_def['z'] * np.sin(2.0*math.pi*vib_def['freq']*dt*np.arange(n))
-    # accelerometer white noise
-    acc_noise = np.random.randn(n, 3)
-    acc_noise[:, 0] = acc_err['vrw'][0] / math.sqrt(dt) * acc_noise[:, 0]
-    acc_noise[:, 1] = acc_err['vrw'][1] / math.sqrt(dt) * acc_noise[:, 1]
-    acc_noise[:, 2] = acc_err['vrw'][2] / math.sqrt(dt) * acc_noise[:, 2]
-    # true + constant_bias + bias_drift + noise
-    a_mea = ref_a + acc_bias + acc_bias_drift + acc_noise + acc_vib
+    # true + constant_bias + bias_drift + vibration + noise, accumulated in a_mea
+    a_mea = np.array(ref_a, dtype=float)
+    if stages is None:
+        stages = ACC_STAGES
+    ctx = error_context(fs, acc_err, 'vrw', vib_def, state, drift_method,
+                        None if rng is None else [rng])
+    run_stages(stages, a_mea[np.newaxis], ctx)
     return a_mea
 
-def gyro_gen(fs, ref_w, gyro_err):
+def gyro_gen(fs, ref_w, gyro_err, state=None, drift_method='vectorized', rng=None, stages=None):
     """
     Add error to true gyro data according to gyroscope model parameters
     Args:
@@ -502,27 +1481,27 @@ def gyro_gen(fs, ref_w, gyro_err):
             'b': 3x1 constant gyro bias, rad/s.
             'b_drift': 3x1 gyro bias drift, rad/s.
             'arw': 3x1 angle random walk, rad/s/root-Hz.
+            'k': optional 3x1 scale factor error, see acc_gen.
+        state: a dict to generate data chunk by chunk. It is updated in place so that the next
+            call continues from the end of this chunk. Use an empty dict for the first chunk.
+            None to generate all data in one call.
+        drift_method: how the bias drift is generated, see bias_drift.
+        rng: a numpy.random.Generator, see acc_gen.
+        stages: a list of error stages applied in order, see run_stages. None (default) to
+            use GYRO_STAGES.
     Returns:
         w_mea: nx3 measured gyro data
     """
-    dt = 1.0/fs
-    # total data count
-    n = ref_w.shape[0]
-    ## simulate sensor error
-    # static bias
-    gyro_bias = gyro_err['b']
-    # bias drift Todo: first-order Gauss-Markov model
-    gyro_bias_drift = bias_drift(gyro_err['b_corr'], gyro_err['b_drift'], n, fs)
-    # gyroscope white noise
-    gyro_noise = np.random.randn(n, 3)
-    gyro_noise[:, 0] = gyro_err['arw'][0] / math.sqrt(dt) * gyro_noise[:, 0]
-    gyro_noise[:, 1] = gyro_err['arw'][1] / math.sqrt(dt) * gyro_noise[:, 1]
-    gyro_noise[:, 2] = gyro_err['arw'][2] / math.sqrt(dt) * gyro_noise[:, 2]
-    # true + constant_bias + bias_drift + noise
-    w_mea = ref_w + gyro_bias + gyro_bias_drift + gyro_noise
+    # true + constant_bias + bias_drift + noise, accumulated in w_mea
+    w_mea = np.array(ref_w, dtype=float)
+    if stages is None:
+        stages = GYRO_STAGES
+    ctx = error_context(fs, gyro_err, 'arw', None, state, drift_method,
+                        None if rng is None else [rng])
+    run_stages(stages, w_mea[np.newaxis], ctx)
     return w_mea
 
-def bias_drift(corr_time, drift, n, fs):
+def bias_drift(corr_time, drift, n, fs, state=None, method='vectorized', rng=None):
     """
     Bias drift (instability) model for accelerometers or gyroscope.
     If correlation time is valid (positive and finite), a first-order Gauss-Markov model is used.
@@ -532,9 +1511,42 @@ def bias_drift(corr_time, drift, n, fs):
         drift: 3x1 bias drift std, rad/s.
         n: total data count
         fs: sample frequency, Hz.
+        state: a dict to generate data chunk by chunk. state['b_drift'] is the 3x1 bias drift
+            of the first sample of this chunk, and is updated to that of the next chunk.
+            None to generate all data in one call.
+        method: how the Gauss-Markov recursion is computed. The statistical model is the same.
+            'vectorized': all three axes at once by a blocked scan, see gauss_markov (default).
+            'loop': sample by sample for each axis. Random numbers are drawn the same way as
+                older versions, so that data generated by older versions can be reproduced
+                with the same seed.
+        rng: a numpy.random.Generator, see acc_gen.
     Returns
         sensor_bias_drift: drift of sensor bias
     """
+    # bias drift of the first sample
+    b_drift_0 = np.zeros(3)
+    if state is not None:
+        b_drift_0 = state.get('b_drift', b_drift_0)
+        state['b_drift'] = np.zeros(3)
+    if method == 'vectorized':
+        corr_time = np.array(corr_time, dtype=float)
+        drift = np.array(drift, dtype=float)
+        gm = ~np.isinf(corr_time)
+        sensor_bias_drift = np.zeros((n, 3))
+        noise = randn(rng, n, 3)
+        # First-order Gauss-Markov
+        if gm.any():
+            a = 1 - 1/fs/corr_time[gm]
+            b = 1/fs*drift[gm]
+            x = gauss_markov(a, b*noise[:, gm], np.array(b_drift_0, dtype=float)[gm])
+            sensor_bias_drift[:, gm] = x[0:n]
+            if state is not None:
+                state['b_drift'][gm] = x[n]
+        # normal distribution
+        sensor_bias_drift[:, ~gm] = drift[~gm] * noise[:, ~gm]
+        return sensor_bias_drift
+    elif method != 'loop':
+        raise ValueError("method should be 'vectorized' or 'loop', but it is %s."% method)
     # 3 axis
     sensor_bias_drift = np.zeros((n, 3))
     for i in range(0, 3):
@@ -543,15 +1555,58 @@ def bias_drift(corr_time, drift, n, fs):
             a = 1 - 1/fs/corr_time[i]
             b = 1/fs*drift[i]
             #sensor_bias_drift[0, :] = np.random.randn(3) * drift
-            drift_noise = np.random.randn(n, 3)
+            drift_noise = randn(rng, n, 3)
+            sensor_bias_drift[0, i] = b_drift_0[i]
             for j in range(1, n):
                 sensor_bias_drift[j, i] = a*sensor_bias_drift[j-1, i] + b*drift_noise[j-1, i]
+            if state is not None:
+                state['b_drift'][i] = a*sensor_bias_drift[n-1, i] + b*drift_noise[n-1, i]
         else:
             # normal distribution
-            sensor_bias_drift[:, i] = drift[i] * np.random.randn(n)
+            sensor_bias_drift[:, i] = drift[i] * randn(rng, n)
     return sensor_bias_drift
 
-def gps_gen(ref_gps, gps_err, gps_type=0):
+def gauss_markov(a, u, x0):
+    """
+    First-order recursion x[j+1] = a*x[j] + u[j] of m independent axes, computed by a blocked
+    scan instead of sample by sample. Within a block of L samples starting from x[s],
+        x[s+k] = a^k * (x[s] + sum_{i<k} a^(-i-1) * u[s+i]),
+    so each block is a cumulative sum. L is chosen so that a^(-L) is not above MAX_GAIN to
+    bound the rounding error of the scaled sum.
+    Args:
+        a: (m,) coefficients of the recursion.
+        u: nxm inputs of the recursion.
+        x0: (m,) initial states.
+    Returns:
+        (n+1)xm states. x[0] is x0, and x[n] is the state after the last input.
+    """
+    n = u.shape[0]
+    x = np.empty((n+1, u.shape[1]))
+    x[0] = x0
+    # block length, a^(-L) <= MAX_GAIN for all axes
+    abs_a = np.abs(a)
+    if n == 0:
+        return x
+    if (abs_a >= 1.0).all():
+        L = n
+    elif (abs_a == 0.0).any():
+        L = 1
+    else:
+        L = int(min(n, max(1, math.floor(math.log(MAX_GAIN) / -np.log(abs_a.min())))))
+    if L == 1:
+        # the recursion forgets its state too fast to be scanned
+        for j in range(n):
+            x[j+1] = a*x[j] + u[j]
+        return x
+    k = np.arange(1, L+1).reshape((L, 1))
+    a_pos = a ** k          # a^k, k = 1...L
+    a_neg = 1.0 / a_pos     # a^(-k)
+    for s in range(0, n, L):
+        m = min(L, n-s)
+        x[s+1:s+m+1] = a_pos[0:m] * (x[s] + np.cumsum(a_neg[0:m] * u[s:s+m], axis=0))
+    return x
+
+def gps_gen(ref_gps, gps_err, gps_type=0, rng=None):
     '''
     Add error to true GPS data according to GPS receiver error parameters
     Args:
@@ -564,24 +1619,27 @@ def gps_gen(ref_gps, gps_err, gps_type=0):
         gps_type: GPS data type.
             0: default, position is in the form of [Lat, Lon, Alt], rad, m
             1: position is in the form of [x, y, z], m
+        rng: a numpy.random.Generator, see acc_gen.
     Returns:
         gps_mea: ref_gps with error.
     '''
     # total data count
     n = ref_gps.shape[0]
-    # If position is in the form of LLA, convert gps_err['stdp'] to LLA error
+    # If position is in the form of LLA, convert gps_err['stdp'] to LLA error.
+    # gps_err is not modified so that it can be used for other runs or data chunks.
+    stdp = np.array(gps_err['stdp'], dtype=float)
     if gps_type == 0:   # GPS is in the form of LLA, stdp meter to rad
-        earth_param = geoparams.geo_param(ref_gps[0, 1:4])
-        gps_err['stdp'][0] = gps_err['stdp'][0] / earth_param[0]
-        gps_err['stdp'][1] = gps_err['stdp'][1] / earth_param[1] / earth_param[4]
+        earth_param = geoparams.geo_param(ref_gps[0, 0:3])
+        stdp[0] = stdp[0] / earth_param[0]
+        stdp[1] = stdp[1] / earth_param[1] / earth_param[4]
     ## simulate GPS error
-    pos_noise = gps_err['stdp'] * np.random.randn(n, 3)
-    vel_noise = gps_err['stdv'] * np.random.randn(n, 3)
+    pos_noise = stdp * randn(rng, n, 3)
+    vel_noise = gps_err['stdv'] * randn(rng, n, 3)
     gps_mea = np.hstack([ref_gps[:, 0:3] + pos_noise,
                          ref_gps[:, 3:6] + vel_noise])
     return gps_mea
 
-def odo_gen(ref_odo, odo_err):
+def odo_gen(ref_odo, odo_err, rng=None):
     '''
     Add error to true odometer data.
     Args:
@@ -589,18 +1647,19 @@ def odo_gen(ref_odo, odo_err):
         odo_err: odometer error profile.
             'scale': 3x1, scale factor error.
             'std': 3x1, RMS velocity error.
+        rng: a numpy.random.Generator, see acc_gen.
     Returns:
         odo_mea: nx3, measured odometer output.
     '''
     n = ref_odo.shape[0]
-    odo_noise = np.random.randn(n, 3)
+    odo_noise = randn(rng, n, 3)
     scale_factor = odo_err['scale']
     odo_noise[:, 0] = scale_factor[0]*ref_odo[:, 0] + odo_err['std'][0]*odo_noise[:, 0]
     odo_noise[:, 1] = scale_factor[1]*ref_odo[:, 1] + odo_err['std'][1]*odo_noise[:, 1]
     odo_noise[:, 2] = scale_factor[2]*ref_odo[:, 2] + odo_err['std'][2]*odo_noise[:, 2]
     return odo_noise
 
-def mag_gen(ref_mag, mag_err):
+def mag_gen(ref_mag, mag_err, rng=None):
     """
     Add error to magnetic data.
     Args:
@@ -609,6 +1668,7 @@ def mag_gen(ref_mag, mag_err):
             'si': 3x3 soft iron matrix
             'hi': hard iron array, [ox, oy, oz], uT
             'std': RMS of magnetometer noise, uT
+        rng: a numpy.random.Generator, see acc_gen.
     Returns:
         mag_mea: ref_mag with error, mag_mea = si * (ref_mag + hi) + noise
     """
@@ -617,5 +1677,536 @@ def mag_gen(ref_mag, mag_err):
     # add error
     mag_mea = ref_mag + mag_err['hi']
     mag_mea = mag_mea.dot(mag_err['si'].T)
-    mag_noise = mag_err['std'] * np.random.randn(n, 3)
+    mag_noise = mag_err['std'] * randn(rng, n, 3)
     return mag_mea + mag_noise
+
+def randn(rng, *shape):
+    """
+    Standard normal random numbers.
+    Args:
+        rng: a numpy.random.Generator, or None to use the global random state of numpy.random.
+        shape: shape of the random numbers.
+    Returns:
+        numpy array of the given shape.
+    """
+    if rng is None:
+        return np.random.randn(*shape)
+    return rng.standard_normal(shape)
+
+def randn_runs(rng, runs, *shape):
+    """
+    Standard normal random numbers of many simulation runs.
+    Args:
+        rng: a list of numpy.random.Generator, one for each run, or None to use the global
+            random state of numpy.random.
+        runs: number of runs.
+        shape: shape of the random numbers of each run.
+    Returns:
+        numpy array of size (runs,)+shape. If rng is not None, the i-th one is drawn from
+        rng[i], so the random numbers of a run do not depend on other runs.
+    """
+    if rng is None:
+        return np.random.randn(runs, *shape)
+    x = np.empty((runs,) + shape)
+    for i in range(runs):
+        x[i] = rng[i].standard_normal(shape)
+    return x
+
+def rand_runs(rng, runs, *shape):
+    """
+    Uniform random numbers in [0, 1) of many simulation runs, see randn_runs.
+    """
+    if rng is None:
+        return np.random.rand(runs, *shape)
+    x = np.empty((runs,) + shape)
+    for i in range(runs):
+        x[i] = rng[i].random(shape)
+    return x
+
+def randn_into(rng, out):
+    """
+    Fill out with standard normal random numbers in place.
+    Args:
+        rng: a list of numpy.random.Generator, one for each run, or None to use the global
+            random state of numpy.random.
+        out: a contiguous array of size (runs, ...). If rng is not None, out[i] is drawn from
+            rng[i] in the same order as randn_runs.
+    """
+    if rng is None:
+        out[...] = np.random.randn(*out.shape)
+    else:
+        for i in range(out.shape[0]):
+            rng[i].standard_normal(out=out[i])
+
+def error_context(fs, err, noise, vib_def=None, state=None, drift_method='vectorized', rng=None):
+    """
+    Parameters shared by the error stages of a sensor, see run_stages.
+    Args:
+        fs: sample frequency, Hz.
+        err: error parameters of the sensor, e.g., acc_err of acc_gen.
+        noise: key of the white noise density in err, 'vrw' or 'arw'.
+        vib_def: Vibration model and parameters, see acc_gen.
+        state: a dict to generate data chunk by chunk, see acc_gen. Only for a single run.
+        drift_method: how the bias drift is generated, see bias_drift.
+        rng: a list of numpy.random.Generator, one for each run, or None to use the global
+            random state of numpy.random.
+    Returns:
+        ctx: a dict of the above, and
+            'n0': data count before this chunk.
+            'work': a scratch array of the same size as the output, allocated once by the
+                first stage that needs it and reused by the others, see work_buffer.
+    """
+    n0 = 0
+    if state is not None:
+        n0 = state.get('n', 0)
+    return {'fs': fs, 'err': err, 'noise': noise, 'vib_def': vib_def, 'state': state,
+            'drift_method': drift_method, 'rng': rng, 'n0': n0, 'work': None}
+
+def run_stages(stages, y, ctx, components=None):
+    """
+    Add sensor errors to y in place by a pipeline of error stages.
+    Each stage is a function stage(y, ctx) that adds one error term to y in place, or
+    transforms y in place, e.g., quantization. y is of size (runs, n, 3), and y[i] is the
+    data of the i-th run. ctx is returned by error_context. A stage needing a temporary array
+    of the size of y should use work_buffer(y, ctx), so that all stages share one scratch
+    array and adding a stage does not allocate another full-size array. Random numbers of
+    run i should be drawn from ctx['rng'][i], e.g., by randn_into.
+    Built-in stages are scale_stage, bias_stage, drift_stage, vib_stage, noise_stage and
+    quant_stage. Parameters of size (runs, 3) should be read by error_param.
+    ACC_STAGES and GYRO_STAGES are the default pipelines of acc_gen and gyro_gen.
+    Args:
+        stages: a list of error stages, applied in order.
+        y: (runs, n, 3) true sensor data, replaced by measured sensor data.
+        ctx: see error_context.
+        components: a dict to keep the error of each stage, e.g., for error budgets. Keys
+            are stage names (see stage_name), and values are arrays of the same size as y,
+            replaced by the change of y made by the stage. The sum of y before the stages
+            and all components is y after the stages. None (default) to keep no component.
+    """
+    for stage in stages:
+        if components is None:
+            stage(y, ctx)
+        else:
+            c = components[stage_name(stage)]
+            c[:] = y
+            stage(y, ctx)
+            np.subtract(y, c, out=c)
+    if ctx['state'] is not None:
+        ctx['state']['n'] = ctx['n0'] + y.shape[1]
+
+def stage_name(stage):
+    """
+    Name of an error stage, e.g., 'drift' for drift_stage. Stages of a pipeline should have
+    different names.
+    """
+    name = getattr(stage, '__name__', type(stage).__name__)
+    if name.endswith('_stage'):
+        name = name[:-len('_stage')]
+    return name
+
+def component_views(components, r0, k):
+    """
+    Views of the runs r0 to r0+k-1 of the (runs, n, m) arrays in the dict components, or
+    None if components is None.
+    """
+    if components is None:
+        return None
+    return {i: components[i][r0:r0+k] for i in components}
+
+def work_buffer(y, ctx):
+    """
+    The scratch array of the same size as y shared by all error stages.
+    """
+    if ctx['work'] is None or ctx['work'].shape != y.shape:
+        ctx['work'] = np.empty(y.shape)
+    return ctx['work']
+
+def error_param(ctx, key):
+    """
+    Error parameter err[key] that can be added to or multiplied with y of the error stages.
+    A parameter of size (runs, 3), e.g., drawn by draw_error_params, is reshaped to
+    (runs, 1, 3), so that each run has its own value.
+    """
+    x = np.asarray(ctx['err'][key], dtype=float)
+    if x.ndim == 2:
+        x = x[:, np.newaxis, :]
+    return x
+
+def scale_stage(y, ctx):
+    """
+    Error stage of scale factor error err['k']. Nothing is changed if err has no 'k'. This
+    stage should be the first one, so that only the true data are scaled.
+    """
+    if 'k' in ctx['err']:
+        y *= 1.0 + error_param(ctx, 'k')
+
+def bias_stage(y, ctx):
+    """
+    Error stage of constant bias err['b'].
+    """
+    y += error_param(ctx, 'b')
+
+def drift_stage(y, ctx):
+    """
+    Error stage of bias drift err['b_drift'] with correlation time err['b_corr'], see
+    bias_drift.
+    """
+    err = ctx['err']
+    runs = y.shape[0]
+    n = y.shape[1]
+    if runs == 1 and (ctx['state'] is not None or ctx['drift_method'] != 'vectorized'):
+        rng = None if ctx['rng'] is None else ctx['rng'][0]
+        y[0] += bias_drift(err['b_corr'], err['b_drift'], n, ctx['fs'], ctx['state'],
+                           ctx['drift_method'], rng)
+    else:
+        y += bias_drift_batch(err['b_corr'], err['b_drift'], runs, n, ctx['fs'], ctx['rng'])
+
+def noise_stage(y, ctx):
+    """
+    Error stage of white noise, whose density is err[ctx['noise']], e.g., 'vrw' or 'arw'.
+    """
+    w = work_buffer(y, ctx)
+    randn_into(ctx['rng'], w)
+    w *= error_param(ctx, ctx['noise']) * math.sqrt(ctx['fs'])
+    y += w
+
+def vib_stage(y, ctx):
+    """
+    Error stage of vibration ctx['vib_def'], see acc_gen. Nothing is added if there is no
+    vibration.
+    """
+    vib_def = ctx['vib_def']
+    if vib_def is None:
+        return
+    runs = y.shape[0]
+    n = y.shape[1]
+    fs = ctx['fs']
+    rng = ctx['rng']
+    amp = [vib_def['x'], vib_def['y'], vib_def['z']]
+    if vib_def['type'].lower() == 'psd':
+        vib_state = [None, None, None]
+        if ctx['state'] is not None:
+            vib_state = ctx['state'].setdefault('vib', [{}, {}, {}])
+        for i in range(runs):
+            for j in range(3):
+                # added block by block, no full-size temporary array
+                k = 0
+                for blk in psd_vibration.vib_blocks(amp[j], vib_def['freq'], fs, n,
+                                                    rng=None if rng is None else rng[i],
+                                                    state=vib_state[j]):
+                    y[i, k:k+blk.shape[0], j] += blk
+                    k += blk.shape[0]
+    elif vib_def['type'] == 'random':
+        # drawn axis by axis, the same as older versions
+        w = work_buffer(y, ctx).reshape((runs, 3, n))
+        randn_into(rng, w)
+        w *= np.array(amp, dtype=float).reshape((3, 1))
+        y += w.transpose((0, 2, 1))
+    elif vib_def['type'] == 'sinusoidal':
+        # the same for all runs
+        k = np.arange(ctx['n0'], ctx['n0']+n)
+        for j in range(3):
+            y[:, :, j] += amp[j] * np.sin(2.0*math.pi*vib_def['freq']/fs*k)
+
+def quant_stage(y, ctx):
+    """
+    Error stage of quantization. Data are rounded to multiples of err['q'], the 3x1
+    quantization step. Axes whose step is 0 are not quantized. This stage is not in the
+    default pipelines, and should be the last stage.
+    """
+    q = np.array(ctx['err']['q'], dtype=float) * np.ones(3)
+    for j in range(3):
+        if q[j] > 0:
+            yj = y[:, :, j]
+            yj /= q[j]
+            np.round(yj, out=yj)
+            yj *= q[j]
+
+# default error stages of acc_gen and gyro_gen
+ACC_STAGES = (scale_stage, bias_stage, drift_stage, vib_stage, noise_stage)
+GYRO_STAGES = (scale_stage, bias_stage, drift_stage, noise_stage)
+# error parameters that can be drawn for each run by draw_error_params
+RANDOM_ERRORS = ('b', 'k', 'vrw', 'arw')
+
+def draw_error_params(err, err_dist, runs, rng=None, points=None):
+    """
+    Draw error parameters of many simulation runs from their distributions, e.g., turn-on
+    bias and scale factor error that vary from run to run.
+    Args:
+        err: error parameters of the sensor, e.g., acc_err of acc_gen. It is not modified.
+            Values of err are the means of the distributions, 0 if missing.
+        err_dist: a dict of distributions of error parameters. Keys should be in
+            RANDOM_ERRORS, and values are
+            a 3x1 std: normal distribution, N(err[key], std^2).
+            ('uniform', h), h is 3x1: uniform distribution in [err[key]-h, err[key]+h].
+        runs: number of simulation runs.
+        rng: a list of numpy.random.Generator, one for each run, or None to use the global
+            random state of numpy.random. Parameters are drawn in the order of sorted keys.
+        points: (runs, 3*len(err_dist)) points uniformly distributed in (0, 1), e.g.,
+            antithetic or low-discrepancy points of sampling.uniform_points. Columns 3j to
+            3j+2 are the quantiles of the j-th parameter in the order of sorted keys.
+            None (default) to draw parameters from rng.
+    Returns:
+        a copy of err. Parameters in err_dist are replaced by arrays of size (runs, 3), and
+        the i-th row is the parameter of the i-th run.
+    """
+    err = dict(err)
+    for j, key in enumerate(sorted(err_dist)):
+        if key not in RANDOM_ERRORS:
+            raise ValueError('%s cannot be drawn for each run.'% key)
+        mean = np.array(err.get(key, 0.0), dtype=float) * np.ones(3)
+        dist = err_dist[key]
+        u = None
+        if points is not None:
+            u = points[:, 3*j:3*j+3]
+        if isinstance(dist, tuple) and dist[0] == 'uniform':
+            if u is None:
+                u = rand_runs(rng, runs, 3)
+            x = np.array(dist[1], dtype=float) * (2.0*u - 1.0)
+        else:
+            z = randn_runs(rng, runs, 3) if u is None else norm_ppf(u)
+            x = np.array(dist, dtype=float) * z
+        err[key] = mean + x
+    return err
+
+def norm_ppf(u):
+    """
+    Quantiles of the standard normal distribution, the inverse of its CDF.
+    Args:
+        u: an array of probabilities in (0, 1).
+    Returns:
+        an array of the same size as u.
+    """
+    u = np.asarray(u, dtype=float)
+    ppf = statistics.NormalDist().inv_cdf
+    return np.array([ppf(i) for i in u.flat]).reshape(u.shape)
+
+def runs_per_block(n, block_size=BATCH_SIZE):
+    """
+    Number of runs generated together by the batched sensor generators, so that temporary
+    arrays have at most block_size samples (at least one run).
+    Args:
+        n: samples of each run.
+        block_size: max samples of each temporary array.
+    Returns:
+        number of runs in a block.
+    """
+    return max(1, int(block_size) // max(1, n))
+
+def acc_gen_batch(fs, ref_a, acc_err, runs, vib_def=None, block_size=BATCH_SIZE, rng=None,
+                  stages=None, err_dist=None, components=None, err_points=None):
+    """
+    Generate accelerometer data of many simulation runs in one pass. This is the batched
+    version of acc_gen. All runs share the same true acc data and error model, and have
+    independent random errors.
+    Args:
+        fs: sample frequency, Hz.
+        ref_a: nx3 true acc data, m/s2, shared by all runs. Or (m, n, 3) true acc data of m
+            sensors, and the i-th run uses ref_a[i % m], e.g., units of an IMU array, see
+            imu_array.array_gen.
+        acc_err: accelerometer error parameters, see acc_gen.
+        runs: number of simulation runs.
+        vib_def: Vibration model and parameters, see acc_gen.
+        block_size: max samples of each temporary array. Runs are generated in blocks of
+            runs_per_block(n, block_size) runs to bound the peak memory.
+        rng: a list of numpy.random.Generator, one for each run. Random numbers of each run
+            are drawn from its own generator in the same order as acc_gen, so the data of a
+            run are the same as acc_gen(..., rng=rng[i]) and do not depend on other runs or
+            on block_size. None (default) to use the global random state of numpy.random.
+        stages: a list of error stages, see acc_gen.
+        err_dist: distributions of error parameters that vary from run to run, see
+            draw_error_params. Parameters of each run are drawn before its random errors.
+            None (default) if all runs have the same error parameters.
+        components: an empty dict to keep the error of each stage, see run_stages. It is
+            filled with (runs, n, 3) errors, one for each stage, e.g., components['drift'].
+            Random numbers are drawn the same as without it. None (default) to keep no
+            component.
+        err_points: (runs, 3*len(err_dist)) points to draw the error parameters of each
+            run from err_dist, see draw_error_params. None (default) to draw them from rng.
+    Returns:
+        a_mea: (runs, n, 3) measured acc data. a_mea[i] is the contiguous data of the i-th run.
+    """
+    n = ref_a.shape[-2]
+    a_mea = np.empty((runs, n, 3))
+    if stages is None:
+        stages = ACC_STAGES
+    if components is not None:
+        for stage in stages:
+            components[stage_name(stage)] = np.empty((runs, n, 3))
+    k = runs_per_block(n, block_size)
+    ctx = error_context(fs, acc_err, 'vrw', vib_def)
+    for r0 in range(0, runs, k):
+        blk = a_mea[r0:r0+k]
+        # true + constant_bias + bias_drift + vibration + noise, accumulated in blk
+        ctx['rng'] = None if rng is None else rng[r0:r0+k]
+        if err_dist is not None:
+            blk_points = None if err_points is None else err_points[r0:r0+k]
+            ctx['err'] = draw_error_params(acc_err, err_dist, blk.shape[0], ctx['rng'],
+                                           blk_points)
+        fill_ref(blk, ref_a, r0)
+        run_stages(stages, blk, ctx, component_views(components, r0, k))
+    return a_mea
+
+def gyro_gen_batch(fs, ref_w, gyro_err, runs, block_size=BATCH_SIZE, rng=None, stages=None,
+                   err_dist=None, components=None, err_points=None):
+    """
+    Generate gyroscope data of many simulation runs in one pass. This is the batched version
+    of gyro_gen.
+    Args:
+        fs: sample frequency, Hz.
+        ref_w: nx3 true gyro data, rad/s, or (m, n, 3), see acc_gen_batch.
+        gyro_err: gyroscope error parameters, see gyro_gen.
+        runs: number of simulation runs.
+        block_size: max samples of each temporary array, see acc_gen_batch.
+        rng: a list of numpy.random.Generator, one for each run, see acc_gen_batch.
+        stages: a list of error stages, see gyro_gen.
+        err_dist: distributions of error parameters, see acc_gen_batch.
+        components: an empty dict to keep the error of each stage, see acc_gen_batch.
+        err_points: points to draw error parameters from, see acc_gen_batch.
+    Returns:
+        w_mea: (runs, n, 3) measured gyro data.
+    """
+    n = ref_w.shape[-2]
+    w_mea = np.empty((runs, n, 3))
+    if stages is None:
+        stages = GYRO_STAGES
+    if components is not None:
+        for stage in stages:
+            components[stage_name(stage)] = np.empty((runs, n, 3))
+    k = runs_per_block(n, block_size)
+    ctx = error_context(fs, gyro_err, 'arw')
+    for r0 in range(0, runs, k):
+        blk = w_mea[r0:r0+k]
+        # true + constant_bias + bias_drift + noise, accumulated in blk
+        ctx['rng'] = None if rng is None else rng[r0:r0+k]
+        if err_dist is not None:
+            blk_points = None if err_points is None else err_points[r0:r0+k]
+            ctx['err'] = draw_error_params(gyro_err, err_dist, blk.shape[0], ctx['rng'],
+                                           blk_points)
+        fill_ref(blk, ref_w, r0)
+        run_stages(stages, blk, ctx, component_views(components, r0, k))
+    return w_mea
+
+def fill_ref(blk, ref, r0):
+    """
+    Copy true data of the runs r0, r0+1, ... to blk in place.
+    Args:
+        blk: (k, n, 3) data of k runs.
+        ref: nx3 true data shared by all runs, or (m, n, 3) true data of m sensors. The i-th
+            run uses ref[i % m].
+        r0: index of the first run in blk.
+    """
+    if ref.ndim == 3:
+        np.take(ref, np.arange(r0, r0+blk.shape[0]) % ref.shape[0], axis=0, out=blk)
+    else:
+        blk[:] = ref
+
+def bias_drift_batch(corr_time, drift, runs, n, fs, rng=None):
+    """
+    Bias drift of many simulation runs. This is the batched version of bias_drift. The
+    Gauss-Markov recursion of all runs and all axes is computed together by gauss_markov.
+    Args:
+        corr_time: 3x1 correlation time, sec.
+        drift: 3x1 bias drift std.
+        runs: number of simulation runs.
+        n: samples of each run.
+        fs: sample frequency, Hz.
+        rng: a list of numpy.random.Generator, one for each run, see acc_gen_batch.
+    Returns:
+        (runs, n, 3) drift of sensor bias.
+    """
+    corr_time = np.array(corr_time, dtype=float)
+    drift = np.array(drift, dtype=float)
+    gm = ~np.isinf(corr_time)
+    noise = randn_runs(rng, runs, n, 3)
+    sensor_bias_drift = drift * noise
+    if gm.any():
+        # First-order Gauss-Markov, axes of all runs are columns of the recursion
+        a = np.tile(1 - 1/fs/corr_time[gm], runs)
+        u = (1/fs*drift[gm]) * noise[:, :, gm]
+        u = u.transpose((1, 0, 2)).reshape((n, -1))
+        x = gauss_markov(a, u, np.zeros(a.shape[0]))[0:n]
+        sensor_bias_drift[:, :, gm] = x.reshape((n, runs, -1)).transpose((1, 0, 2))
+    return sensor_bias_drift
+
+def vib_batch(vib_def, runs, n, fs, rng=None):
+    """
+    Vibrating acceleration of many simulation runs, see acc_gen.
+    Args:
+        vib_def: Vibration model and parameters, see acc_gen.
+        runs: number of simulation runs.
+        n: samples of each run.
+        fs: sample frequency, Hz.
+        rng: a list of numpy.random.Generator, one for each run, see acc_gen_batch.
+    Returns:
+        (runs, n, 3) vibrating acceleration in the body frame, m/s2.
+    """
+    acc_vib = np.zeros((runs, n, 3))
+    vib_stage(acc_vib, error_context(fs, None, None, vib_def, rng=rng))
+    return acc_vib
+
+def gps_gen_batch(ref_gps, gps_err, runs, gps_type=0, block_size=BATCH_SIZE, rng=None):
+    """
+    Generate GPS data of many simulation runs in one pass. This is the batched version of
+    gps_gen.
+    Args:
+        ref_gps: nx6 true GPS data, see gps_gen.
+        gps_err: GPS receiver parameters, see gps_gen. It is not modified.
+        runs: number of simulation runs.
+        gps_type: GPS data type, see gps_gen.
+        block_size: max samples of each temporary array, see acc_gen_batch.
+        rng: a list of numpy.random.Generator, one for each run, see acc_gen_batch.
+    Returns:
+        gps_mea: (runs, n, 6) ref_gps with error.
+    """
+    n = ref_gps.shape[0]
+    stdp = np.array(gps_err['stdp'], dtype=float)
+    if gps_type == 0:   # GPS is in the form of LLA, stdp meter to rad
+        earth_param = geoparams.geo_param(ref_gps[0, 0:3])
+        stdp[0] = stdp[0] / earth_param[0]
+        stdp[1] = stdp[1] / earth_param[1] / earth_param[4]
+    std = np.hstack((stdp, np.array(gps_err['stdv'], dtype=float)))
+    gps_mea = np.empty((runs, n, 6))
+    k = runs_per_block(n, block_size)
+    for r0 in range(0, runs, k):
+        blk = gps_mea[r0:r0+k]
+        blk_rng = None if rng is None else rng[r0:r0+k]
+        # position noise and velocity noise are drawn one after the other, the same as gps_gen
+        noise = randn_runs(blk_rng, blk.shape[0], 2, n, 3)
+        blk[:] = ref_gps[:, 0:6]
+        blk[:, :, 0:3] += std[0:3] * noise[:, 0]
+        blk[:, :, 3:6] += std[3:6] * noise[:, 1]
+    return gps_mea
+
+def mag_gen_batch(ref_mag, mag_err, runs, block_size=BATCH_SIZE, rng=None, components=None):
+    """
+    Generate magnetometer data of many simulation runs in one pass. This is the batched
+    version of mag_gen. Soft iron and hard iron are the same for all runs, so the error free
+    part is computed once.
+    Args:
+        ref_mag: nx3 true magnetic data, uT.
+        mag_err: Magnetometer error parameters, see mag_gen.
+        runs: number of simulation runs.
+        block_size: max samples of each temporary array, see acc_gen_batch.
+        rng: a list of numpy.random.Generator, one for each run, see acc_gen_batch.
+        components: an empty dict to keep the errors separately, see acc_gen_batch. It is
+            filled with (runs, n, 3) errors 'iron' (soft iron and hard iron) and 'noise'.
+    Returns:
+        mag_mea: (runs, n, 3) ref_mag with error.
+    """
+    n = ref_mag.shape[0]
+    mag_true = (ref_mag + mag_err['hi']).dot(mag_err['si'].T)
+    mag_mea = np.empty((runs, n, 3))
+    if components is not None:
+        components['iron'] = np.empty((runs, n, 3))
+        components['iron'][:] = mag_true - ref_mag
+        components['noise'] = np.empty((runs, n, 3))
+    k = runs_per_block(n, block_size)
+    for r0 in range(0, runs, k):
+        blk = mag_mea[r0:r0+k]
+        blk_rng = None if rng is None else rng[r0:r0+k]
+        blk[:] = mag_err['std'] * randn_runs(blk_rng, blk.shape[0], n, 3)
+        if components is not None:
+            components['noise'][r0:r0+k] = blk
+        blk += mag_true
+    return mag_mea
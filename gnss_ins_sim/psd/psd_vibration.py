@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Fielname = psd_vibration.py
+
+"""
+Generate arbitrarily long vibration from a given PSD.
+White noise is shaped by an FIR filter whose amplitude response is the square root of the
+PSD, and the filter is applied block by block by overlap-save FFT convolution. Unlike
+time_series_from_psd, the time series is not periodic and has the given PSD at any length,
+and memory is bounded by the block size. Filters are cached for each PSD and sample rate.
+Created on 2026-10-16
+@author: dongxiaoguang
+"""
+
+# import
+import math
+import numpy as np
+
+# global
+VERSION = '1.0'
+BLOCK_SIZE = 2**17              # default samples of each output block
+MIN_TAPS = 64
+MAX_TAPS = 2**16
+MAX_FILTERS = 16                # max number of cached filters
+_FILTERS = {}
+
+def shaping_filter(sxx, freq, fs):
+    """
+    FIR filter that shapes unit-variance white noise sampled at fs to the given PSD. The
+    number of taps is a power of 2 that resolves the frequency step of the PSD.
+    Filters are cached for each PSD and sample rate.
+    Args:
+        sxx: 1D single-sided PSD.
+        freq: frequency responding to sxx, Hz.
+        fs: samplling frequency, Hz.
+    Returns:
+        h: 1D filter taps.
+    """
+    sxx = np.array(sxx, dtype=float)
+    freq = np.array(freq, dtype=float)
+    key = (sxx.tobytes(), freq.tobytes(), float(fs))
+    if key in _FILTERS:
+        return _FILTERS[key]
+    if fs < 2.0*freq[-1] or fs < 0.0:
+        raise ValueError('fs should be above twice the max PSD frequency %s, but it is %s.'%\
+                         (freq[-1], fs))
+    # taps to resolve the frequency step of the PSD
+    taps = MAX_TAPS
+    df = np.diff(freq)
+    if df.size > 0 and df.min() > 0:
+        taps = 2**int(math.ceil(math.log(2.0*fs/df.min(), 2)))
+        taps = min(max(taps, MIN_TAPS), MAX_TAPS)
+    # amplitude response, the double-sided PSD of white noise of unit variance is 1/fs
+    f = np.linspace(0, fs/2.0, taps//2+1)
+    amp = np.sqrt(0.5*fs*np.interp(f, freq, sxx))
+    # zero-phase response, delayed by taps/2 and windowed to avoid truncation ripples
+    h = np.roll(np.fft.irfft(amp, taps), taps//2)
+    h *= 0.5 - 0.5*np.cos(2.0*math.pi*np.arange(taps)/taps)
+    if len(_FILTERS) >= MAX_FILTERS:
+        del _FILTERS[next(iter(_FILTERS))]
+    _FILTERS[key] = h
+    return h
+
+def vib_blocks(sxx, freq, fs, n, block_size=BLOCK_SIZE, rng=None, state=None):
+    """
+    Generate a vibration time series from a given PSD block by block.
+    Args:
+        sxx: 1D single-sided PSD.
+        freq: frequency responding to sxx, Hz.
+        fs: samplling frequency, Hz.
+        n: samples of the time series.
+        block_size: max samples of each block.
+        rng: a numpy.random.Generator to draw random numbers from. None (default) to use the
+            global random state of numpy.random.
+        state: a dict to generate data chunk by chunk. state['tail'] holds the white noise
+            needed by the filter at the start of this chunk, and is updated to that of the
+            next chunk. Use an empty dict for the first chunk. None to generate all data in
+            one call.
+    Yields:
+        1D blocks of the time series, n samples in total.
+    """
+    h = shaping_filter(sxx, freq, fs)
+    m = h.shape[0] - 1
+    block_size = max(min(block_size, n), 1)
+    nfft = 2**int(math.ceil(math.log(block_size + m, 2)))
+    hk = np.fft.rfft(h, nfft)
+    # the filter starts with m samples of white noise so that the output is stationary
+    tail = None
+    if state is not None:
+        tail = state.get('tail')
+    if tail is None:
+        tail = randn(rng, m)
+    i = 0
+    while i < n:
+        k = min(block_size, n-i)
+        w = np.concatenate((tail, randn(rng, k)))
+        # overlap-save, the first m samples are wrapped around and discarded
+        y = np.fft.irfft(np.fft.rfft(w, nfft) * hk, nfft)[m:m+k]
+        tail = w[k:]
+        i += k
+        yield y
+    if state is not None:
+        state['tail'] = tail
+
+def vib_from_psd(sxx, freq, fs, n, rng=None, state=None):
+    """
+    Generate a vibration time series from a given PSD, see vib_blocks.
+    Returns:
+        x: 1D time series of n samples.
+    """
+    x = np.empty(n)
+    i = 0
+    for y in vib_blocks(sxx, freq, fs, n, rng=rng, state=state):
+        x[i:i+y.shape[0]] = y
+        i += y.shape[0]
+    return x
+
+def randn(rng, n):
+    """
+    n standard normal random numbers from rng, or from numpy.random if rng is None.
+    """
+    if rng is None:
+        return np.random.randn(n)
+    return rng.standard_normal(n)
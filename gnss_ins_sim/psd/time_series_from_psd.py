@@ -14,17 +14,20 @@ import numpy as np
 # global
 VERSION = '1.0'
 
-def time_series_from_psd(sxx, freq, fs, n):
+def time_series_from_psd(sxx, freq, fs, n, rng=None):
     """
     Generate 1-D time series from a given 1-D single-sided power spectal density.
     To save computational efforts, the max length of time series is 16384.
     ****If desired length>16384, time series will be repeated. Notice repeat will
     cause PSD of generated time series differs from the reference PSD.****
+    psd_vibration.vib_from_psd generates non-repeating time series of any length.
     Args:
         sxx: 1D single-sided PSD.
         freq: frequency responding to sxx.
         fs: samplling frequency.
         n: samples of the time series.
+        rng: a numpy.random.Generator to draw random phases from. None (default) to use the
+            global random state of numpy.random.
     Returns:
         status: true if sucess, false if error.
         x: time series
@@ -50,7 +53,10 @@ def time_series_from_psd(sxx, freq, fs, n):
         sxx = np.interp(freq_interp, freq, sxx)
     sxx[1:L-1] = 0.5 * sxx[1:L-1]               # single-sided psd amplitude to double-sided
     ax = np.sqrt(sxx*N*fs)                      # double-sided frequency spectrum amplitude
-    phi = math.pi * np.random.randn(L)          # random phase
+    if rng is None:
+        phi = math.pi * np.random.randn(L)      # random phase
+    else:
+        phi = math.pi * rng.standard_normal(L)
     xk = ax * np.exp(1j*phi)                    # single-sided frequency spectrum
     xk = np.hstack([xk, xk[-2:0:-1].conj()])    # double-sided frequency spectrum
     xm = np.fft.ifft(xk)                        # inverse fft
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+# Filename: checkpoint.py
+
+"""
+On-disk checkpoints of a simulation.
+A checkpoint is a directory that holds the finished work of Sim.run, so that a simulation
+stopped by a crash can be resumed by Sim.resume without recomputing the finished work:
+    meta.pkl: number of runs, configuration and the random state at the start.
+    path-######: a chunk of path_gen outputs, one .npy file per output, and the generator
+        states at the end of the chunk (extra.pkl).
+    run-######: sensor data of a simulation run, one .npy file per data, and the random
+        state at the end of the run (extra.pkl).
+    algo-######.pkl: algorithm outputs of a simulation run, and the random state and the
+        algorithm objects at the end of the run.
+Each item is written to a temporary file or directory and renamed, so that a crash never
+leaves a partial item.
+Created on 2026-10-16
+@author: dongxiaoguang
+"""
+
+import os
+import shutil
+import pickle
+import hashlib
+import numbers
+import functools
+import numpy as np
+
+# global
+VERSION = '1.0'
+CHUNK_SIZE = 2**20              # default rows of 'imu' and 'nav' in a path_gen checkpoint
+PATH_DATA = ('imu', 'nav', 'mag', 'gps', 'odo')
+ITEM_PREFIX = ('meta.pkl', 'path-', 'run-', 'algo-', '.tmp-')
+
+class Checkpoint(object):
+    '''
+    Checkpoints of a simulation in a directory.
+    '''
+    def __init__(self, checkpoint_dir, chunk_size=CHUNK_SIZE):
+        '''
+        Args:
+            checkpoint_dir: directory to store checkpoints. It will be created if it does not
+                exist.
+            chunk_size: path_gen states are saved every chunk_size rows of 'imu' and 'nav'.
+        '''
+        self.checkpoint_dir = os.path.abspath(checkpoint_dir)
+        self.chunk_size = int(chunk_size)
+        if self.chunk_size < 1:
+            raise ValueError('chunk_size should be above 0, but it is %s.'% chunk_size)
+        if not os.path.exists(self.checkpoint_dir):
+            try:
+                os.makedirs(self.checkpoint_dir)
+            except OSError:
+                if not os.path.isdir(self.checkpoint_dir):
+                    raise IOError('Cannot create dir: %s.'% self.checkpoint_dir)
+        self.meta = None
+
+    def start(self, num_times):
+        '''
+        Start a new simulation. All existing checkpoints are removed. Other files in the
+        checkpoint directory are not touched.
+        Args:
+            num_times: number of simulation runs.
+        '''
+        for i in os.listdir(self.checkpoint_dir):
+            if not i.startswith(ITEM_PREFIX):
+                continue
+            item = os.path.join(self.checkpoint_dir, i)
+            if os.path.isdir(item):
+                shutil.rmtree(item, ignore_errors=True)
+            else:
+                os.remove(item)
+        self.meta = {'num_times': int(num_times),
+                     'config': None,
+                     'rng': np.random.get_state()}
+        self.__dump(self.meta, 'meta.pkl')
+
+    def load(self):
+        '''
+        Load the checkpoint of a simulation to resume it.
+        Returns:
+            number of simulation runs.
+        '''
+        try:
+            self.meta = self.__load('meta.pkl')
+        except (IOError, OSError):
+            raise ValueError('%s is not a valid checkpoint.'% self.checkpoint_dir)
+        return self.meta['num_times']
+
+    def check(self, config):
+        '''
+        Check that the simulation is configured the same as the checkpoint. The configuration
+        is saved if the checkpoint has none.
+        Args:
+            config: a dict of scalars, strings and numpy arrays.
+        Raises:
+            ValueError if config is different from that of the checkpoint.
+        '''
+        if self.meta['config'] is None:
+            self.meta['config'] = config
+            self.__dump(self.meta, 'meta.pkl')
+            return
+        saved = self.meta['config']
+        if sorted(saved.keys()) != sorted(config.keys()):
+            raise ValueError('The checkpoint is for a different simulation.')
+        for i in config:
+            if not np.array_equal(np.asarray(saved[i]), np.asarray(config[i])):
+                raise ValueError('%s is different from that of the checkpoint.'% i)
+
+    def save_path_chunk(self, chunk):
+        '''
+        Save a chunk of path_gen outputs and the generator states at the end of the chunk.
+        Args:
+            chunk: a chunk yielded by pathgen.path_gen_iter.
+        '''
+        name = 'path-%06d'% len(self.__items('path-'))
+        data = {}
+        for i in PATH_DATA:
+            if len(chunk[i]) != 0:
+                data[i] = chunk[i]
+        extra = {'state': chunk['state'], 'integration': chunk.get('integration')}
+        self.__save_dir(name, data, extra)
+
+    def load_path(self):
+        '''
+        Load all saved chunks of path_gen outputs.
+        Returns:
+            chunks: a list of dicts of the same form as the return value of pathgen.path_gen,
+                with arrays memory-mapped read only.
+            state: generator states at the end of the last chunk, None if there is no chunk.
+        '''
+        chunks = []
+        state = None
+        for name in self.__items('path-'):
+            chunk, extra = self.__load_dir(name, PATH_DATA)
+            chunk['status'] = True
+            if extra['integration'] is not None:
+                chunk['integration'] = extra['integration']
+            chunks.append(chunk)
+            state = extra['state']
+        return chunks, state
+
+    def save_run(self, run, data):
+        '''
+        Save sensor data of a simulation run, and the random state at the end of the run.
+        Args:
+            run: index of the simulation run.
+            data: a dict of numpy arrays, e.g., {'accel': accel, 'gyro': gyro}.
+        '''
+        self.__save_dir('run-%06d'% run, data, {'rng': np.random.get_state()})
+
+    def load_runs(self):
+        '''
+        Load sensor data of all saved simulation runs.
+        Returns:
+            runs: a dict. Keys are indices of the saved simulation runs, and values are dicts
+                of memory-mapped sensor data.
+            rng: a dict. Keys are indices of the saved simulation runs, and values are random
+                states at the end of each run. Key -1 is the random state at the start of the
+                simulation.
+        '''
+        runs = {}
+        rng = {-1: self.meta['rng']}
+        for name in self.__items('run-'):
+            data, extra = self.__load_dir(name)
+            runs[int(name[4:])] = data
+            rng[int(name[4:])] = extra['rng']
+        return runs, rng
+
+    def save_algo(self, run, results, algo=None):
+        '''
+        Save algorithm outputs of a simulation run, and the random state and the algorithms
+        at the end of the run. Algorithms may keep states between runs, e.g., a counter of
+        runs to choose initial states, and these states are restored when resumed.
+        Args:
+            run: index of the simulation run.
+            results: return value of InsAlgoMgr.run_algo for this run.
+            algo: a list of algorithm objects. Algorithms that cannot be pickled, e.g.,
+                those holding shared libraries, are not saved.
+        '''
+        try:
+            algo = pickle.dumps(algo, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError, ValueError):
+            algo = None
+        self.__dump([results, np.random.get_state(), algo], 'algo-%06d.pkl'% run)
+
+    def load_algo(self):
+        '''
+        Load algorithm outputs of saved simulation runs. Only runs before the first run that
+        is not saved are loaded, because later runs depend on the algorithm states at the end
+        of the runs before them.
+        Returns:
+            results: a dict. Keys are indices of the loaded simulation runs, and values are
+                return values of InsAlgoMgr.run_algo for each run.
+            rng: random state at the end of the last loaded run, None if there is no loaded
+                run.
+            algo: a list of algorithm objects at the end of the last loaded run, None if
+                there is no loaded run or the algorithms are not saved.
+        '''
+        results = {}
+        rng = None
+        algo = None
+        saved = set(self.__items('algo-'))
+        while 'algo-%06d.pkl'% len(results) in saved:
+            [results[len(results)], rng, algo] = self.__load('algo-%06d.pkl'% len(results))
+        if algo is not None:
+            algo = pickle.loads(algo)
+        return results, rng, algo
+
+    def __items(self, prefix):
+        '''
+        Sorted names of saved items whose names start with prefix.
+        '''
+        return sorted([i for i in os.listdir(self.checkpoint_dir) if i.startswith(prefix)])
+
+    def __dump(self, obj, name):
+        '''
+        Pickle obj to a file in the checkpoint directory.
+        '''
+        file_name = os.path.join(self.checkpoint_dir, name)
+        tmp = os.path.join(self.checkpoint_dir, '.tmp-%s'% name)
+        with open(tmp, 'wb') as fp:
+            pickle.dump(obj, fp, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, file_name)
+
+    def __load(self, name):
+        '''
+        Load a pickled file in the checkpoint directory.
+        '''
+        with open(os.path.join(self.checkpoint_dir, name), 'rb') as fp:
+            return pickle.load(fp)
+
+    def __save_dir(self, name, data, extra):
+        '''
+        Save a dict of numpy arrays to .npy files and extra to extra.pkl in a sub directory.
+        '''
+        item = os.path.join(self.checkpoint_dir, name)
+        tmp = os.path.join(self.checkpoint_dir, '.tmp-%s'% name)
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for i in data:
+            np.save(os.path.join(tmp, i + '.npy'), data[i])
+        with open(os.path.join(tmp, 'extra.pkl'), 'wb') as fp:
+            pickle.dump(extra, fp, pickle.HIGHEST_PROTOCOL)
+        shutil.rmtree(item, ignore_errors=True)
+        os.rename(tmp, item)
+
+    def __load_dir(self, name, data_names=None):
+        '''
+        Load a sub directory saved by __save_dir.
+        Args:
+            name: name of the sub directory.
+            data_names: names of data to load. Missing data are []. None to load all .npy files.
+        Returns:
+            data: a dict of memory-mapped numpy arrays.
+            extra: the pickled extra.
+        '''
+        item = os.path.join(self.checkpoint_dir, name)
+        data = {}
+        if data_names is None:
+            data_names = [i[:-4] for i in os.listdir(item) if i.endswith('.npy')]
+        for i in data_names:
+            file_name = os.path.join(item, i + '.npy')
+            if os.path.isfile(file_name):
+                data[i] = np.load(file_name, mmap_mode='r')
+            else:
+                data[i] = []
+        with open(os.path.join(item, 'extra.pkl'), 'rb') as fp:
+            extra = pickle.load(fp)
+        return data, extra
+
+def fingerprint(obj):
+    '''
+    A hash of a configuration that cannot be compared by np.array_equal, e.g., dicts of
+    sensor errors and lists of error stages, so that it can be checked by Checkpoint.check.
+    Dicts are hashed in the order of their keys, numbers as floats, and functions by their
+    module and qualified names.
+    Args:
+        obj: scalars, strings, numpy arrays, functions, and dicts, lists and tuples of them.
+    Returns:
+        a hex string.
+    '''
+    h = hashlib.sha256()
+    update_hash(h, obj)
+    return h.hexdigest()
+
+def update_hash(h, obj):
+    '''
+    Feed a canonical form of obj to the hash object h, see fingerprint.
+    '''
+    if obj is None or isinstance(obj, (str, bool)):
+        h.update(repr(obj).encode())
+    elif isinstance(obj, numbers.Number):
+        h.update(repr(float(obj)).encode())
+    elif isinstance(obj, dict):
+        h.update(b'{')
+        for key in sorted(obj, key=str):
+            update_hash(h, str(key))
+            update_hash(h, obj[key])
+        h.update(b'}')
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'[')
+        for i in obj:
+            update_hash(h, i)
+        h.update(b']')
+    elif isinstance(obj, np.ndarray):
+        x = np.ascontiguousarray(obj)
+        if x.dtype.kind in 'biuf':
+            x = x.astype(float)
+        h.update(repr((x.dtype.str, x.shape)).encode())
+        h.update(x.tobytes() if x.dtype.kind != 'O' else repr(x.tolist()).encode())
+    elif isinstance(obj, functools.partial):
+        update_hash(h, [obj.func, obj.args, obj.keywords])
+    elif callable(obj) and hasattr(obj, '__qualname__'):
+        h.update(('%s.%s'% (getattr(obj, '__module__', ''), obj.__qualname__)).encode())
+    else:
+        # other objects, e.g., callable error stages, by their class and attributes
+        update_hash(h, [type(obj).__module__ + '.' + type(obj).__qualname__,
+                        getattr(obj, '__dict__', repr(obj))])
@@ -88,6 +88,8 @@ class IMU(object):
             gps_opt: a dictionary to specify the GPS error model.
                 'stdp': position RMS error, meters
                 'stdv': vertical RMS error, meters/second
+                Time-correlated errors, multipath jumps and outages are optional, see
+                pathgen/gnss_error.py.
         '''
         # check axis
         self.magnetometer = False
@@ -179,6 +181,37 @@ class IMU(object):
             self.gps = False
             self.gps_err = None
 
+        # error stages of accel and gyro, None to use the default ones
+        self.accel_stages = None
+        self.gyro_stages = None
+        # distributions of accel and gyro error parameters that vary from run to run
+        self.accel_err_dist = None
+        self.gyro_err_dist = None
+
+    def set_error_stages(self, accel_stages=None, gyro_stages=None):
+        '''
+        Set the error stages used to generate accel and gyro data.
+        Args:
+            accel_stages: a list of error stages of accel, see pathgen.run_stages.
+                None to use pathgen.ACC_STAGES.
+            gyro_stages: a list of error stages of gyro. None to use pathgen.GYRO_STAGES.
+        '''
+        self.accel_stages = accel_stages
+        self.gyro_stages = gyro_stages
+
+    def set_error_dist(self, accel_dist=None, gyro_dist=None):
+        '''
+        Set distributions of accel and gyro error parameters, so that each simulation run
+        has its own parameters, e.g., turn-on bias and scale factor error.
+        Args:
+            accel_dist: a dict of distributions of accel error parameters, for example,
+                {'b': np.array([1e-3, 1e-3, 1e-3])} for bias ~ N(accel_err['b'], 1e-3^2).
+                See pathgen.draw_error_params. None if all runs have the same parameters.
+            gyro_dist: a dict of distributions of gyro error parameters.
+        '''
+        self.accel_err_dist = accel_dist
+        self.gyro_err_dist = gyro_dist
+
     def set_gyro_error(self, gyro_error='low-accuracy'):
         '''
         set gyro error model
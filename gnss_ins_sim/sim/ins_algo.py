@@ -16,6 +16,12 @@ class InsAlgo(object):
         self.output: a list to define what the algorithm outputs.
         self.batch: a bool value to define if the algorithm runs in batch mode or
             the algorithm should be called per time step.
+    An algorithm may also define self.deepcopy_input. Input arrays are read-only views of the
+    simulation data by default. If the algorithm changes its input, set self.deepcopy_input
+    to True to get a deep copy of the input for each run.
+    An algorithm may also define self.parallel_safe. Set it to True if the results of a run do
+    not depend on earlier runs, so that the algorithm can be run by worker processes, see
+    Sim.run.
     An algorithm should at least contain three procedures.
         self.initialize(): Initialize/reset the algorithm.
         self.run(input): Feed input to the algorithm and then run the algorithm.
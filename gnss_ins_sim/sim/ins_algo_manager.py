@@ -8,6 +8,7 @@ Created on 2018-04-28
 """
 
 import copy
+import numpy as np
 
 class InsAlgoMgr(object):
     '''
@@ -36,7 +37,7 @@ class InsAlgoMgr(object):
         if self.algo is not None:
             self.__check_algo()
 
-    def run_algo(self, input_data, keys=None):
+    def run_algo(self, input_data, keys=None, algos=None):
         '''
         Run the algorithm with given input
         Args:
@@ -48,10 +49,15 @@ class InsAlgoMgr(object):
                 sets of gyro data: w={key0: set_of_data_#0, key1: set_of_data#1}.
                 w is a element of input. keys should be [key0, key1]. For each run of the algo,
                 gyro data is chosen accroding to the keys.
+            algos: a list of indices of the algorithms to run. None (default) to run all
+                algorithms.
         Returns:
             results: a list containing data defined in self.output.  Each output in results is
                 a dict with keys 'algorithm_name' + '_' + 'simulation run'. For example:
                 algo0_0, algo0_1, algo1_0, algo1_1, ......
+        Input arrays are passed to the algorithms as read-only views instead of copies. An
+        algorithm that changes its input should declare deepcopy_input = True to get a deep
+        copy of its input, otherwise a ValueError is raised when it tries to change the input.
         '''
         if len(input_data) != self.nin:
             raise ValueError('Required %s input, but provide %s.'% (self.nin, len(input_data)))
@@ -69,8 +75,10 @@ class InsAlgoMgr(object):
                 if isinstance(i, dict):
                     keys = list(i.keys())
                     break
+        if algos is None:
+            algos = range(self.nalgo)
         # run each algorithm
-        for i in range(self.nalgo):
+        for i in algos:
             # algo name will be used as a key to index results of this algo
             this_algo_name = self.get_algo_name(i)
             # run the algorithm for each simulation
@@ -87,7 +95,19 @@ class InsAlgoMgr(object):
                                             % (input_data[j].keys(), key))
                     else:
                         set_of_input.append(input_data[j])
-                self.algo[i].run(copy.deepcopy(set_of_input))   # deepcopy to avoid being changed
+                deepcopy_input = getattr(self.algo[i], 'deepcopy_input', False)
+                if deepcopy_input:
+                    set_of_input = copy.deepcopy(set_of_input)
+                else:
+                    set_of_input = [read_only(x) for x in set_of_input]
+                try:
+                    self.algo[i].run(set_of_input)
+                except ValueError as e:
+                    if deepcopy_input or 'read-only' not in str(e):
+                        raise
+                    raise ValueError('%s tried to change its input: %s. Set deepcopy_input of '\
+                                     'the algorithm to True to run it with a copy of the input.'\
+                                     % (this_algo_name, e))
                 # get algorithm output of this run
                 this_results = self.algo[i].get_results()
                 # add algorithm output of this run to results
@@ -147,3 +167,13 @@ class InsAlgoMgr(object):
         self.nin = len(self.input)
         self.nout = len(self.output)
         self.nalgo = len(self.algo)
+
+def read_only(x):
+    '''
+    A read-only view of x if x is a numpy array, so that x is not changed by algorithms
+    without being copied. Other data are returned as they are.
+    '''
+    if isinstance(x, np.ndarray):
+        x = x.view()
+        x.flags.writeable = False
+    return x
@@ -7,8 +7,11 @@ Created on 2018-04-24
 @author: dongxiaoguang
 """
 
+import weakref
 import numpy as np
 from . import sim_data
+from . import sampling
+from . import shared_data
 from .sim_data import Sim_data
 from ..attitude import attitude
 from ..kml_gen import kml_gen
@@ -25,8 +28,7 @@ class InsDataMgr(object):
             fs: [fs_imu, fs_gps, fs_mag], Hz.
                 fs_imu: The sample rate of IMU.
                 fs_gps: The sample rate of GPS.
-                fs_mag: not used now. The sample rate of the magnetometer is
-                    the same as that of the imu.
+                fs_mag: The sample rate of the magnetometer.
 
             ref_frame: reference frame used as the navigation frame,
                         0: NED (default), with x axis pointing along geographic north,
@@ -70,6 +72,9 @@ class InsDataMgr(object):
         self.gps_time = Sim_data(name='gps_time',\
                                  description='GPS sample time',\
                                  units=['sec'])
+        self.mag_time = Sim_data(name='mag_time',\
+                                 description='magnetometer sample time',\
+                                 units=['sec'])
         self.gps_visibility = Sim_data(name='gps_visibility',\
                                        description='GPS visibility')
         self.ref_pos = Sim_data(name='ref_pos',\
@@ -226,6 +231,7 @@ class InsDataMgr(object):
             self.ref_frame.name: self.ref_frame,
             self.time.name: self.time,
             self.gps_time.name: self.gps_time,
+            self.mag_time.name: self.mag_time,
             self.gps_visibility.name: self.gps_visibility,
             self.ref_pos.name: self.ref_pos,
             self.ref_vel.name: self.ref_vel,
@@ -285,6 +291,15 @@ class InsDataMgr(object):
                            self.att_quat.name: [self.att_euler, self.__quat2euler_zyx]}
         # error info, self.get_error_stat() and self.plot() will both update error info
         self.__err = {}
+        # sampling method of simulation runs, used to get the effective sample size
+        self.sampling = 'random'
+        # reference data that can be placed in shared memory, see share_ref
+        self.__shareable = [self.time.name, self.gps_time.name, self.mag_time.name,
+                            self.ref_pos.name, self.ref_vel.name, self.ref_att_euler.name,
+                            self.ref_att_quat.name, self.ref_gyro.name, self.ref_accel.name,
+                            self.ref_gps.name, self.ref_mag.name]
+        # reference data in shared memory, {data_name: shared_data.SharedArray}
+        self.__shared = {}
 
     def add_data(self, data_name, data, key=None, units=None):
         '''
@@ -314,6 +329,23 @@ class InsDataMgr(object):
         else:
             raise ValueError("Unsupported data: %s."%data_name)
 
+    def append_data(self, data_name, data, key=None, units=None):
+        '''
+        Append a chunk of data to available. This is used to collect data generated chunk by
+        chunk, for example by pathgen.path_gen_iter.
+        Args:
+            data_name: data name
+            data: a numpy array of size(m, dim) or a dict of numpy arrays.
+            key: See doc of add_data.
+            units: See doc of add_data.
+        '''
+        if data_name in self.__all:
+            self.__all[data_name].append_data(data, key, units)
+            if data_name not in self.available:
+                self.available.append(data_name)
+        else:
+            raise ValueError("Unsupported data: %s."%data_name)
+
     def set_algo_output(self, algo_output):
         '''
         Tell data manager what output an algorithm provide
@@ -353,6 +385,39 @@ class InsDataMgr(object):
         else:
             return None
 
+    def share_ref(self, mmap_dir=None):
+        '''
+        Place available reference data, e.g., time, ref_pos, ref_accel and ref_gps, in shared
+        memory. Data in the manager are replaced by read-only views of the shared memory, and
+        worker processes can attach to the same memory by the returned descriptors instead
+        of receiving copies. Data shared before are released first.
+        Args:
+            mmap_dir: directory of files mapped as shared memory. None (default) to use
+                multiprocessing.shared_memory, see shared_data.share.
+        Returns:
+            a dict of shared_data.SharedArray, keys are data names.
+        '''
+        self.release_shared()
+        for i in self.__shareable:
+            if i in self.available and isinstance(self.__all[i].data, np.ndarray):
+                self.__shared[i] = shared_data.share(self.__all[i].data, mmap_dir)
+                self.__all[i].data = self.__shared[i].attach()
+        # segments not released by release_shared are removed when the manager is freed or
+        # at exit
+        weakref.finalize(self, shared_data.release, list(self.__shared.values()))
+        return dict(self.__shared)
+
+    def release_shared(self):
+        '''
+        Release shared memory of reference data placed by share_ref. Data in the manager are
+        copied back to private arrays, so they are still available.
+        '''
+        for i in self.__shared:
+            if self.__all[i].data is self.__shared[i].attach():
+                self.__all[i].data = np.array(self.__all[i].data)
+            self.__shared[i].release()
+        self.__shared = {}
+
     def get_error_stat(self, data_name, end_point=False, angle=False, use_output_units=False,\
                        extra_opt=''):
         '''
@@ -365,7 +430,9 @@ class InsDataMgr(object):
                 a dict of statistics of process error of each simulatoin run.
                 For example, if we want the end-point error of position from a free-integration
                 algorithm ran for n times, the result is {'max': numpy.array([rx, ry, rz]),
-                'avg': numpy.array([rx, ry, rz]), 'std': numpy.array([rx, ry, rz])}.
+                'avg': numpy.array([rx, ry, rz]), 'std': numpy.array([rx, ry, rz]),
+                'ess': numpy.array([nx, ny, nz])}, where 'ess' is the effective sample size
+                of the runs, see effective_sample_size.
                 If we want the process error of an attitude determination algorithm ran for n
                 times, the result is {'max': a dict of numpy.array([yaw, pitch, roll]),
                                       'avg': a dict of numpy.array([yaw, pitch, roll]),
@@ -404,6 +471,8 @@ class InsDataMgr(object):
         # unit conversion
         if use_output_units and (err_stat is not None):
             for i in err_stat:
+                if i == 'ess':
+                    continue
                 if isinstance(err_stat[i], dict):
                     for j in err_stat[i]:
                         err_stat[i][j] = \
@@ -519,6 +588,25 @@ class InsDataMgr(object):
                     err[i, :] = c_ne.dot(err[i, :])
         return err
 
+    def effective_sample_size(self, err, keys):
+        '''
+        Effective sample size of the mean of errors of multiple runs, see
+        sampling.effective_sample_size.
+        Args:
+            err: (n, m) errors, one row for each run.
+            keys: keys of the runs, e.g., algo0_1, where 1 is the index of the simulation run.
+        Returns:
+            effective sample size of each column of err.
+        '''
+        groups = []
+        for key in keys:
+            name, _, run = str(key).rpartition('_')
+            if run.isdigit():
+                groups.append(name + '_' + str(sampling.groups(self.sampling, [int(run)])[0]))
+            else:
+                groups.append(str(key))
+        return sampling.effective_sample_size(err, groups)
+
     def save_data(self, data_dir):
         '''
         save data to files
@@ -572,6 +660,9 @@ class InsDataMgr(object):
             if what_to_plot == self.ref_gps.name or what_to_plot == self.gps.name or\
                 what_to_plot == self.gps_visibility.name or what_to_plot == self.gps_time.name:
                 x_axis = self.gps_time
+            elif (what_to_plot == self.ref_mag.name or what_to_plot == self.mag.name or\
+                  what_to_plot == self.mag_time.name) and self.mag_time.name in self.available:
+                x_axis = self.mag_time
             elif what_to_plot in self.__algo_output and self.algo_time.name in self.available:
                 x_axis = self.algo_time
             # plot
@@ -642,7 +733,9 @@ class InsDataMgr(object):
                 err.append(self.__err[err_data_name].data[i][-1, :])
             # convert list to np.array
             err = np.array(err)
-            return self.__array_stat(err)
+            stat = self.__array_stat(err)
+            stat['ess'] = self.effective_sample_size(err, self.__err[err_data_name].data.keys())
+            return stat
         elif isinstance(self.__err[err_data_name].data, np.ndarray):
             err = self.__err[err_data_name].data[-1, :]
             return self.__array_stat(err)
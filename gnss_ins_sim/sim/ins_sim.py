@@ -8,13 +8,24 @@ Created on 2018-04-24
 """
 
 import os
+import copy
 import time
 import math
+import functools
 import numpy as np
 import matplotlib.pyplot as plt
 from .ins_data_manager import InsDataMgr
 from .ins_algo_manager import InsAlgoMgr
+from .sim_data import LazyRuns
+from .sensor_gen import SensorGen
 from ..pathgen import pathgen
+from ..pathgen import path_cache
+from ..pathgen import motion_plan
+from ..pathgen import gnss_error
+from . import checkpoint as ckpt
+from . import parallel
+from . import lincov
+from . import sampling as sampling_methods
 from .. attitude import attitude
 from ..geoparams import geoparams
 
@@ -26,14 +37,16 @@ class Sim(object):
     INS simulation engine.
     '''
     def __init__(self, fs, motion_def, ref_frame=0, imu=None,\
-                 mode=None, env=None, algorithm=None):
+                 mode=None, env=None, algorithm=None, backend='python', cache_dir=None,\
+                 integrator='euler', seed=None, lazy=False, sampling='random'):
         '''
         Args:
             fs: [fs_imu, fs_gps, fs_mag], Hz.
                 fs_imu: The sample rate of IMU. This is also the sampel rate of the simulatino.
                 fs_gps: The sample rate of GPS.
-                fs_mag: not used now. The sample rate of the magnetometer is
-                    the same as that of the imu.
+                fs_mag: The sample rate of the magnetometer. It is rounded so that the
+                    magnetometer period is a multiple of the IMU period. If it is None or
+                    not above 0, the magnetometer is sampled at fs_imu.
 
             motion_def: If you want to do simulation with logged data files, motion_def should be
                 a directory contains the data files. Data files should be named as data_name.csv.
@@ -109,11 +122,59 @@ class Sim(object):
 
             algorithm: a user defined algorithm or list of algorithms. If there are multiple
                 algorithms, all algorithms should have the same input and output.
+
+            backend: backend of path generation.
+                'python': pure-Python stepping loop (default).
+                'jit': stepping kernel compiled by Numba. If Numba is not installed, the
+                    pure-Python loop is used.
+
+            cache_dir: directory of the on-disk cache of reference trajectories. If the motion
+                definition and the generation parameters are the same as a previous simulation,
+                reference data are loaded from the cache instead of being generated again.
+                None (default) to disable the cache.
+
+            integrator: integrator of position in path generation.
+                'euler': first-order Euler (default).
+                'rk4': fourth-order Runge-Kutta, only supported by the 'python' backend.
+
+            seed: root seed of sensor errors, a non-negative int. Each simulation run and each
+                sensor of the run draws random numbers from its own stream derived from the
+                seed (see rng_streams.py), so run k is the same no matter how many runs are
+                simulated and how they are generated.
+                None (default) to use the global random state of numpy.random.
+
+            lazy: If True, sensor data of each simulation run are not stored but generated
+                from the seed each time they are used, e.g., by algorithms or save_data, and
+                released after that. Memory used by sensor data does not grow with the number
+                of runs, at the cost of generating a run again each time it is used. A seed
+                is required. Default is False.
+
+            sampling: how error parameters that vary from run to run (see
+                IMU.set_error_dist) are sampled, see sampling.py.
+                'random': independent random parameters (default).
+                'antithetic': antithetic pairs of runs.
+                'sobol': scrambled Sobol points, scipy is needed.
+                A seed is required except for 'random'. End-point error statistics include
+                the effective sample size of the runs.
         '''
         self.fs = fs
         self.imu = imu
         self.mode = mode
         self.env = env
+        self.backend = backend
+        self.integrator = integrator
+        self.seed = seed
+        self.lazy = lazy
+        if self.lazy and self.seed is None:
+            raise ValueError('A seed is required to generate sensor data lazily.')
+        if sampling not in sampling_methods.METHODS:
+            raise ValueError('Unsupported sampling method: %s.'% sampling)
+        if sampling != 'random' and self.seed is None:
+            raise ValueError('A seed is required by %s sampling.'% sampling)
+        self.sampling = sampling
+        self.cache = None
+        if cache_dir is not None:
+            self.cache = path_cache.PathCache(cache_dir)
         if ref_frame == 0 or ref_frame == 1:
             self.ref_frame = ref_frame
         else:
@@ -124,8 +185,19 @@ class Sim(object):
         self.sim_results = False    # simulation results is generated
         # simulation data manager
         self.dmgr = InsDataMgr(fs, self.ref_frame)
+        self.dmgr.sampling = self.sampling
         self.data_src = motion_def
         self.data_from_files = False
+        # [initial states, generation plan] of the motion definition file
+        self.motion_plan = None
+        # checkpoints of the simulation, None if disabled
+        self.ckpt = None
+        # generator of sensor data, set after reference data are generated
+        self.sensor_gen = None
+        # number of worker processes
+        self.workers = 1
+        # reference data in shared memory for the workers, see InsDataMgr.share_ref
+        self.shared = {}
         # algorithm manager
         self.amgr = InsAlgoMgr(algorithm)
 
@@ -145,16 +217,208 @@ class Sim(object):
         # summary
         self.sum = ''
 
-    def run(self, num_times=1):
+    def run(self, num_times=1, checkpoint=None, workers=1):
         '''
         run simulation.
         Args:
             num_times: run the simulation for num_times times with given IMU error model.
+            checkpoint: a directory or a checkpoint.Checkpoint object to save checkpoints of
+                the simulation. The reference trajectory is saved every checkpoint.CHUNK_SIZE
+                samples, sensor data are saved after each block of runs (see
+                pathgen.runs_per_block), and algorithm outputs are saved after each run.
+                If the simulation is stopped, it can be continued by resume(checkpoint).
+                Existing checkpoints in the directory are removed.
+                None (default) to disable checkpoints.
+            workers: number of worker processes. If it is larger than 1, algorithms declaring
+                parallel_safe = True are run by a process pool, one work item for each
+                algorithm and each simulation run. Each worker generates the sensor data of
+                its runs from the seed and returns only the algorithm outputs, and results
+                are the same as running with one process. An algorithm is parallel safe if
+                the results of a run do not depend on earlier runs, e.g., it does not count
+                its runs to choose initial states. Other algorithms are run in this process.
+                Sensor data are then kept lazily as if lazy=True. A seed and a
+                motion definition file are required, and checkpoints are not supported.
+                Reference data are placed in shared memory to be used by all workers
+                without copying, and the memory is released by close().
+                Default is 1.
         '''
         self.sim_count = int(num_times)
         if self.sim_count < 1:
             self.sim_count = 1
+        self.workers = max(int(workers), 1)
+        if self.workers > 1:
+            if self.seed is None:
+                raise ValueError('A seed is required to run with multiple workers.')
+            if checkpoint is not None:
+                raise ValueError('Checkpoints are not supported with multiple workers.')
+            if not os.path.isfile(self.data_src):
+                raise ValueError('Multiple workers need a motion definition file, but it is %s.'%\
+                                 self.data_src)
+        self.ckpt = None
+        if checkpoint is not None:
+            self.ckpt = self.__get_checkpoint(checkpoint)
+            self.ckpt.start(self.sim_count)
+        self.__run()
+
+    def close(self):
+        '''
+        Release shared memory of reference data used by worker processes, see run(). Data of
+        the simulation are copied back and can still be used. Sim can also be used in a with
+        statement to be closed automatically.
+        '''
+        ref_names = []
+        if self.sensor_gen is not None:
+            # views of the shared memory are dropped before it is released
+            ref_names = list(self.sensor_gen.ref)
+            self.sensor_gen.ref = {}
+        self.dmgr.release_shared()
+        self.shared = {}
+        if self.sensor_gen is not None:
+            self.sensor_gen.ref = dict((i, self.dmgr.get_data_all(i).data) for i in ref_names)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def resume(self, checkpoint):
+        '''
+        Continue a simulation stopped during run() from its checkpoints. The Sim object should
+        be created with the same arguments as the stopped one. Finished work, including the
+        reference trajectory, sensor data and algorithm outputs of finished runs, is loaded
+        instead of being computed again. Random states and algorithm states are restored, so
+        the results are the same as those of a simulation that is not stopped.
+        Args:
+            checkpoint: a directory or a checkpoint.Checkpoint object, see run().
+        '''
+        self.ckpt = self.__get_checkpoint(checkpoint)
+        self.sim_count = self.ckpt.load()
+        self.workers = 1
+        self.__run()
+
+    def covariance(self, gps=None, ini_std=None, step=1):
+        '''
+        Linear covariance analysis, a fast alternative to run(num_times) and the error
+        statistics of many runs. Only the reference trajectory is generated, and the
+        covariance of navigation errors driven by the IMU error model is propagated along it
+        in one pass, see lincov.py. No sensor data is generated and no algorithm is run.
+        Args:
+            gps: True to update position and velocity by visible GPS measurements, as a
+                loosely-coupled INS does, False for free integration. None (default) to use
+                GPS if the IMU has GPS.
+            ini_std: 9x1 1-sigma initial errors, [pos (m), vel (m/s), att (rad)] in the
+                navigation frame. None (default) for no initial error.
+            step: max number of IMU samples of each propagation step. Default is 1.
+        Returns:
+            a dict of 1-sigma errors, comparable to the std of errors of many runs:
+                'time': time of the errors, sec.
+                'pos': position error in the navigation frame, m.
+                'vel': velocity error in the navigation frame, m/s.
+                'att': error of the Euler angles [yaw, pitch, roll], rad.
+        '''
+        if not os.path.isfile(self.data_src):
+            raise ValueError('Covariance analysis needs a motion definition file, but it is %s.'%\
+                             self.data_src)
+        if gps is None:
+            gps = self.imu.gps
+        if gps and not self.imu.gps:
+            raise ValueError('GPS is not enabled in the IMU model.')
+        self.__gen_ref_from_pathgen()
+        time = self.dmgr.time.data
+        gps_idx = None
+        if gps:
+            gps_time = self.dmgr.gps_time.data[self.dmgr.gps_visibility.data > 0.5]
+            gps_idx = np.searchsorted(time, gps_time - 0.5/self.fs[0])
+        rtn = lincov.covariance(self.fs[0], self.dmgr.ref_att_euler.data,
+                                self.dmgr.ref_accel.data, self.imu.accel_err,
+                                self.imu.gyro_err, self.imu.accel_err_dist,
+                                self.imu.gyro_err_dist, ini_std, gps_idx, self.imu.gps_err,
+                                step)
+        rtn['time'] = time[rtn.pop('index')]
+        return rtn
+
+    def error_budget(self, num_times=1, contributors=None):
+        '''
+        Error budget of the algorithms. Sensor errors of each simulation run are generated
+        once and kept separately by component (see the components argument of
+        pathgen.acc_gen_batch). Algorithms are then run on sensor data with only the
+        components of each contributor, so all contributors share the same reference
+        trajectory and the same random errors. Sensor data of all components of all runs
+        are kept in memory.
+        Args:
+            num_times: number of simulation runs.
+            contributors: a dict. Keys are names of contributors, and values are lists of
+                error components, e.g., {'gyro drift': ['gyro.bias', 'gyro.drift'],
+                'ARW': ['gyro.noise']}. A component is named sensor.error, where sensor is
+                'accel', 'gyro', 'gps' or 'mag', and error is the name of an error stage
+                of accel and gyro (see pathgen.stage_name), e.g., 'scale', 'bias', 'drift',
+                'vib' and 'noise', or the name of an error of GPS (see
+                gnss_error.gnss_gen_batch) and magnetometer (see pathgen.mag_gen_batch).
+                Sensors without any component of a contributor are error free.
+                None (default) for each component alone, and 'all' for all components.
+        Returns:
+            budget: a dict. budget[contributor][algo_name][data_name] is the statistics of
+                end-point errors of all runs, {'max':, 'avg':, 'std':, 'ess':}, the same as
+                get_error_stat of the data manager, in the units in which data are stored.
+                data_name is 'pos', 'vel' or 'att_euler' if it is an algorithm output.
+                Position errors are in the NED frame if ref_frame is 0.
+        '''
+        if self.amgr.algo is None:
+            raise ValueError('Error budget needs at least one algorithm.')
+        if not os.path.isfile(self.data_src):
+            raise ValueError('Error budget needs a motion definition file, but it is %s.'%\
+                             self.data_src)
+        self.sim_count = max(int(num_times), 1)
+        idx = list(range(self.sim_count))
+        self.__gen_ref_from_pathgen()
+        self.__set_sensor_gen()
+        # errors of all runs by component, the same random errors as __gen_sensor_data
+        ref = {}
+        components = {}
+        for data_name in self.sensor_gen.names:
+            parts = {}
+            self.sensor_gen.gen(data_name, idx, parts)
+            ref[data_name] = self.dmgr.get_data_all('ref_' + data_name).data
+            for i in parts:
+                components[data_name + '.' + i] = parts[i]
+        if contributors is None:
+            contributors = {i: [i] for i in components}
+            contributors['all'] = list(components)
+        # each contributor runs fresh copies of the algorithms, so that states kept between
+        # runs, e.g., a counter of runs, do not carry over to the next contributor
+        algo = self.amgr.algo
+        pristine = copy.deepcopy(algo)
+        budget = {}
+        for contributor in contributors:
+            for i in contributors[contributor]:
+                if i not in components:
+                    raise ValueError('Unsupported error component: %s.'% i)
+            # sensor data with only the selected components
+            algo_input = []
+            for data_name in self.amgr.input:
+                if data_name not in ref:
+                    algo_input.append(self.dmgr.get_data([data_name])[0])
+                    continue
+                data = {}
+                for i in idx:
+                    data[i] = ref[data_name].copy()
+                    for j in contributors[contributor]:
+                        if j.split('.')[0] == data_name:
+                            data[i] += components[j][i]
+                algo_input.append(data)
+            self.amgr.algo = copy.deepcopy(pristine)
+            try:
+                algo_output = self.amgr.run_algo(algo_input, idx)
+            finally:
+                self.amgr.algo = algo
+            budget[contributor] = self.__end_point_error_stat(algo_output, idx)
+        return budget
 
+    def __run(self):
+        '''
+        Generate data and run algorithms for self.sim_count times.
+        '''
         #### generate sensor data from file or pathgen
         self.__gen_data()
 
@@ -165,13 +429,104 @@ class Sim(object):
             # get algo input data
             algo_input = self.dmgr.get_data(self.amgr.input)
             # run the algo and get algo output
-            algo_output = self.amgr.run_algo(algo_input, range(self.sim_count))
+            if self.workers > 1:
+                algo_output = self.__run_algo_in_parallel(algo_input)
+            elif self.ckpt is None:
+                algo_output = self.amgr.run_algo(algo_input, range(self.sim_count))
+            else:
+                algo_output = self.__run_algo_with_checkpoint(algo_input)
             # add algo output to ins_data_manager
             for i in range(len(self.amgr.output)):
                 self.dmgr.add_data(self.amgr.output[i], algo_output[i])
         # simulation complete successfully
         self.sim_complete = True
 
+    def __run_algo_in_parallel(self, algo_input):
+        '''
+        Run algorithms declaring parallel_safe = True by a process pool, and other algorithms
+        in this process, because each worker has its own copy of the algorithms.
+        Args:
+            algo_input: See doc of InsAlgoMgr.run_algo.
+        Returns:
+            the same as InsAlgoMgr.run_algo(algo_input, range(self.sim_count)).
+        '''
+        keys = range(self.sim_count)
+        pool_algos = []
+        local_algos = []
+        for i in range(self.amgr.nalgo):
+            if getattr(self.amgr.algo[i], 'parallel_safe', False):
+                pool_algos.append(i)
+            else:
+                print('%s is not parallel safe and is run in the main process.'%\
+                      self.amgr.get_algo_name(i))
+                local_algos.append(i)
+        outputs = []
+        if len(pool_algos) > 0:
+            # sensor data are generated by the workers
+            worker_input = list(algo_input)
+            for i in range(len(worker_input)):
+                if self.amgr.input[i] in self.sensor_gen.names:
+                    worker_input[i] = None
+            outputs.append(parallel.run_algo(self.amgr, worker_input, self.sensor_gen, keys,
+                                             self.workers, self.shared, pool_algos))
+        if len(local_algos) > 0:
+            outputs.append(self.amgr.run_algo(algo_input, keys, local_algos))
+        # merge outputs in the same order as run_algo
+        algo_output = []
+        for j in range(len(self.amgr.output)):
+            results = {}
+            for k in range(self.amgr.nalgo):
+                algo_name = self.amgr.get_algo_name(k)
+                for i in keys:
+                    key = algo_name + '_' + str(i)
+                    for output in outputs:
+                        if key in output[j]:
+                            results[key] = output[j][key]
+            algo_output.append(results)
+        return algo_output
+
+    def __get_checkpoint(self, checkpoint):
+        '''
+        Get the checkpoint.Checkpoint object from a directory or a checkpoint.Checkpoint object.
+        '''
+        if isinstance(checkpoint, ckpt.Checkpoint):
+            return checkpoint
+        return ckpt.Checkpoint(checkpoint)
+
+    def __run_algo_with_checkpoint(self, algo_input):
+        '''
+        Run algorithms run by run and save the outputs of each run to the checkpoint. Outputs
+        of runs already in the checkpoint are loaded, and the algorithms are restored to their
+        states at the end of the last loaded run.
+        Args:
+            algo_input: See doc of InsAlgoMgr.run_algo.
+        Returns:
+            the same as InsAlgoMgr.run_algo(algo_input, range(self.sim_count)).
+        '''
+        done, rng, algo = self.ckpt.load_algo()
+        if rng is not None:
+            np.random.set_state(rng)
+        if algo is not None:
+            self.amgr.algo = list(algo)
+        elif len(done) > 0:
+            print('Algorithms are not saved in the checkpoint, and their states are not restored.')
+        for i in range(self.sim_count):
+            if i not in done:
+                done[i] = self.amgr.run_algo(algo_input, [i])
+                self.ckpt.save_algo(i, done[i], self.amgr.algo)
+        # merge outputs of all runs, in the same order as run_algo
+        algo_output = []
+        for j in range(len(self.amgr.output)):
+            results = {}
+            for k in range(self.amgr.nalgo):
+                algo_name = self.amgr.get_algo_name(k)
+                for i in range(self.sim_count):
+                    key = algo_name + '_' + str(i)
+                    if key in done[i][j]:
+                        results[key] = done[i][j][key]
+            algo_output.append(results)
+        return algo_output
+
     def results(self, data_dir=None, end_point=False, gen_kml=False, extra_opt=''):
         '''
         Simulation results.
@@ -344,6 +699,8 @@ class Sim(object):
                     self.sum += '\t--Max error: ' + str(err_stat['max']) + '\n'
                     self.sum += '\t--Avg error: ' + str(err_stat['avg']) + '\n'
                     self.sum += '\t--Std of error: ' + str(err_stat['std']) + '\n'
+                    if 'ess' in err_stat:
+                        self.sum += '\t--Effective sample size: ' + str(err_stat['ess']) + '\n'
 
         print(self.sum)
 
@@ -368,6 +725,8 @@ class Sim(object):
         '''
         if os.path.isdir(self.data_src):    # gen data from files in a directory
             self.data_src = os.path.abspath(self.data_src)
+            if self.ckpt is not None:
+                self.ckpt.check({'data_src': self.data_src})
             self.__gen_data_from_files()
             self.data_from_files = True
         elif os.path.isfile(self.data_src): # gen data from motion definitions in a .csv file
@@ -397,21 +756,71 @@ class Sim(object):
         '''
         Generate data from pathgen.
         '''
-        # read motion definition
-        [ini_pva, motion_def] = self.__parse_motion()
-        # output definitions
-        output_def = np.array([[1.0, self.fs[0]], [1.0, self.fs[0]]])
-        if self.imu.gps:
-            output_def[1, 0] = 1.0
-            output_def[1, 1] = self.fs[1]
-        else:
-            output_def[1, 0] = -1.0
+        self.__gen_ref_from_pathgen()
+        self.__gen_sensor_data()
+
+    def __gen_ref_from_pathgen(self):
+        '''
+        Generate reference data from pathgen.
+        '''
+        # read motion definition and compile it, only once for all calls of run()
+        if self.motion_plan is None:
+            [ini_pva, motion_def] = self.__parse_motion()
+            # output definitions
+            output_def = np.array([[1.0, self.fs[0]], [1.0, self.fs[0]]])
+            if self.imu.gps:
+                output_def[1, 0] = 1.0
+                output_def[1, 1] = self.fs[1]
+            else:
+                output_def[1, 0] = -1.0
+            if self.imu.magnetometer and self.fs[2] is not None and self.fs[2] > 0:
+                output_def = np.vstack((output_def, [3.0, self.fs[2]]))
+            self.motion_plan = [ini_pva, motion_plan.compile_motion_def(motion_def, output_def)]
+        [ini_pva, plan] = self.motion_plan
+        motion_def = plan['motion_def']
+        output_def = plan['output_def']
         # sim mode-->vehicle maneuver capability
         mobility = self.__parse_mode(self.mode)
+        if self.ckpt is not None:
+            self.ckpt.check({'ini_pos_vel_att': ini_pva,
+                             'motion_def': motion_def,
+                             'output_def': output_def,
+                             'mobility': mobility,
+                             'ref_frame': self.ref_frame,
+                             'magnet': self.imu.magnetometer,
+                             'backend': self.backend,
+                             'integrator': self.integrator,
+                             'seed': self.seed,
+                             'sampling': self.sampling,
+                             'fs': ckpt.fingerprint(list(self.fs)),
+                             'sensor': ckpt.fingerprint(self.__sensor_config()),
+                             'env': ckpt.fingerprint(self.__parse_env(self.env))})
 
-        # generate reference data and add data to ins_data_manager
-        rtn = pathgen.path_gen(ini_pva, motion_def, output_def, mobility,
-                               self.ref_frame, self.imu.magnetometer)
+        # generate reference data or load it from the cache, and add data to ins_data_manager
+        rtn = None
+        if self.cache is not None:
+            cache_key = self.cache.key(ini_pva, motion_def, output_def, mobility,
+                                       self.ref_frame, self.imu.magnetometer, self.backend,
+                                       self.integrator)
+            rtn = self.cache.load(cache_key)
+        if rtn is None and self.ckpt is not None:
+            # continue from the saved chunks
+            chunks, state = self.ckpt.load_path()
+            for chunk in pathgen.path_gen_iter(ini_pva, plan, output_def, mobility,
+                                               self.ref_frame, self.imu.magnetometer,
+                                               self.backend, self.ckpt.chunk_size,
+                                               self.integrator, resume=state):
+                self.ckpt.save_path_chunk(chunk)
+                chunks.append(chunk)
+            rtn = pathgen.join_chunks(chunks)
+            if self.cache is not None:
+                self.cache.save(cache_key, rtn)
+        if rtn is None:
+            rtn = pathgen.path_gen(ini_pva, plan, output_def, mobility,
+                                   self.ref_frame, self.imu.magnetometer, self.backend,
+                                   self.integrator)
+            if self.cache is not None:
+                self.cache.save(cache_key, rtn)
         self.dmgr.add_data(self.dmgr.time.name, rtn['nav'][:, 0] / self.fs[0])
         self.dmgr.add_data(self.dmgr.ref_pos.name, rtn['nav'][:, 1:4])
         self.dmgr.add_data(self.dmgr.ref_vel.name, rtn['nav'][:, 4:7])
@@ -421,26 +830,124 @@ class Sim(object):
         if self.imu.gps:
             self.dmgr.add_data(self.dmgr.gps_time.name, rtn['gps'][:, 0] / self.fs[0])
             self.dmgr.add_data(self.dmgr.ref_gps.name, rtn['gps'][:, 1:7])
-            self.dmgr.add_data(self.dmgr.gps_visibility.name, rtn['gps'][:, 7])
+            gps_visibility = rtn['gps'][:, 7]
+            if 'outages' in self.imu.gps_err:
+                gps_visibility = gps_visibility * gnss_error.outage_mask(
+                    self.dmgr.gps_time.data, self.imu.gps_err['outages'])
+            self.dmgr.add_data(self.dmgr.gps_visibility.name, gps_visibility)
         if self.imu.magnetometer:
+            self.dmgr.add_data(self.dmgr.mag_time.name, rtn['mag'][:, 0] / self.fs[0])
             self.dmgr.add_data(self.dmgr.ref_mag.name, rtn['mag'][:, 1:4])
-        # generate sensor data
+
+    def __gen_sensor_data(self):
+        '''
+        Generate sensor data of all simulation runs from the reference data.
+        '''
+        if self.workers > 1:
+            self.shared = self.dmgr.share_ref()
+        self.__set_sensor_gen()
+        sensor_names = self.sensor_gen.names
+        # Only the recipe is stored in lazy mode, each run is generated when used. Workers
+        # of a parallel simulation generate the data of their runs.
+        if self.lazy or self.workers > 1:
+            for data_name in sensor_names:
+                gen = functools.partial(self.sensor_gen.gen_run, data_name)
+                self.dmgr.add_data(data_name, LazyRuns(range(self.sim_count), gen))
+            return
+        # Sensor data of all runs are generated in blocks of runs. Blocks in the checkpoint are
+        # loaded, and the random state at the end of the block is restored.
+        runs = {}
+        if self.ckpt is not None:
+            runs, rng = self.ckpt.load_runs()
+            np.random.set_state(rng[-1])
+        block = pathgen.runs_per_block(self.dmgr.ref_accel.data.shape[0])
+        for first in range(0, self.sim_count, block):
+            idx = list(range(first, min(first+block, self.sim_count)))
+            if all(i in runs for i in idx):
+                for i in idx:
+                    for data_name in runs[i]:
+                        self.dmgr.add_data(data_name, runs[i][data_name], key=i)
+                np.random.set_state(rng[idx[-1]])
+                continue
+            sensor_data = {}
+            for data_name in sensor_names:
+                sensor_data[data_name] = self.sensor_gen.gen(data_name, idx)
+            # data of each run are contiguous views of the (runs, n, 3) arrays
+            for j in range(len(idx)):
+                run_data = {}
+                for data_name in sensor_data:
+                    run_data[data_name] = sensor_data[data_name][j]
+                    self.dmgr.add_data(data_name, run_data[data_name], key=idx[j])
+                if self.ckpt is not None:
+                    self.ckpt.save_run(idx[j], run_data)
+
+    def __sensor_config(self):
+        '''
+        Sensor error models that sensor data are generated from, checked by checkpoints.
+        '''
+        return {'accel_err': self.imu.accel_err,
+                'gyro_err': self.imu.gyro_err,
+                'gps_err': self.imu.gps_err if self.imu.gps else None,
+                'mag_err': self.imu.mag_err if self.imu.magnetometer else None,
+                'accel_err_dist': self.imu.accel_err_dist,
+                'gyro_err_dist': self.imu.gyro_err_dist,
+                'accel_stages': self.imu.accel_stages,
+                'gyro_stages': self.imu.gyro_stages}
+
+    def __set_sensor_gen(self):
+        '''
+        Create the generator of sensor data from the reference data.
+        '''
+        ref = {self.dmgr.ref_accel.name: self.dmgr.ref_accel.data,
+               self.dmgr.ref_gyro.name: self.dmgr.ref_gyro.data}
+        if self.imu.gps:
+            ref[self.dmgr.ref_gps.name] = self.dmgr.ref_gps.data
+            ref[self.dmgr.gps_time.name] = self.dmgr.gps_time.data
+        if self.imu.magnetometer:
+            ref[self.dmgr.ref_mag.name] = self.dmgr.ref_mag.data
         # environment-->vibraition params
         vib_def = self.__parse_env(self.env)
-        for i in range(self.sim_count):
-            accel = pathgen.acc_gen(self.fs[0], self.dmgr.ref_accel.data,
-                                    self.imu.accel_err, vib_def)
-            self.dmgr.add_data(self.dmgr.accel.name, accel, key=i)
-            gyro = pathgen.gyro_gen(self.fs[0], self.dmgr.ref_gyro.data,\
-                                    self.imu.gyro_err)
-            self.dmgr.add_data(self.dmgr.gyro.name, gyro, key=i)
-            if self.imu.gps:
-                gps = pathgen.gps_gen(self.dmgr.ref_gps.data, self.imu.gps_err,\
-                                                   self.ref_frame)
-                self.dmgr.add_data(self.dmgr.gps.name, gps, key=i)
-            if self.imu.magnetometer:
-                mag = pathgen.mag_gen(self.dmgr.ref_mag.data, self.imu.mag_err)
-                self.dmgr.add_data(self.dmgr.mag.name, mag, key=i)
+        self.sensor_gen = SensorGen(self.fs, self.imu, ref, self.ref_frame, vib_def,
+                                    self.seed, self.sampling)
+
+    def __end_point_error_stat(self, algo_output, idx):
+        '''
+        Statistics of end-point errors of algorithm outputs of some simulation runs.
+        Args:
+            algo_output: algorithm output returned by InsAlgoMgr.run_algo.
+            idx: a list of indices of the simulation runs.
+        Returns:
+            stat[algo_name][data_name] is {'max':, 'avg':, 'std':} of end-point errors of
+            data_name, one of self.interested_error, of all runs, and the effective sample
+            size 'ess'.
+        '''
+        stat = {}
+        for k in range(self.amgr.nalgo):
+            algo_name = self.amgr.get_algo_name(k)
+            stat[algo_name] = {}
+            for j in range(len(self.amgr.output)):
+                data_name = self.amgr.output[j]
+                if data_name not in self.interested_error:
+                    continue
+                angle = self.interested_error[data_name] == 'angle'
+                lla = 0
+                if data_name == self.dmgr.pos.name and self.ref_frame == 0:
+                    lla = 1
+                ref_data = self.dmgr.get_data_all('ref_' + data_name).data
+                err = []
+                for i in idx:
+                    key = algo_name + '_' + str(i)
+                    if key in algo_output[j]:
+                        x = algo_output[j][key]
+                        err.append(self.dmgr.array_error(x[-1:], ref_data[-1:], angle, lla)[0])
+                if len(err) > 0:
+                    err = np.array(err)
+                    stat[algo_name][data_name] = {'max': np.max(np.abs(err), 0),
+                                                  'avg': np.average(err, 0),
+                                                  'std': np.std(err, 0),
+                                                  'ess': self.dmgr.effective_sample_size(
+                                                      err, [str(i) for i in idx])}
+        return stat
 
     def __get_data_name_and_key(self, file_name):
         '''
@@ -521,26 +1028,7 @@ class Sim(object):
             ini_att: initial Euler angles, ZYX rotation sequence, units: rad
             motion_def: motion commands, units: rad, rad/s, m, m/s.
         '''
-        try:
-            ini_state = np.genfromtxt(self.data_src, delimiter=',', skip_header=1, max_rows=1)
-            waypoints = np.genfromtxt(self.data_src, delimiter=',', skip_header=3)
-        except:
-            raise ValueError('motion definition file must have nine columns \
-                              and at least four rows (two header rows + at least two data rows).')
-        ini_pos_n = ini_state[0:3]
-        ini_pos_n[0] = ini_pos_n[0] * attitude.D2R
-        ini_pos_n[1] = ini_pos_n[1] * attitude.D2R
-        ini_vel_b = ini_state[3:6]
-        ini_att = ini_state[6:9] * attitude.D2R
-        if waypoints.ndim == 1: # if waypoints is of size (n,), change it to (1,n)
-            waypoints = waypoints.reshape((1, len(waypoints)))
-        motion_def = waypoints[:, [0, 1, 2, 3, 4, 5, 6, 7, 8]]
-        # convert deg to rad
-        motion_def[:, 1:4] = motion_def[:, 1:4] * attitude.D2R
-        # replace nan with 0.0, doing this to be compatible with older version motion def files.
-        motion_def[np.isnan(motion_def)] = 0.0
-
-        return [np.hstack((ini_pos_n, ini_vel_b, ini_att)), motion_def]
+        return motion_plan.read_motion_def(self.data_src)
 
     def __parse_mode(self, mode):
         '''
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# Filename: lincov.py
+
+"""
+Linear covariance analysis of INS errors along a reference trajectory.
+Navigation errors are linearized along the reference attitude and specific force generated
+by path_gen, and their covariance is propagated once, driven by the same IMU error model as
+the sensor generators in pathgen. Results are the time-varying 1-sigma errors that a Monte
+Carlo simulation of free integration, or of a loosely-coupled INS if GPS is used, converges
+to, at the cost of one pass along the trajectory.
+The error states are
+    [pos (3), vel (3), att (3), accel drift (3), gyro drift (3), accel bias (3), gyro bias (3)]
+in the navigation frame. The Earth rotation rate, transport rate and gravity errors are
+ignored, which is exact for the virtual inertial frame (ref_frame=1) and a good
+approximation in the NED frame for short and slow trajectories. Vibration, scale factor
+errors and the deterministic parts of biases (mean errors, not covariance) are not modeled.
+Created on 2026-10-16
+@author: dongxiaoguang
+"""
+
+import math
+import numpy as np
+from ..attitude import attitude
+
+# global
+VERSION = '1.0'
+NX = 21                         # number of error states
+POS = slice(0, 3)
+VEL = slice(3, 6)
+ATT = slice(6, 9)
+ACC_GM = slice(9, 12)
+GYRO_GM = slice(12, 15)
+ACC_B = slice(15, 18)
+GYRO_B = slice(18, 21)
+
+def covariance(fs, ref_att, ref_accel, acc_err, gyro_err, acc_dist=None, gyro_dist=None,
+               ini_std=None, gps_idx=None, gps_err=None, step=1):
+    """
+    Propagate the covariance of navigation errors along the reference trajectory.
+    Args:
+        fs: IMU sample frequency, Hz.
+        ref_att: nx3 reference Euler angles [yaw, pitch, roll], ZYX, rad.
+        ref_accel: nx3 reference accel data in the body frame, m/s2.
+        acc_err: accelerometer error parameters, see pathgen.acc_gen. 'b_drift', 'b_corr'
+            and 'vrw' are used.
+        gyro_err: gyroscope error parameters, see pathgen.gyro_gen. 'b_drift', 'b_corr'
+            and 'arw' are used.
+        acc_dist: distributions of accel error parameters, see pathgen.draw_error_params.
+            'b' is the initial covariance of the accel bias, and 'vrw' adds to the mean
+            square noise density. None (default) if parameters are the same for all runs.
+        gyro_dist: distributions of gyro error parameters, see acc_dist.
+        ini_std: 9x1 1-sigma initial errors, [pos (m), vel (m/s), att (rad)] in the
+            navigation frame. None (default) for no initial error.
+        gps_idx: indices of the IMU samples with visible GPS measurements. Position and
+            velocity are updated by a Kalman filter at these samples. None (default) for
+            free integration.
+        gps_err: GPS error parameters, see gnss_error.gnss_gen_batch. 'stdp' and 'stdv'
+            are the measurement noise. Gauss-Markov errors, if any, are treated as white.
+        step: max number of IMU samples of each propagation step. Larger steps are faster
+            and less accurate on highly dynamic trajectories.
+    Returns:
+        a dict of 1-sigma errors:
+            'index': indices of the IMU samples where the errors are given.
+            'pos': position error in the navigation frame, m.
+            'vel': velocity error in the navigation frame, m/s.
+            'att': error of the Euler angles [yaw, pitch, roll], rad.
+    """
+    n = ref_att.shape[0]
+    step = max(int(step), 1)
+    acc_dist = {} if acc_dist is None else acc_dist
+    gyro_dist = {} if gyro_dist is None else gyro_dist
+    c_bn = attitude.euler2dcm_batch(ref_att).transpose((0, 2, 1))
+    f_n = np.einsum('kij,kj->ki', c_bn, ref_accel)
+    # noise densities and Gauss-Markov models, white drift adds to the noise density
+    acc_beta, acc_qc, acc_white = drift_model(acc_err, fs)
+    gyro_beta, gyro_qc, gyro_white = drift_model(gyro_err, fs)
+    acc_q = mean_square(acc_err, acc_dist, 'vrw') + acc_white
+    gyro_q = mean_square(gyro_err, gyro_dist, 'arw') + gyro_white
+    beta = np.hstack((acc_beta, gyro_beta))
+    gm_qc = np.hstack((acc_qc, gyro_qc))
+    gm = np.arange(ACC_GM.start, GYRO_GM.stop)
+    gm_on = beta > 0.0
+    # initial covariance
+    p = np.zeros((NX, NX))
+    if ini_std is not None:
+        p[0:9, 0:9] = np.diag(np.array(ini_std, dtype=float)**2)
+    p[ACC_B, ACC_B] = np.diag(dist_var(acc_dist.get('b')))
+    p[GYRO_B, GYRO_B] = np.diag(dist_var(gyro_dist.get('b')))
+    # GPS measurement model
+    gps = set()
+    if gps_idx is not None:
+        gps = set(int(i) for i in gps_idx)
+        h = np.zeros((6, NX))
+        h[0:6, 0:6] = np.eye(6)
+        r = np.diag(np.hstack((gps_noise(gps_err, 'stdp', 'stdp_gm'),
+                               gps_noise(gps_err, 'stdv', 'stdv_gm'))))
+    # propagate between output samples, GPS samples are always output samples
+    idx = np.union1d(np.arange(0, n, step), np.array(sorted(gps), dtype=int))
+    idx = np.union1d(idx[(idx >= 0) & (idx < n)], [n-1]).astype(int)
+    p_out = np.empty((idx.shape[0], 9, 9))
+    p_out[0] = p[0:9, 0:9]
+    f = np.zeros((NX, NX))
+    f[POS, VEL] = np.eye(3)
+    f[gm, gm] = -beta
+    eye = np.eye(NX)
+    for j in range(1, idx.shape[0]):
+        k = idx[j-1]
+        dt = (idx[j] - k) / fs
+        c = c_bn[k]
+        # error dynamics linearized at the start of the step
+        f[VEL, ATT] = attitude.get_cross_mtx(f_n[k])
+        f[VEL, ACC_GM] = c
+        f[VEL, ACC_B] = c
+        f[ATT, GYRO_GM] = -c
+        f[ATT, GYRO_B] = -c
+        fdt = f * dt
+        phi = eye + fdt + 0.5 * fdt.dot(fdt)
+        phi[gm, gm] = np.exp(-beta*dt)
+        qc = np.zeros((NX, NX))
+        qc[VEL, VEL] = (c * acc_q).dot(c.T)
+        qc[ATT, ATT] = (c * gyro_q).dot(c.T)
+        qc[gm, gm] = gm_qc
+        q = 0.5 * (phi.dot(qc).dot(phi.T) + qc) * dt
+        q[gm, gm] = 0.0
+        q[gm[gm_on], gm[gm_on]] = -gm_qc[gm_on] * np.expm1(-2.0*beta[gm_on]*dt) / \
+                                  (2.0*beta[gm_on])
+        p = phi.dot(p).dot(phi.T) + q
+        # Kalman filter update in Joseph form
+        if idx[j] in gps:
+            s = h.dot(p).dot(h.T) + r
+            kg = np.linalg.solve(s, h.dot(p)).T
+            ikh = eye - kg.dot(h)
+            p = ikh.dot(p).dot(ikh.T) + kg.dot(r).dot(kg.T)
+        p_out[j] = p[0:9, 0:9]
+    return {'index': idx,
+            'pos': np.sqrt(np.diagonal(p_out[:, POS, POS], axis1=1, axis2=2)),
+            'vel': np.sqrt(np.diagonal(p_out[:, VEL, VEL], axis1=1, axis2=2)),
+            'att': euler_std(p_out[:, ATT, ATT], ref_att[idx])}
+
+def drift_model(err, fs):
+    """
+    Continuous-time model of bias drift with the same statistics at each sample as
+    pathgen.bias_drift, that is x[k+1] = a*x[k] + drift/fs*w[k], a = 1-1/fs/corr_time.
+    Args:
+        err: sensor error parameters with 'b_drift' and 'b_corr'.
+        fs: sample frequency, Hz.
+    Returns:
+        beta: 3x1 inverse correlation time of the Gauss-Markov drift, 1/s.
+        qc: 3x1 density of the driving noise of the Gauss-Markov drift.
+        white: 3x1 noise density of drift with infinite correlation time, which is white.
+    """
+    drift = np.array(err.get('b_drift', 0.0), dtype=float) * np.ones(3)
+    corr = np.array(err.get('b_corr', math.inf), dtype=float) * np.ones(3)
+    beta = np.zeros(3)
+    qc = np.zeros(3)
+    white = np.zeros(3)
+    gm = ~np.isinf(corr)
+    a = 1.0 - 1.0/fs/corr[gm]
+    if (a <= 0.0).any():
+        raise ValueError('b_corr should be longer than the sample period, but it is %s.'%\
+                         corr)
+    beta[gm] = -fs * np.log(a)
+    qc[gm] = 2.0 * beta[gm] * (drift[gm]/fs)**2 / (1.0 - a**2)
+    white[~gm] = drift[~gm]**2 / fs
+    return beta, qc, white
+
+def mean_square(err, dist, key):
+    """
+    Mean square of the error parameter err[key] over its distribution dist[key].
+    """
+    mean = np.array(err.get(key, 0.0), dtype=float) * np.ones(3)
+    return mean**2 + dist_var(dist.get(key))
+
+def dist_var(dist):
+    """
+    3x1 variance of a distribution of error parameters, see pathgen.draw_error_params.
+    None for a constant parameter.
+    """
+    if dist is None:
+        return np.zeros(3)
+    if isinstance(dist, tuple) and dist[0] == 'uniform':
+        return np.array(dist[1], dtype=float)**2 / 3.0 * np.ones(3)
+    return np.array(dist, dtype=float)**2 * np.ones(3)
+
+def gps_noise(gps_err, key, gm_key):
+    """
+    3x1 variance of GPS measurement errors, white and Gauss-Markov.
+    """
+    var = np.array(gps_err[key], dtype=float)**2 * np.ones(3)
+    if gm_key in gps_err:
+        var += np.array(gps_err[gm_key], dtype=float)**2
+    return var
+
+def euler_std(p_att, euler):
+    """
+    1-sigma errors of Euler angles from the covariance of attitude errors.
+    The attitude error psi rotates the navigation frame, and relates to errors of the ZYX
+    Euler angles by psi = -M*[d_yaw, d_pitch, d_roll], where the columns of M are the
+    rotation axes of yaw, pitch and roll in the navigation frame.
+    Args:
+        p_att: (k, 3, 3) covariance of attitude errors in the navigation frame.
+        euler: (k, 3) Euler angles [yaw, pitch, roll], rad.
+    Returns:
+        (k, 3) 1-sigma errors of [yaw, pitch, roll], rad.
+    """
+    cy = np.cos(euler[:, 0])
+    sy = np.sin(euler[:, 0])
+    cp = np.cos(euler[:, 1])
+    sp = np.sin(euler[:, 1])
+    m = np.zeros(p_att.shape)
+    m[:, 2, 0] = 1.0
+    m[:, 0, 1] = -sy
+    m[:, 1, 1] = cy
+    m[:, 0, 2] = cy * cp
+    m[:, 1, 2] = sy * cp
+    m[:, 2, 2] = -sp
+    m_inv = np.linalg.inv(m)
+    p_euler = np.einsum('kij,kjl,kml->kim', m_inv, p_att, m_inv)
+    return np.sqrt(np.diagonal(p_euler, axis1=1, axis2=2))
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Filename: parallel.py
+
+"""
+Run algorithms of many simulation runs by a process pool.
+Work items are (algorithm, run) pairs. Each worker receives the algorithm manager, the
+inputs shared by all runs and the sensor data generator once, when it starts, and generates
+the sensor data of each run it is given from the per-run random streams (see
+rng_streams.py). Only algorithm outputs are sent back, and they are merged in the same
+order as InsAlgoMgr.run_algo, so results are the same as those of one process.
+Reference data in shared memory (see shared_data.py) are sent as descriptors, and each
+worker attaches to them instead of receiving its own copy.
+Created on 2026-10-16
+@author: dongxiaoguang
+"""
+
+import copy
+import multiprocessing
+from . import shared_data
+
+# global
+VERSION = '1.0'
+ITEMS_PER_WORKER = 4            # work items are sent to workers in about this many chunks
+# state of a worker process, set by init_worker
+_worker = {}
+
+def run_algo(amgr, input_data, sensor_gen, keys, workers, shared=None, algos=None):
+    '''
+    Run algorithms for each simulation run by a process pool. Each worker has its own copy
+    of the algorithms, so only algorithms whose results of a run do not depend on earlier
+    runs, e.g., algorithms declaring parallel_safe = True, should be run in this way.
+    Args:
+        amgr: InsAlgoMgr object.
+        input_data: algorithm input, see InsAlgoMgr.run_algo. Sensor data generated by
+            sensor_gen are not used and can be None.
+        sensor_gen: SensorGen object to generate sensor data of each run.
+        keys: indices of the simulation runs.
+        workers: number of worker processes.
+        shared: a dict of shared_data.SharedArray, keys are data names, see
+            InsDataMgr.share_ref. Algorithm input and reference data of sensor_gen with
+            these names are sent as the descriptors. None (default) to send all data.
+        algos: a list of indices of the algorithms to run. None (default) to run all
+            algorithms.
+    Returns:
+        the same as amgr.run_algo(input_data, keys, algos).
+    '''
+    if shared:
+        input_data = [shared.get(amgr.input[i], input_data[i]) for i in range(len(input_data))]
+        sensor_gen = copy.copy(sensor_gen)
+        sensor_gen.ref = dict((i, shared.get(i, sensor_gen.ref[i])) for i in sensor_gen.ref)
+    if algos is None:
+        algos = range(amgr.nalgo)
+    items = [(i, key) for i in algos for key in keys]
+    chunk = max(1, len(items) // (workers * ITEMS_PER_WORKER))
+    results = []
+    for i in range(amgr.nout):
+        results.append({})
+    with multiprocessing.Pool(workers, init_worker, (amgr, input_data, sensor_gen)) as pool:
+        # outputs come back in the order of items, algorithm by algorithm and run by run
+        for output in pool.imap(run_item, items, chunk):
+            for i in range(amgr.nout):
+                results[i].update(output[i])
+    return results
+
+def init_worker(amgr, input_data, sensor_gen):
+    '''
+    Keep data shared by all work items in the worker process. Descriptors of shared memory
+    are attached as read-only views.
+    '''
+    # descriptors are kept so that the memory stays mapped
+    _worker['shared'] = [i for i in input_data if isinstance(i, shared_data.SharedArray)]
+    _worker['shared'] += [i for i in sensor_gen.ref.values()\
+                          if isinstance(i, shared_data.SharedArray)]
+    sensor_gen.ref = dict((i, shared_data.attach(sensor_gen.ref[i])) for i in sensor_gen.ref)
+    _worker['amgr'] = amgr
+    _worker['input'] = [shared_data.attach(i) for i in input_data]
+    _worker['sensor_gen'] = sensor_gen
+
+def run_item(item):
+    '''
+    Run an algorithm for a simulation run in a worker process.
+    Args:
+        item: (index of the algorithm, index of the simulation run).
+    Returns:
+        outputs of the algorithm, see InsAlgoMgr.run_algo.
+    '''
+    algo, key = item
+    amgr = _worker['amgr']
+    sensor_gen = _worker['sensor_gen']
+    input_data = list(_worker['input'])
+    for j in amgr.input_alloc[algo]:
+        if amgr.input[j] in sensor_gen.names:
+            input_data[j] = {key: sensor_gen.gen_run(amgr.input[j], key)}
+    return amgr.run_algo(input_data, [key], [algo])
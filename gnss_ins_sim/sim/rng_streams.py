@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Filename: rng_streams.py
+
+"""
+Counter-based random streams of simulation runs.
+Each simulation run and each sensor of the run has its own numpy.random.Generator backed by
+the counter-based Philox bit generator. Streams are derived from a root seed by
+numpy.random.SeedSequence with spawn_key (run, sensor), so the random numbers of run k do
+not depend on how many runs are generated together, in which order, or by which worker.
+Created on 2026-10-16
+@author: dongxiaoguang
+"""
+
+import numpy as np
+
+# global
+VERSION = '1.0'
+# sensor streams of a simulation run. Values are the last element of the spawn_key and should
+# never be changed, or data generated with the same seed would change.
+STREAMS = {'accel': 0,
+           'gyro': 1,
+           'gps': 2,
+           'mag': 3,
+           'odo': 4}
+
+def stream(seed, run, name, unit=None):
+    '''
+    Random stream of a sensor of a simulation run.
+    Args:
+        seed: root seed of the simulation, a non-negative int or a sequence of them.
+        run: index of the simulation run.
+        name: name of the sensor, should be a key of STREAMS.
+        unit: index of the unit in a sensor array, see imu_array.py. None (default) for a
+            single sensor.
+    Returns:
+        a numpy.random.Generator.
+    '''
+    if name not in STREAMS:
+        raise ValueError('Unsupported random stream: %s.'% name)
+    spawn_key = (int(run), STREAMS[name])
+    if unit is not None:
+        spawn_key += (int(unit),)
+    seq = np.random.SeedSequence(seed, spawn_key=spawn_key)
+    return np.random.Generator(np.random.Philox(seq))
+
+def run_streams(seed, run):
+    '''
+    Random streams of all sensors of a simulation run.
+    Args:
+        seed: root seed of the simulation, see stream.
+        run: index of the simulation run.
+    Returns:
+        a dict. Keys are sensor names in STREAMS, and values are numpy.random.Generator.
+    '''
+    return {i: stream(seed, run, i) for i in STREAMS}
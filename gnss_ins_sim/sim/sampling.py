@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Filename: sampling.py
+
+"""
+Variance-reduced sampling of run-level random parameters, e.g., turn-on biases drawn by
+pathgen.draw_error_params and initial errors of algorithms.
+    'random': independent points, one stream per run.
+    'antithetic': runs 2k and 2k+1 are a pair, and the point of run 2k+1 is 1-u, where u is
+        the point of run 2k. Errors of the pair are negatively correlated.
+    'sobol': scrambled Sobol points. Runs are split into REPLICATES independently scrambled
+        sequences, run i is the (i//REPLICATES)-th point of the sequence i%REPLICATES, so
+        that the variance of the mean can be estimated from the replicates. This needs
+        scipy.
+Points of run k only depend on the seed, the method and k, so they do not depend on how runs
+are split into blocks. Runs in the same group (see groups) are not independent, and
+effective_sample_size gives the number of independent runs with the same precision of the
+mean.
+Created on 2026-10-16
+@author: dongxiaoguang
+"""
+
+import warnings
+import numpy as np
+try:
+    from scipy.stats import qmc
+except ImportError:
+    qmc = None
+from . import rng_streams
+from ..pathgen import pathgen
+
+# global
+VERSION = '1.0'
+METHODS = ('random', 'antithetic', 'sobol')
+REPLICATES = 8                  # independently scrambled Sobol sequences
+# spawn_key element of sampling streams, different from the sensor streams in rng_streams
+SAMPLING_KEY = len(rng_streams.STREAMS)
+
+def uniform_points(method, seed, runs, dim, key=0):
+    '''
+    Points uniformly distributed in (0, 1) of some simulation runs.
+    Args:
+        method: sampling method, one of METHODS.
+        seed: root seed of the simulation, see rng_streams.stream.
+        runs: a list of indices of the simulation runs.
+        dim: dimension of each point.
+        key: a non-negative int. Points with different keys are independent, e.g., one key
+            for each sensor and another for the initial errors.
+    Returns:
+        (len(runs), dim) points, the i-th row is the point of the run runs[i].
+    '''
+    if method not in METHODS:
+        raise ValueError('Unsupported sampling method: %s.'% method)
+    runs = [int(i) for i in runs]
+    u = np.empty((len(runs), dim))
+    if method == 'sobol':
+        if qmc is None:
+            raise ValueError('Sobol sampling needs scipy.')
+        for rep in range(REPLICATES):
+            rows = [j for j in range(len(runs)) if runs[j] % REPLICATES == rep]
+            if len(rows) == 0:
+                continue
+            idx = [runs[j] // REPLICATES for j in rows]
+            seq = np.random.SeedSequence(seed, spawn_key=(rep, SAMPLING_KEY, int(key), 1))
+            points = sobol_points(dim, np.random.Generator(np.random.Philox(seq)),
+                                  min(idx), max(idx) - min(idx) + 1)
+            u[rows] = points[np.array(idx) - min(idx)]
+        return u
+    for j in range(len(runs)):
+        run = runs[j]
+        if method == 'antithetic':
+            run = runs[j] - runs[j] % 2
+        seq = np.random.SeedSequence(seed, spawn_key=(run, SAMPLING_KEY, int(key)))
+        u[j] = np.random.Generator(np.random.Philox(seq)).random(dim)
+        if run != runs[j]:
+            u[j] = 1.0 - u[j]
+    return u
+
+def normal_points(method, seed, runs, dim, key=0):
+    '''
+    Standard normal points of some simulation runs, e.g., to draw initial errors of
+    algorithms. Arguments are the same as uniform_points.
+    Returns:
+        (len(runs), dim) points.
+    '''
+    return pathgen.norm_ppf(uniform_points(method, seed, runs, dim, key))
+
+def sobol_points(dim, rng, first, n):
+    '''
+    n points of a scrambled Sobol sequence, starting from the point first.
+    '''
+    try:
+        sobol = qmc.Sobol(dim, rng=rng)
+    except TypeError:       # scipy < 1.15
+        sobol = qmc.Sobol(dim, seed=rng)
+    if first > 0:
+        sobol.fast_forward(first)
+    with warnings.catch_warnings():
+        # balance properties need 2^m points, other sizes are still low-discrepancy
+        warnings.simplefilter('ignore', UserWarning)
+        return sobol.random(n)
+
+def groups(method, runs):
+    '''
+    Groups of simulation runs. Runs in different groups are independent.
+    Args:
+        method: sampling method, one of METHODS.
+        runs: a list of indices of the simulation runs.
+    Returns:
+        an int array, the group of each run.
+    '''
+    runs = np.array(runs, dtype=int)
+    if method == 'antithetic':
+        return runs // 2
+    if method == 'sobol':
+        return runs % REPLICATES
+    return runs
+
+def effective_sample_size(x, group):
+    '''
+    Effective sample size of the mean of x, that is the number of independent runs whose
+    mean has the same variance. The mean of each group is independent, and the variance of
+    the mean of x is estimated from the group means.
+    Args:
+        x: (n,) or (n, m) data of n simulation runs.
+        group: (n,) group of each run, see groups.
+    Returns:
+        effective sample size of each column of x. nan if there are less than 2 groups, and
+        inf if all group means are the same.
+    '''
+    x = np.asarray(x, dtype=float)
+    label, idx = np.unique(np.asarray(group), return_inverse=True)
+    k = label.shape[0]
+    if k < 2:
+        return np.full(x.shape[1:], np.nan)
+    count = np.bincount(idx, minlength=k).astype(float)
+    means = np.zeros((k,) + x.shape[1:])
+    np.add.at(means, idx, x)
+    means /= count.reshape((-1,) + (1,)*(x.ndim-1))
+    var_mean = np.var(means, axis=0, ddof=1) / k
+    var = np.var(x, axis=0, ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(var_mean > 0.0, var / var_mean, np.inf)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# Filename: sensor_gen.py
+
+"""
+Sensor data of simulation runs generated from the reference data.
+A SensorGen holds everything needed to generate the sensor data of any simulation run: the
+reference data, the IMU error model, the vibration model and the seed. It is small and can be
+pickled, so that data of a run can be generated on demand, e.g., by LazyRuns, or by worker
+processes of a parallel simulation.
+Created on 2026-10-16
+@author: dongxiaoguang
+"""
+
+from ..pathgen import pathgen
+from ..pathgen import gnss_error
+from . import rng_streams
+from . import sampling
+
+# global
+VERSION = '1.0'
+
+class SensorGen(object):
+    '''
+    Generate sensor data of simulation runs from the reference data.
+    '''
+    def __init__(self, fs, imu, ref, ref_frame=0, vib_def=None, seed=None,
+                 sampling_method='random'):
+        '''
+        Args:
+            fs: [fs_imu, fs_gps, fs_mag], Hz.
+            imu: IMU object, see imu_model.py.
+            ref: a dict of reference data. 'ref_accel' and 'ref_gyro' are needed, and
+                'ref_gps' and 'gps_time' if the IMU has GPS, and 'ref_mag' if the IMU has a
+                magnetometer.
+            ref_frame: reference frame, see Sim.
+            vib_def: vibration model, see pathgen.acc_gen.
+            seed: root seed of sensor errors, see Sim. None to use the global random state
+                of numpy.random.
+            sampling_method: how error parameters of each run are sampled, see Sim.
+        '''
+        self.fs = fs
+        self.imu = imu
+        self.ref = ref
+        self.ref_frame = ref_frame
+        self.vib_def = vib_def
+        self.seed = seed
+        self.sampling = sampling_method
+        # names of sensor data
+        self.names = ['accel', 'gyro']
+        if self.imu.gps:
+            self.names.append('gps')
+        if self.imu.magnetometer:
+            self.names.append('mag')
+
+    def gen(self, data_name, idx, components=None):
+        '''
+        Generate sensor data of some simulation runs.
+        Args:
+            data_name: name of the sensor data, 'accel', 'gyro', 'gps' or 'mag'.
+            idx: a list of indices of the simulation runs.
+            components: an empty dict to keep the errors separately, see
+                pathgen.acc_gen_batch. None (default) to keep no component.
+        Returns:
+            an array of size (len(idx), n, m), data of the i-th run is the view [i].
+        '''
+        rng = None
+        if self.seed is not None:
+            rng = [rng_streams.stream(self.seed, i, data_name) for i in idx]
+        if data_name == 'accel':
+            return pathgen.acc_gen_batch(self.fs[0], self.ref['ref_accel'],
+                                         self.imu.accel_err, len(idx), self.vib_def, rng=rng,
+                                         stages=self.imu.accel_stages,
+                                         err_dist=self.imu.accel_err_dist,
+                                         components=components,
+                                         err_points=self.__err_points(data_name, idx,
+                                                                      self.imu.accel_err_dist))
+        elif data_name == 'gyro':
+            return pathgen.gyro_gen_batch(self.fs[0], self.ref['ref_gyro'],
+                                          self.imu.gyro_err, len(idx), rng=rng,
+                                          stages=self.imu.gyro_stages,
+                                          err_dist=self.imu.gyro_err_dist,
+                                          components=components,
+                                          err_points=self.__err_points(data_name, idx,
+                                                                       self.imu.gyro_err_dist))
+        elif data_name == 'gps':
+            gps_time = self.ref['gps_time']
+            dt = 1.0 / self.fs[1]
+            if gps_time.shape[0] > 1:
+                dt = gps_time[1] - gps_time[0]
+            return gnss_error.gnss_gen_batch(self.ref['ref_gps'], self.imu.gps_err,
+                                             len(idx), dt, self.ref_frame, rng=rng,
+                                             components=components)
+        elif data_name == 'mag':
+            return pathgen.mag_gen_batch(self.ref['ref_mag'], self.imu.mag_err, len(idx),
+                                         rng=rng, components=components)
+        else:
+            raise ValueError('Unsupported sensor data: %s.'% data_name)
+
+    def gen_run(self, data_name, run):
+        '''
+        Generate sensor data of a simulation run. This is the generator of LazyRuns.
+        Returns:
+            an array of size (n, m).
+        '''
+        return self.gen(data_name, [run])[0]
+
+    def __err_points(self, data_name, idx, err_dist):
+        '''
+        Points to draw error parameters of some simulation runs from err_dist, see
+        pathgen.draw_error_params. None if parameters are drawn from the random streams of
+        the sensor, that is the 'random' sampling.
+        '''
+        if self.sampling == 'random' or not err_dist:
+            return None
+        return sampling.uniform_points(self.sampling, self.seed, idx, 3*len(err_dist),
+                                       rng_streams.STREAMS[data_name])
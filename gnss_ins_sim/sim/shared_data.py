@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# Filename: shared_data.py
+
+"""
+Arrays in shared memory, used by worker processes of a parallel simulation without copying.
+share(x) copies an array to a new segment, a multiprocessing.shared_memory block or a file
+mapped by mmap, and returns a SharedArray. A SharedArray is a lightweight descriptor of the
+segment: only its name, shape and dtype are pickled, and attach() maps the segment as a
+read-only numpy view in any process. The process that creates the segment owns it and
+should remove it by release() when it is no longer used.
+Created on 2026-10-16
+@author: dongxiaoguang
+"""
+
+import os
+import tempfile
+import numpy as np
+try:
+    from multiprocessing import shared_memory
+except ImportError:     # python < 3.8
+    shared_memory = None
+
+# global
+VERSION = '1.0'
+
+class SharedArray(object):
+    '''
+    Descriptor of an array in a shared memory segment.
+    '''
+    def __init__(self, name, shape, dtype, path=None, owner=False):
+        '''
+        Args:
+            name: name of the shared memory block, None if the segment is a file.
+            shape: shape of the array.
+            dtype: dtype of the array.
+            path: path of the file if the segment is a file, None if it is a shared memory
+                block.
+            owner: True if the segment is removed by release() of this object.
+        '''
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        self.owner = owner
+        # segment and view mapped in this process
+        self.__shm = None
+        self.__view = None
+
+    def attach(self):
+        '''
+        Map the segment in this process. The segment is mapped once and the same view is
+        returned each time.
+        Returns:
+            a read-only numpy array of the segment.
+        '''
+        if self.__view is None:
+            if self.path is not None:
+                if int(np.prod(self.shape)) == 0:
+                    self.__view = np.empty(self.shape, self.dtype)
+                    self.__view.flags.writeable = False
+                else:
+                    self.__view = np.memmap(self.path, self.dtype, 'r', shape=self.shape)
+            else:
+                self.__shm = shared_memory.SharedMemory(self.name)
+                self.__view = np.ndarray(self.shape, self.dtype, buffer=self.__shm.buf)
+                self.__view.flags.writeable = False
+        return self.__view
+
+    def release(self):
+        '''
+        Unmap the segment in this process, and remove it if this object owns it. Views
+        returned by attach() should not be used any more.
+        '''
+        self.__view = None
+        if self.__shm is not None:
+            try:
+                self.__shm.close()
+            except BufferError:
+                # views kept elsewhere, the block is unmapped when they are freed
+                pass
+            if self.owner:
+                self.__shm.unlink()
+            self.__shm = None
+        elif self.path is not None and self.owner and os.path.isfile(self.path):
+            os.remove(self.path)
+        self.owner = False
+
+    def __getstate__(self):
+        # only the descriptor is pickled, and the copy does not own the segment
+        return {'name': self.name, 'shape': self.shape, 'dtype': self.dtype.str,
+                'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['name'], state['shape'], state['dtype'], state['path'])
+
+def share(x, mmap_dir=None):
+    '''
+    Copy an array to a new shared memory segment.
+    Args:
+        x: a numpy array.
+        mmap_dir: directory of the file of the segment. None (default) to use a
+            multiprocessing.shared_memory block, or a file in the temporary directory if
+            shared_memory is not available.
+    Returns:
+        a SharedArray that owns the segment. The segment is mapped by attach().
+    '''
+    x = np.ascontiguousarray(x)
+    if mmap_dir is None and shared_memory is not None:
+        shm = shared_memory.SharedMemory(create=True, size=max(x.nbytes, 1))
+        np.ndarray(x.shape, x.dtype, buffer=shm.buf)[...] = x
+        seg = SharedArray(shm.name, x.shape, x.dtype, owner=True)
+        shm.close()
+        return seg
+    fd, path = tempfile.mkstemp(suffix='.dat', prefix='gnss_ins_sim_', dir=mmap_dir)
+    os.close(fd)
+    if x.nbytes > 0:
+        # np.memmap cannot map an empty file
+        data = np.memmap(path, x.dtype, 'w+', shape=x.shape)
+        data[...] = x
+        data.flush()
+        del data
+    return SharedArray(None, x.shape, x.dtype, path, owner=True)
+
+def release(segments):
+    '''
+    Release a list of SharedArray. SharedArray already released are skipped.
+    '''
+    for i in segments:
+        i.release()
+
+def attach(x):
+    '''
+    Get the data of x in this process.
+    Returns:
+        the read-only view of x if x is a SharedArray, or x itself.
+    '''
+    if isinstance(x, SharedArray):
+        return x.attach()
+    return x
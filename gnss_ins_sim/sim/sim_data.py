@@ -118,6 +118,40 @@ class Sim_data(object):
                 self.data = {}
             self.data[key] = data
 
+    def append_data(self, data, key=None, units=None):
+        '''
+        Append a chunk of data to Sim_data along the first axis. This is used to collect data
+        that are generated chunk by chunk. If there is no data yet, this is the same as add_data.
+        Args:
+            data: a numpy array of size(m, dim) or a dict of numpy arrays.
+            key: See doc of add_data.
+            units: See doc of add_data.
+        '''
+        # units convertion is done in add_data if there is no data yet
+        if key is None:
+            old = self.data
+        else:
+            old = self.data.get(key) if isinstance(self.data, dict) else None
+        if old is None or (isinstance(old, dict) and len(old) == 0):
+            self.add_data(data, key, units)
+            return
+        if units is not None:
+            units = list(units)
+            if len(units) != len(self.units):
+                raise ValueError('Units are of different lengths.')
+            if units != self.units:
+                data = convert_unit(data, units, self.units)
+        if isinstance(data, dict):
+            for i in data:
+                old[i] = np.concatenate((old[i], data[i]), axis=0)
+            data = old
+        else:
+            data = np.concatenate((old, data), axis=0)
+        if key is None:
+            self.data = data
+        else:
+            self.data[key] = data
+
     def save_to_file(self, data_dir):
         '''
         Save self.data to files.
@@ -275,6 +309,49 @@ class Sim_data(object):
                             legend=self.legend,\
                             mpl_opt=mpl_opt)
 
+class LazyRuns(dict):
+    '''
+    A dict of data of simulation runs that are generated on demand. Only the keys and a
+    generator are stored. Data of a run are generated each time they are accessed, and
+    released when they are no longer used, so the memory does not grow with the number of
+    runs. The generator should return the same data for the same key, e.g., by drawing random
+    numbers from a stream seeded by the key (see rng_streams.py).
+    Data set by d[key] = value are stored and returned instead of being generated.
+    '''
+    def __init__(self, keys, gen):
+        '''
+        Args:
+            keys: keys of the simulation runs.
+            gen: a function, gen(key) returns the data of the simulation run key.
+        '''
+        dict.__init__(self, dict.fromkeys(keys))
+        self.gen = gen
+
+    def __getitem__(self, key):
+        data = dict.__getitem__(self, key)
+        if data is None:
+            data = self.gen(key)
+        return data
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        for key in self:
+            yield self[key]
+
+    def items(self):
+        for key in self:
+            yield key, self[key]
+
+    def __reduce__(self):
+        # copy and pickle keep the data lazy, only data set by d[key] = value are copied
+        stored = [(i, dict.__getitem__(self, i)) for i in self]
+        stored = [i for i in stored if i[1] is not None]
+        return (self.__class__, (list(self.keys()), self.gen), None, None, iter(stored))
+
 def convert_unit(data, src_unit, dst_unit):
     '''
     Unit conversion. Notice not to change values in data